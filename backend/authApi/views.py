@@ -12,6 +12,7 @@ from .serializers import (
     FaceVerificationSerializer, UserProfileUpdateSerializer
 )
 from .utils import get_client_ip, generate_and_save_otp, send_device_change_notification
+from walletApi.risk import observe_change
 import logging
 
 logger = logging.getLogger(__name__)
@@ -238,12 +239,13 @@ class DeviceChangeVerifyView(APIView):
 
                 # Log device change
                 ip_address = get_client_ip(request)
-                DeviceChangeLog.objects.create(
+                change = DeviceChangeLog.objects.create(
                     user=user,
                     old_device_id=old_device_id,
                     new_device_id=new_device_id,
                     ip_address=ip_address
                 )
+                transaction.on_commit(lambda: observe_change(user.id, 'device_changed', change.changed_at), robust=True)
 
                 # Update device
                 device.device_id = new_device_id
@@ -303,11 +305,12 @@ class AccountNumberChangeView(APIView):
             old_account_number = user.account_number
 
             # Log account number change
-            AccountNumberChangeLog.objects.create(
+            change = AccountNumberChangeLog.objects.create(
                 user=user,
                 old_account_number=old_account_number,
                 new_account_number=new_account_number
             )
+            transaction.on_commit(lambda: observe_change(user.id, 'account_changed', change.changed_at), robust=True)
 
             # Update account number
             user.account_number = new_account_number
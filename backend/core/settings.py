@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'walletApi.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,6 +91,20 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared counters (token metering) need a cache every worker sees in
+# production, e.g. django.core.cache.backends.redis.RedisCache. It is
+# wrapped to count hits and misses for /metrics/.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'walletApi.cache_backends.InstrumentedCache',
+        'CACHE_BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='swift-wallet'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -195,7 +210,106 @@ REST_FRAMEWORK = {
 # OpenAI API Configuration
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 OPENAI_MODEL = config('OPENAI_MODEL', default='gpt-4')
+OPENAI_FAST_MODEL = config('OPENAI_FAST_MODEL', default='gpt-4o-mini')
 OPENAI_MAX_TOKENS = config('OPENAI_MAX_TOKENS', default=500, cast=int)
+OPENAI_MAX_CONCURRENCY = config('OPENAI_MAX_CONCURRENCY', default=100, cast=int)
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='')
+OPENAI_TIMEOUT = config('OPENAI_TIMEOUT', default=20.0, cast=float)
+OPENAI_CONNECT_TIMEOUT = config('OPENAI_CONNECT_TIMEOUT', default=5.0, cast=float)
+OPENAI_MAX_RETRIES = config('OPENAI_MAX_RETRIES', default=1, cast=int)
+OPENAI_BULKHEAD_TIMEOUT = config('OPENAI_BULKHEAD_TIMEOUT', default=2.0, cast=float)
+OPENAI_BREAKER_ERROR_RATE = config('OPENAI_BREAKER_ERROR_RATE', default=0.5, cast=float)
+OPENAI_BREAKER_MIN_CALLS = config('OPENAI_BREAKER_MIN_CALLS', default=10, cast=int)
+OPENAI_BREAKER_WINDOW_SECONDS = config('OPENAI_BREAKER_WINDOW_SECONDS', default=60, cast=int)
+OPENAI_BREAKER_RESET_SECONDS = config('OPENAI_BREAKER_RESET_SECONDS', default=30, cast=int)
+
+# FAQ answer cache in front of the LLM
+AI_ANSWER_CACHE_ENABLED = config('AI_ANSWER_CACHE_ENABLED', default=True, cast=bool)
+AI_ANSWER_CACHE_MAX_ENTRIES = config('AI_ANSWER_CACHE_MAX_ENTRIES', default=500, cast=int)
+AI_ANSWER_CACHE_TTL = config('AI_ANSWER_CACHE_TTL', default=3600, cast=int)
+AI_ANSWER_CACHE_MIN_SIMILARITY = config('AI_ANSWER_CACHE_MIN_SIMILARITY', default=0.8, cast=float)
+
+# Chat history sent with each AI turn
+AI_HISTORY_TOKEN_BUDGET = config('AI_HISTORY_TOKEN_BUDGET', default=1500, cast=int)
+AI_HISTORY_MAX_MESSAGES = config('AI_HISTORY_MAX_MESSAGES', default=50, cast=int)
+AI_SUMMARY_TOKEN_BUDGET = config('AI_SUMMARY_TOKEN_BUDGET', default=300, cast=int)
+
+# Daily AI token budgets (0 disables a budget). Over the soft budget only
+# questions the built-in answers cannot handle reach the model; over the
+# hard budget every reply is a built-in answer.
+AI_USER_DAILY_SOFT_TOKENS = config('AI_USER_DAILY_SOFT_TOKENS', default=20000, cast=int)
+AI_USER_DAILY_HARD_TOKENS = config('AI_USER_DAILY_HARD_TOKENS', default=50000, cast=int)
+AI_GLOBAL_DAILY_HARD_TOKENS = config('AI_GLOBAL_DAILY_HARD_TOKENS', default=0, cast=int)
+
+# Chat model routing: built-in replies, then OPENAI_FAST_MODEL, then OPENAI_MODEL
+AI_ROUTING_ENABLED = config('AI_ROUTING_ENABLED', default=True, cast=bool)
+AI_ROUTER_LOCAL_MAX_WORDS = config('AI_ROUTER_LOCAL_MAX_WORDS', default=8, cast=int)
+AI_ROUTER_FAST_MAX_WORDS = config('AI_ROUTER_FAST_MAX_WORDS', default=40, cast=int)
+AI_ROUTER_LARGE_AFTER_MESSAGES = config('AI_ROUTER_LARGE_AFTER_MESSAGES', default=6, cast=int)
+
+# Human escalation queue. A ticket's answer-by time is between the min and
+# max wait after it is queued, sooner for unhappy users and larger wallets.
+ESCALATION_MAX_WAIT_SECONDS = config('ESCALATION_MAX_WAIT_SECONDS', default=1800, cast=int)
+ESCALATION_MIN_WAIT_SECONDS = config('ESCALATION_MIN_WAIT_SECONDS', default=300, cast=int)
+# Wallet balance that counts as full value for priority
+ESCALATION_HIGH_VALUE_BALANCE = config('ESCALATION_HIGH_VALUE_BALANCE', default=100000, cast=float)
+
+# Analytics API: longest period a request may cover, and longest one that
+# also lists each day
+ANALYTICS_MAX_DAYS = config('ANALYTICS_MAX_DAYS', default=3660, cast=int)
+ANALYTICS_DAILY_DATA_MAX_DAYS = config('ANALYTICS_DAILY_DATA_MAX_DAYS', default=31, cast=int)
+
+# Time series API: most points returned per series, and longest range at hour resolution
+TIMESERIES_MAX_POINTS = config('TIMESERIES_MAX_POINTS', default=500, cast=int)
+TIMESERIES_MAX_HOUR_DAYS = config('TIMESERIES_MAX_HOUR_DAYS', default=31, cast=int)
+
+# Platform counters for the ops dashboard: rows per bucket that writes are
+# spread over, and how long minute and hour buckets are kept
+PLATFORM_COUNTER_SHARDS = config('PLATFORM_COUNTER_SHARDS', default=16, cast=int)
+PLATFORM_COUNTER_MINUTE_RETENTION_HOURS = config('PLATFORM_COUNTER_MINUTE_RETENTION_HOURS', default=48, cast=int)
+PLATFORM_COUNTER_HOUR_RETENTION_DAYS = config('PLATFORM_COUNTER_HOUR_RETENTION_DAYS', default=92, cast=int)
+
+# Inline transfer risk scoring: scores from 0 to 100 at or above the hold
+# score need the transaction PIN, at or above the block score are refused
+RISK_SCORING_ENABLED = config('RISK_SCORING_ENABLED', default=True, cast=bool)
+RISK_HOLD_SCORE = config('RISK_HOLD_SCORE', default=50, cast=int)
+RISK_BLOCK_SCORE = config('RISK_BLOCK_SCORE', default=80, cast=int)
+# Transfers in this window count towards velocity; the limit scores in full
+RISK_VELOCITY_WINDOW_SECONDS = config('RISK_VELOCITY_WINDOW_SECONDS', default=3600, cast=int)
+RISK_VELOCITY_LIMIT = config('RISK_VELOCITY_LIMIT', default=10, cast=int)
+# Device and account number changes count as recent for this long
+RISK_RECENT_CHANGE_HOURS = config('RISK_RECENT_CHANGE_HOURS', default=24, cast=int)
+
+# Transfer sub-category classifier, used on new transfers and by the
+# label_transactions command. Labels below the minimum confidence fall
+# back to 'other'.
+CATEGORIZER_MODEL_PATH = config('CATEGORIZER_MODEL_PATH', default=str(BASE_DIR / 'models' / 'categorizer.npz'))
+CATEGORIZER_MIN_CONFIDENCE = config('CATEGORIZER_MIN_CONFIDENCE', default=0.6, cast=float)
+# Seconds between checks for a retrained model file
+CATEGORIZER_RELOAD_CHECK_SECONDS = config('CATEGORIZER_RELOAD_CHECK_SECONDS', default=30, cast=int)
+
+# Spending insights look back this many days
+INSIGHTS_HISTORY_DAYS = config('INSIGHTS_HISTORY_DAYS', default=730, cast=int)
+
+# Columnar transaction snapshot (export_transactions command)
+TRANSACTION_SNAPSHOT_DIR = config('TRANSACTION_SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots' / 'transactions'))
+# Ids missing from an export are looked for again for this long, in case their
+# transaction was still uncommitted; after that they are taken as rolled back.
+TRANSACTION_SNAPSHOT_GAP_SECONDS = config('TRANSACTION_SNAPSHOT_GAP_SECONDS', default=3600, cast=int)
+
+# Prometheus metrics at /metrics/. With several worker processes, point
+# METRICS_MULTIPROCESS_DIR at a directory they share (cleared on deploy);
+# each process writes its values there at most every METRICS_FLUSH_SECONDS.
+# Scrapers can send METRICS_TOKEN as a bearer token instead of a staff login.
+METRICS_MULTIPROCESS_DIR = config('METRICS_MULTIPROCESS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=1.0, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Real-time wallet events (SSE and WebSocket)
+REALTIME_BACKEND = config('REALTIME_BACKEND', default='walletApi.realtime.InProcessBackend')
+REALTIME_REDIS_URL = config('REALTIME_REDIS_URL', default='redis://localhost:6379/0')
+REALTIME_HEARTBEAT_SECONDS = config('REALTIME_HEARTBEAT_SECONDS', default=25, cast=int)
+REALTIME_QUEUE_SIZE = config('REALTIME_QUEUE_SIZE', default=100, cast=int)
 
 # Paystack API Configuration
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='')
@@ -19,11 +19,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from walletApi.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('authApi.urls')),
     path('api/wallet/', include('walletApi.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
     # API Documentation
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     Wallet, Transaction, TransactionPin, BeneficiaryContact,
-    TransactionAnalytics, CustomerServiceChat, ChatMessage
+    TransactionAnalytics, TransactionAnalyticsRollup, CustomerServiceChat, ChatMessage,
+    TokenUsageDaily, EscalationTicket, SpendingInsight, PlatformCounter
 )
 
 
@@ -44,21 +45,60 @@ class TransactionAnalyticsAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
 
 
+@admin.register(TransactionAnalyticsRollup)
+class TransactionAnalyticsRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period', 'period_start', 'total_transactions', 'total_credits', 'total_debits']
+    list_filter = ['period', 'period_start']
+    search_fields = ['user__phone_number']
+
+
+@admin.register(SpendingInsight)
+class SpendingInsightAdmin(admin.ModelAdmin):
+    list_display = ['user', 'transactions', 'wallet_version', 'computed_at']
+    search_fields = ['user__phone_number']
+    readonly_fields = ['user', 'wallet_version', 'transactions', 'data', 'computed_at']
+
+
+@admin.register(PlatformCounter)
+class PlatformCounterAdmin(admin.ModelAdmin):
+    list_display = ['period', 'bucket_start', 'shard', 'transactions', 'credit_volume', 'debit_volume', 'failed', 'active_wallets']
+    list_filter = ['period']
+    readonly_fields = [field.name for field in PlatformCounter._meta.fields]
+
+
 @admin.register(CustomerServiceChat)
 class CustomerServiceChatAdmin(admin.ModelAdmin):
     list_display = ['session_id', 'user', 'status', 'issue_category', 'total_messages', 'started_at']
     list_filter = ['status', 'resolved_by_ai', 'started_at']
     search_fields = ['session_id', 'user__phone_number', 'issue_category']
-    readonly_fields = ['session_id', 'started_at', 'ended_at']
+    readonly_fields = ['session_id', 'started_at', 'ended_at', 'summary', 'summarized_through']
 
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ['chat', 'message_type', 'content_preview', 'created_at']
-    list_filter = ['message_type', 'created_at']
+    list_display = ['chat', 'message_type', 'content_preview', 'route_tier', 'prompt_tokens', 'cached_tokens', 'response_time_ms', 'first_token_ms', 'created_at']
+    list_filter = ['message_type', 'route_tier', 'prompt_version', 'created_at']
     search_fields = ['chat__session_id', 'content']
     readonly_fields = ['created_at']
 
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content'
+
+
+@admin.register(TokenUsageDaily)
+class TokenUsageDailyAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'tokens_used', 'requests', 'updated_at']
+    list_filter = ['date']
+    search_fields = ['user__phone_number', 'user__account_number']
+    date_hierarchy = 'date'
+    readonly_fields = ['user', 'date', 'tokens_used', 'requests', 'updated_at']
+
+
+@admin.register(EscalationTicket)
+class EscalationTicketAdmin(admin.ModelAdmin):
+    list_display = ['chat', 'user', 'status', 'priority', 'enqueued_at', 'due_at', 'claimed_by', 'resolved_at']
+    list_filter = ['status', 'enqueued_at']
+    search_fields = ['chat__session_id', 'user__phone_number']
+    readonly_fields = ['chat', 'user', 'priority', 'enqueued_at', 'due_at', 'claimed_at', 'resolved_at']
+    list_select_related = ['chat', 'user', 'claimed_by']
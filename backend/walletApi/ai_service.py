@@ -1,268 +1,505 @@
 import uuid
 import time
+import asyncio
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
+from .answer_cache import get_answer_cache, mentions_user
+from .chat_context import build_history, count_tokens
+from .escalations import enqueue_escalation
+from .intents import classify
+from .llm import LLMUnavailable, get_llm_manager
+from .metering import BUDGET_HARD, BUDGET_OK, budget_downgrades, get_token_budget, record_token_usage
 from .models import CustomerServiceChat, ChatMessage
+from .prompts import PROMPT_VERSION, build_system_messages, record_prompt_usage
+from .routing import TIER_LOCAL, route_chat_turn, route_latency
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def get_openai_client():
-    """Get OpenAI client instance"""
+def generate_session_id():
+    """Generate unique session ID for chat"""
+    return f"CS-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+
+
+def start_chat_turn(user, user_message, chat_session=None):
+    """
+    Create the session if needed and build the prompt.
+
+    The user message is not written here; finish_chat_turn or
+    fail_chat_turn saves it together with the reply.
+    """
+    if not chat_session:
+        intent = classify(user_message)
+        session_id = generate_session_id()
+        chat_session = CustomerServiceChat.objects.create(
+            user=user,
+            session_id=session_id,
+            ai_model_used=settings.OPENAI_MODEL,
+            issue_category=intent.category,
+            sentiment_score=intent.sentiment
+        )
+
+    # Static prefix and user context, then the rolling summary and the
+    # latest turns within the token budget
+    messages = build_system_messages(user)
+    messages.extend(build_history(chat_session, user_message))
+
+    return chat_session, messages
+
+
+def save_chat_turn(chat_session, user_message, reply, **session_updates):
+    """
+    Write a completed turn as one unit: both messages in a single INSERT and
+    the session counters and status in a single UPDATE.
+    """
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=chat_session, message_type='user', content=user_message),
+            reply,
+        ])
+        CustomerServiceChat.objects.filter(pk=chat_session.pk).update(
+            total_messages=F('total_messages') + 2,  # user + ai
+            **session_updates
+        )
+
+    # Keep the caller's instance in step with the row
+    chat_session.total_messages += 2
+    for field, value in session_updates.items():
+        setattr(chat_session, field, value)
+
+
+def finish_chat_turn(chat_session, user_message, ai_message, tokens_used, response_time,
+                     first_token_ms=None, prompt_tokens=None, cached_tokens=None, route_tier=''):
+    """Save the turn, update the session and build the API result"""
+    reply = ChatMessage(
+        chat=chat_session,
+        message_type='ai',
+        content=ai_message,
+        tokens_used=tokens_used,
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_tokens,
+        prompt_version=PROMPT_VERSION if prompt_tokens is not None else '',
+        response_time_ms=response_time,
+        first_token_ms=first_token_ms,
+        route_tier=route_tier
+    )
+
+    intent = classify(user_message)
+    session_updates = {}
+    was_escalated = chat_session.status == 'escalated'
+
+    # Detect if issue is resolved
+    if intent.resolved:
+        session_updates.update(status='resolved', resolved_by_ai=True, ended_at=timezone.now())
+
+    # Detect if escalation needed
+    if intent.escalation:
+        session_updates['status'] = 'escalated'
+
+    save_chat_turn(chat_session, user_message, reply, **session_updates)
+
+    if intent.escalation and not was_escalated:
+        enqueue_escalation(chat_session, intent.sentiment)
+
+    if route_tier and response_time is not None:
+        route_latency.observe(response_time / 1000, tier=route_tier)
+
+    if tokens_used:
+        record_token_usage(chat_session.user_id, tokens_used)
+
+    logger.info(f"AI response generated for session {chat_session.session_id}: {tokens_used} tokens ({prompt_tokens} prompt, {cached_tokens} cached), {response_time}ms")
+
+    result = {
+        'session_id': chat_session.session_id,
+        'message': ai_message,
+        'status': chat_session.status,
+        'tokens_used': tokens_used,
+        'response_time_ms': response_time
+    }
+    if first_token_ms is not None:
+        result['first_token_ms'] = first_token_ms
+    if route_tier:
+        result['tier'] = route_tier
+    return result
+
+
+def fail_chat_turn(chat_session, user_message, error):
+    """Record a failed turn and build the fallback result"""
+    logger.error(f"Error generating AI response: {str(error)}")
+
+    # Save error and return fallback
+    error_message = "I apologize, but I'm experiencing technical difficulties. Please try again or contact human support."
+
+    if chat_session:
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=chat_session, message_type='user', content=user_message),
+            ChatMessage(chat=chat_session, message_type='system', content=f"Error: {str(error)}"),
+        ])
+
+    return {
+        'session_id': chat_session.session_id if chat_session else None,
+        'message': error_message,
+        'status': 'active',
+        'error': str(error)
+    }
+
+
+def fallback_chat_turn(chat_session, user_message, reason):
+    """Answer from the mock rules when the provider is unavailable, keeping the session"""
+    logger.warning(f"Falling back to mock response: {str(reason)}")
+
+    result = finish_chat_turn(chat_session, user_message, get_mock_reply(user_message), None, None)
+    result['mock'] = True
+    return result
+
+
+def interrupted_chat_turn(chat_session, user_message, messages, partial_message, response_time,
+                          first_token_ms, route_tier):
+    """
+    Save and meter a streamed turn the client abandoned.
+
+    The usage chunk only comes at the end of the stream, so tokens are
+    estimated from the prompt and the text streamed so far.
+    """
+    logger.warning(f"Stream cancelled by client for session {chat_session.session_id}")
+
+    prompt_tokens = sum(count_tokens(message['content']) for message in messages)
+    tokens_used = prompt_tokens + (count_tokens(partial_message) if partial_message else 0)
+    return finish_chat_turn(
+        chat_session, user_message, partial_message, tokens_used, response_time,
+        first_token_ms=first_token_ms, prompt_tokens=prompt_tokens, route_tier=route_tier
+    )
+
+
+# Saves of abandoned turns still running, referenced so they are not garbage collected
+interrupted_turns = set()
+
+
+def save_interrupted_turn(*args):
+    """Run interrupted_chat_turn(*args) in a task, without waiting for it"""
     try:
-        from openai import OpenAI
-        api_key = settings.OPENAI_API_KEY
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        interrupted_chat_turn(*args)
+        return
+    task = loop.create_task(sync_to_async(interrupted_chat_turn)(*args))
+    interrupted_turns.add(task)
+    task.add_done_callback(interrupted_turn_done)
 
-        if not api_key:
-            logger.warning("OpenAI API key not configured")
-            return None
 
-        client = OpenAI(api_key=api_key)
-        return client
-    except ImportError:
-        logger.error("OpenAI library not installed")
+def interrupted_turn_done(task):
+    interrupted_turns.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Could not save interrupted chat turn: {str(task.exception())}")
+
+
+def local_chat_turn(chat_session, user_message):
+    """Answer a turn the router kept local with the built-in reply"""
+    start_time = time.time()
+    ai_message = get_mock_reply(user_message)
+    response_time = int((time.time() - start_time) * 1000)
+    return finish_chat_turn(chat_session, user_message, ai_message, 0, response_time, route_tier=TIER_LOCAL)
+
+
+def answer_from_cache(chat_session, user_message):
+    """Finish the turn with a cached FAQ answer; returns None on a miss"""
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
         return None
-    except Exception as e:
-        logger.error(f"Error initializing OpenAI client: {str(e)}")
+
+    # Only new chats are answered from the cache, matching cache_answer;
+    # a follow-up depends on the turns before it
+    if chat_session.total_messages:
         return None
 
+    start_time = time.time()
+    cached = answer_cache.lookup(user_message)
+    if cached is None:
+        return None
 
-def generate_session_id():
-    """Generate unique session ID for chat"""
-    return f"CS-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+    response_time = int((time.time() - start_time) * 1000)
+    result = finish_chat_turn(chat_session, user_message, cached.answer, 0, response_time)
+    result['cached'] = True
+    return result
 
 
-def get_system_prompt(user):
-    """Get system prompt for AI customer service"""
-    wallet_balance = "0.00"
-    account_number = user.account_number
-    user_name = user.full_name or "Customer"
+def budget_exceeded(user, user_message):
+    """Reason to answer from the built-in replies because of token budgets, or None"""
+    budget = get_token_budget(user.pk)
+    if budget == BUDGET_OK:
+        return None
 
-    try:
-        wallet_balance = str(user.wallet.balance)
-    except:
-        pass
-
-    return f"""You are a helpful and friendly customer service assistant for Swift Wallet, a fintech mobile application.
-
-User Information:
-- Name: {user_name}
-- Phone: {user.phone_number}
-- Account Number: {account_number}
-- Current Balance: ${wallet_balance}
-
-Your responsibilities:
-1. Answer questions about transactions, balance, and account details
-2. Help troubleshoot issues with transfers and payments
-3. Explain features and how to use the app
-4. Provide information about fees and limits
-5. Escalate complex issues to human support when necessary
-
-Important guidelines:
-- Be polite, professional, and empathetic
-- Keep responses concise (2-3 sentences max)
-- Never share sensitive information like PINs or passwords
-- If asked about real money or actual banking, clarify this is a demo/simulation app
-- For account issues you cannot resolve, suggest contacting human support
-
-Transaction limits:
-- Minimum transfer: $1.00
-- Maximum transfer: $100,000.00
-- Minimum deposit: $10.00
-
-Common issues you can help with:
-- How to send money
-- How to add money to wallet
-- How to view transaction history
-- Understanding transaction status
-- Setting up transaction PIN
-- Adding beneficiaries
-"""
+    # Over the soft budget, the model only answers what the built-in replies cannot
+    if budget != BUDGET_HARD and classify(user_message).mock_rule == 'default':
+        return None
+
+    budget_downgrades.inc(budget=budget)
+    return f"{budget} token budget reached for user {user.pk}"
+
+
+def cache_answer(user, chat_session, user_message, ai_message, tokens_used, response_time):
+    """Keep a provider answer for reuse if it does not depend on the user or the conversation"""
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return
+
+    # Later turns are answered in the context of earlier ones
+    if chat_session.total_messages or mentions_user(ai_message, user):
+        return
+
+    answer_cache.store(user_message, ai_message, tokens_used, response_time)
 
 
 def generate_ai_response(user, user_message, chat_session=None):
     """Generate AI response using OpenAI"""
 
-    client = get_openai_client()
+    llm = get_llm_manager()
+    client = llm.get_client()
 
     if not client:
         # Fallback to mock response if OpenAI not available
         return generate_mock_response(user_message)
 
     try:
-        # Get or create chat session
-        if not chat_session:
-            session_id = generate_session_id()
-            chat_session = CustomerServiceChat.objects.create(
-                user=user,
-                session_id=session_id,
-                ai_model_used=settings.OPENAI_MODEL
-            )
+        chat_session, messages = start_chat_turn(user, user_message, chat_session)
 
-        # Save user message
-        ChatMessage.objects.create(
-            chat=chat_session,
-            message_type='user',
-            content=user_message
-        )
+        cached = answer_from_cache(chat_session, user_message)
+        if cached:
+            return cached
 
-        # Get conversation history
-        messages = [
-            {"role": "system", "content": get_system_prompt(user)}
-        ]
+        over_budget = budget_exceeded(user, user_message)
+        if over_budget:
+            return fallback_chat_turn(chat_session, user_message, over_budget)
 
-        # Add recent chat history (last 10 messages)
-        chat_history = chat_session.messages.order_by('created_at')[:10]
-        for msg in chat_history:
-            role = "user" if msg.message_type == "user" else "assistant"
-            messages.append({"role": role, "content": msg.content})
+        route = route_chat_turn(chat_session, user_message)
+        if route.tier == TIER_LOCAL:
+            return local_chat_turn(chat_session, user_message)
 
         # Call OpenAI API
         start_time = time.time()
 
-        response = client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=messages,
-            max_tokens=settings.OPENAI_MAX_TOKENS,
-            temperature=0.7
-        )
+        with llm.guard():
+            response = client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                max_tokens=settings.OPENAI_MAX_TOKENS,
+                temperature=0.7
+            )
 
         ai_message = response.choices[0].message.content
         tokens_used = response.usage.total_tokens
+        prompt_tokens, cached_tokens = record_prompt_usage(response.usage)
         response_time = int((time.time() - start_time) * 1000)
 
-        # Save AI response
-        ChatMessage.objects.create(
-            chat=chat_session,
-            message_type='ai',
-            content=ai_message,
-            tokens_used=tokens_used,
-            response_time_ms=response_time
+        cache_answer(user, chat_session, user_message, ai_message, tokens_used, response_time)
+        return finish_chat_turn(
+            chat_session, user_message, ai_message, tokens_used, response_time,
+            prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, route_tier=route.tier
         )
 
-        # Update chat session
-        chat_session.total_messages += 2  # user + ai
-        chat_session.save()
+    except LLMUnavailable as e:
+        return fallback_chat_turn(chat_session, user_message, e)
 
-        # Detect if issue is resolved
-        if any(word in user_message.lower() for word in ['thank', 'thanks', 'resolved', 'fixed', 'solved']):
-            chat_session.status = 'resolved'
-            chat_session.resolved_by_ai = True
-            chat_session.ended_at = timezone.now()
-            chat_session.save()
+    except Exception as e:
+        return fail_chat_turn(chat_session, user_message, e)
 
-        # Detect if escalation needed
-        if any(word in user_message.lower() for word in ['speak to human', 'human agent', 'escalate', 'manager']):
-            chat_session.status = 'escalated'
-            chat_session.save()
 
-        logger.info(f"AI response generated for session {chat_session.session_id}: {tokens_used} tokens, {response_time}ms")
+async def agenerate_ai_response(user, user_message, chat_session=None):
+    """
+    Async variant of generate_ai_response.
 
-        return {
-            'session_id': chat_session.session_id,
-            'message': ai_message,
-            'status': chat_session.status,
-            'tokens_used': tokens_used,
-            'response_time_ms': response_time
-        }
+    The OpenAI call is awaited instead of holding a thread, and at most
+    OPENAI_MAX_CONCURRENCY calls are in flight per event loop. The short
+    database phases run through sync_to_async.
+    """
+    llm = get_llm_manager()
+    client = llm.get_async_client()
 
-    except Exception as e:
-        logger.error(f"Error generating AI response: {str(e)}")
+    if not client:
+        # Fallback to mock response if OpenAI not available
+        return generate_mock_response(user_message)
 
-        # Save error and return fallback
-        error_message = "I apologize, but I'm experiencing technical difficulties. Please try again or contact human support."
+    try:
+        chat_session, messages = await sync_to_async(start_chat_turn)(user, user_message, chat_session)
 
-        ChatMessage.objects.create(
-            chat=chat_session,
-            message_type='system',
-            content=f"Error: {str(e)}"
-        )
+        cached = await sync_to_async(answer_from_cache)(chat_session, user_message)
+        if cached:
+            return cached
 
-        return {
-            'session_id': chat_session.session_id if chat_session else None,
-            'message': error_message,
-            'status': 'active',
-            'error': str(e)
-        }
+        over_budget = await sync_to_async(budget_exceeded)(user, user_message)
+        if over_budget:
+            return await sync_to_async(fallback_chat_turn)(chat_session, user_message, over_budget)
 
+        route = route_chat_turn(chat_session, user_message)
+        if route.tier == TIER_LOCAL:
+            return await sync_to_async(local_chat_turn)(chat_session, user_message)
 
-def generate_mock_response(user_message):
-    """Generate mock AI response when OpenAI is not available"""
+        start_time = time.time()
+
+        async with llm.aguard():
+            response = await client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                max_tokens=settings.OPENAI_MAX_TOKENS,
+                temperature=0.7
+            )
+
+        ai_message = response.choices[0].message.content
+        tokens_used = response.usage.total_tokens
+        prompt_tokens, cached_tokens = record_prompt_usage(response.usage)
+        response_time = int((time.time() - start_time) * 1000)
+
+        await sync_to_async(cache_answer)(user, chat_session, user_message, ai_message, tokens_used, response_time)
+        return await sync_to_async(finish_chat_turn)(
+            chat_session, user_message, ai_message, tokens_used, response_time,
+            prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, route_tier=route.tier
+        )
 
-    message_lower = user_message.lower()
+    except LLMUnavailable as e:
+        return await sync_to_async(fallback_chat_turn)(chat_session, user_message, e)
 
-    # Simple rule-based responses
-    if 'balance' in message_lower:
-        response = "To check your balance, go to the Dashboard or Wallet section in the app. Your current balance is displayed at the top."
+    except Exception as e:
+        return await sync_to_async(fail_chat_turn)(chat_session, user_message, e)
+
+
+async def astream_ai_response(user, user_message, chat_session=None):
+    """
+    Stream an AI response as (event, data) pairs.
 
-    elif 'send money' in message_lower or 'transfer' in message_lower:
-        response = "To send money: 1) Go to Send Money, 2) Enter recipient's phone or account number, 3) Enter amount, 4) Confirm with your PIN. Minimum amount is $1.00."
+    Emits 'session' once, a 'delta' per content chunk, then 'done' with the
+    same result generate_ai_response returns plus first_token_ms, or 'error'.
+    The reply is saved once, after the last chunk, or with the text streamed
+    so far if the client disconnects.
+    """
+    llm = get_llm_manager()
+    client = llm.get_async_client()
 
-    elif 'add money' in message_lower or 'deposit' in message_lower:
-        response = "To add money to your wallet, go to Add Money section and choose your payment method. Minimum deposit is $10.00. Note: This is a demo app with simulated transactions."
+    if not client:
+        result = generate_mock_response(user_message)
+        yield 'session', {'session_id': result['session_id']}
+        yield 'delta', {'content': result['message']}
+        yield 'done', result
+        return
 
-    elif 'transaction' in message_lower and ('history' in message_lower or 'view' in message_lower):
-        response = "You can view all your transactions in the Transaction History section. Each transaction shows the amount, recipient/sender, date, and status."
+    try:
+        chat_session, messages = await sync_to_async(start_chat_turn)(user, user_message, chat_session)
+        cached = await sync_to_async(answer_from_cache)(chat_session, user_message)
+        over_budget = None if cached else await sync_to_async(budget_exceeded)(user, user_message)
+        route = route_chat_turn(chat_session, user_message)
+    except Exception as e:
+        yield 'error', await sync_to_async(fail_chat_turn)(chat_session, user_message, e)
+        return
+
+    yield 'session', {'session_id': chat_session.session_id}
+
+    if cached:
+        yield 'delta', {'content': cached['message']}
+        yield 'done', cached
+        return
+
+    if over_budget or route.tier == TIER_LOCAL:
+        if over_budget:
+            result = await sync_to_async(fallback_chat_turn)(chat_session, user_message, over_budget)
+        else:
+            result = await sync_to_async(local_chat_turn)(chat_session, user_message)
+        yield 'delta', {'content': result['message']}
+        yield 'done', result
+        return
+
+    parts = []
+    tokens_used = None
+    usage = None
+    first_token_ms = None
+    stream_finished = False
+    start_time = time.time()
 
-    elif 'pin' in message_lower:
-        response = "Your transaction PIN is a 4-digit security code required for transfers. You can set or change it in Settings > Security > Transaction PIN."
+    try:
+        async with llm.aguard():
+            stream = await client.chat.completions.create(
+                model=route.model,
+                messages=messages,
+                max_tokens=settings.OPENAI_MAX_TOKENS,
+                temperature=0.7,
+                stream=True,
+                stream_options={'include_usage': True}
+            )
 
-    elif 'limit' in message_lower or 'maximum' in message_lower:
-        response = "Transaction limits: Minimum transfer $1, Maximum transfer $100,000. Minimum deposit $10. These limits ensure security and proper usage."
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                    tokens_used = usage.total_tokens
+                if not chunk.choices:
+                    continue
+
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_ms is None:
+                        first_token_ms = int((time.time() - start_time) * 1000)
+                    parts.append(delta)
+                    yield 'delta', {'content': delta}
+
+        stream_finished = True
+        response_time = int((time.time() - start_time) * 1000)
+        ai_message = ''.join(parts)
+        prompt_tokens, cached_tokens = record_prompt_usage(usage)
+
+        await sync_to_async(cache_answer)(user, chat_session, user_message, ai_message, tokens_used, response_time)
+        result = await sync_to_async(finish_chat_turn)(
+            chat_session, user_message, ai_message, tokens_used, response_time,
+            first_token_ms=first_token_ms, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens,
+            route_tier=route.tier
+        )
 
-    elif 'help' in message_lower or 'problem' in message_lower or 'issue' in message_lower:
-        response = "I'm here to help! Common issues: failed transactions, login problems, or balance inquiries. Please describe your specific issue and I'll assist you."
+    except LLMUnavailable as e:
+        result = await sync_to_async(fallback_chat_turn)(chat_session, user_message, e)
+        yield 'delta', {'content': result['message']}
+        yield 'done', result
+        return
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away mid-stream: the task was cancelled, or the
+        # response closed this generator. Nothing may be awaited here, so the
+        # turn so far is saved by a task of its own; once the stream has
+        # ended, finish_chat_turn saves it regardless.
+        if not stream_finished:
+            response_time = int((time.time() - start_time) * 1000)
+            save_interrupted_turn(
+                chat_session, user_message, messages, ''.join(parts), response_time, first_token_ms, route.tier
+            )
+        raise
 
-    elif any(word in message_lower for word in ['hello', 'hi', 'hey']):
-        response = "Hello! I'm your Swift Wallet assistant. How can I help you today? I can assist with transactions, balance inquiries, and app features."
+    except Exception as e:
+        yield 'error', await sync_to_async(fail_chat_turn)(chat_session, user_message, e)
+        return
 
-    elif any(word in message_lower for word in ['thank', 'thanks']):
-        response = "You're welcome! Is there anything else I can help you with? If not, have a great day!"
+    # Outside the try, so a disconnect here does not save the turn twice
+    yield 'done', result
 
-    else:
-        response = "I understand you need assistance. Could you please provide more details about your question? I can help with transactions, balance, deposits, or app features."
 
+def generate_mock_response(user_message):
+    """Generate mock AI response when OpenAI is not available"""
     return {
         'session_id': generate_session_id(),
-        'message': response,
+        'message': get_mock_reply(user_message),
         'status': 'active',
         'mock': True
     }
 
 
-def detect_issue_category(message):
-    """Detect issue category from user message"""
-    message_lower = message.lower()
-
-    categories = {
-        'balance_inquiry': ['balance', 'how much', 'check balance'],
-        'transaction_issue': ['failed', 'pending', 'didn\'t receive', 'transaction error'],
-        'send_money': ['send money', 'transfer', 'pay someone'],
-        'add_money': ['add money', 'deposit', 'fund wallet'],
-        'pin_issue': ['forgot pin', 'reset pin', 'change pin', 'pin locked'],
-        'general_inquiry': ['how to', 'what is', 'explain']
-    }
+def get_mock_reply(user_message):
+    """Rule-based reply text used when the provider cannot be called"""
+    return classify(user_message).mock_reply
 
-    for category, keywords in categories.items():
-        if any(keyword in message_lower for keyword in keywords):
-            return category
 
-    return 'other'
+def detect_issue_category(message):
+    """Detect issue category from user message"""
+    return classify(message).category
 
 
 def analyze_sentiment(message):
     """Simple sentiment analysis (0-1, where 0=negative, 1=positive)"""
-    positive_words = ['thank', 'great', 'good', 'helpful', 'appreciate', 'solved', 'fixed', 'excellent']
-    negative_words = ['bad', 'terrible', 'awful', 'angry', 'frustrated', 'disappointed', 'useless', 'problem']
-
-    message_lower = message.lower()
-
-    positive_count = sum(1 for word in positive_words if word in message_lower)
-    negative_count = sum(1 for word in negative_words if word in message_lower)
-
-    if positive_count + negative_count == 0:
-        return 0.5  # Neutral
-
-    sentiment = positive_count / (positive_count + negative_count)
-    return sentiment
+    return classify(message).sentiment
@@ -0,0 +1,461 @@
+"""
+Daily transaction analytics and their weekly, monthly and yearly rollups.
+
+Each completed transaction is added to its owner's TransactionAnalytics
+row for the day with a single INSERT ... ON CONFLICT (user_id, date) DO
+UPDATE, and to the week, month and year TransactionAnalyticsRollup rows
+with one more multi-row upsert. The totals are incremented by the
+database, so concurrent transactions for the same user and day cannot
+overwrite each other. The closing balance is the transaction's
+balance_after; ledger writes for a wallet hold its row lock, so the last
+upsert of the day carries the latest balance.
+
+Range totals are read by plan_range(), which covers [start, end] with the
+fewest rollup and daily rows, and summarize_range(), which sums them in
+one query. A calendar year in the past is a single row.
+
+rebuild_daily() and rebuild_rollups() recompute both tables from the
+ledger for a range of users. rebuild_users() runs them for the
+rebuild_analytics command while holding the users' wallet row locks,
+which every ledger write takes before its upserts, so no transaction can
+land between the read and the overwrite.
+"""
+import calendar
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+from .models import Transaction, TransactionAnalytics, TransactionAnalyticsRollup, Wallet
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Counted columns, added to the existing row on conflict
+COUNTER_COLUMNS = (
+    'total_credits', 'total_debits', 'total_transactions',
+    'transfers_sent', 'transfers_received', 'bill_payments', 'airtime_purchases',
+)
+AMOUNT_COLUMNS = ('total_credits', 'total_debits')
+CENTS = Decimal('0.01')
+
+PERIOD_DAY = 'day'
+PERIOD_WEEK = 'week'
+PERIOD_MONTH = 'month'
+PERIOD_YEAR = 'year'
+ROLLUP_PERIODS = (PERIOD_WEEK, PERIOD_MONTH, PERIOD_YEAR)
+PERIOD_TRUNCS = {PERIOD_WEEK: TruncWeek, PERIOD_MONTH: TruncMonth, PERIOD_YEAR: TruncYear}
+
+WRITE_BATCH_SIZE = 1000
+DIFF_SAMPLE_SIZE = 20
+
+
+def period_start(period, day):
+    if period == PERIOD_WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == PERIOD_MONTH:
+        return day.replace(day=1)
+    if period == PERIOD_YEAR:
+        return day.replace(month=1, day=1)
+    return day
+
+
+def period_end(period, start):
+    if period == PERIOD_WEEK:
+        return start + timedelta(days=6)
+    if period == PERIOD_MONTH:
+        return start.replace(day=calendar.monthrange(start.year, start.month)[1])
+    if period == PERIOD_YEAR:
+        return start.replace(month=12, day=31)
+    return start
+
+
+def group_deltas(transaction_type, transaction_category, amount, count=1):
+    """How much `count` transactions of one type and category, totalling `amount`, add to each counted column"""
+    deltas = dict.fromkeys(COUNTER_COLUMNS, 0)
+    deltas['total_credits'] = Decimal('0.00')
+    deltas['total_debits'] = Decimal('0.00')
+    deltas['total_transactions'] = count
+
+    if transaction_type == 'credit':
+        deltas['total_credits'] = amount
+        if transaction_category == 'transfer':
+            deltas['transfers_received'] = count
+    else:
+        deltas['total_debits'] = amount
+        if transaction_category == 'transfer':
+            deltas['transfers_sent'] = count
+        elif transaction_category == 'bill_payment':
+            deltas['bill_payments'] = count
+        elif transaction_category == 'airtime':
+            deltas['airtime_purchases'] = count
+
+    return deltas
+
+
+def transaction_deltas(txn):
+    """How much one transaction adds to each counted column"""
+    return group_deltas(txn.transaction_type, txn.transaction_category, txn.amount)
+
+
+def build_upsert_sql(model, key_columns, value_columns, rows=1, replace_columns=(), counter_columns=COUNTER_COLUMNS,
+                     returning=()):
+    """
+    INSERT ... ON CONFLICT (key_columns) DO UPDATE that adds counter_columns
+    to the existing row and overwrites replace_columns, optionally
+    RETURNING the resulting values of some columns
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = tuple(key_columns) + tuple(value_columns)
+    updates = [
+        f"{qn(column)} = {table}.{qn(column)} + EXCLUDED.{qn(column)}"
+        for column in value_columns if column in counter_columns
+    ]
+    updates.extend(f"{qn(column)} = EXCLUDED.{qn(column)}" for column in replace_columns)
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+        f"VALUES {', '.join([placeholders] * rows)} "
+        f"ON CONFLICT ({', '.join(qn(column) for column in key_columns)}) DO UPDATE SET {', '.join(updates)}"
+    )
+    if returning:
+        sql += f" RETURNING {', '.join(qn(column) for column in returning)}"
+    return sql
+
+
+def counter_params(deltas):
+    ops = connection.ops
+    return [
+        ops.adapt_decimalfield_value(deltas[column]) if column in AMOUNT_COLUMNS else deltas[column]
+        for column in COUNTER_COLUMNS
+    ]
+
+
+def record_transaction(txn):
+    """
+    Add a completed transaction to its owner's daily analytics and rollups.
+
+    Returns True when it is the owner's first transaction of the day.
+    """
+    ops = connection.ops
+    deltas = transaction_deltas(txn)
+    now = timezone.now()
+    day = (txn.created_at or now).date()
+    user_id = txn.wallet.user_id
+    counters = counter_params(deltas)
+
+    daily_sql = build_upsert_sql(
+        TransactionAnalytics, ('user_id', 'date'),
+        COUNTER_COLUMNS + ('closing_balance', 'created_at'),
+        replace_columns=('closing_balance',), returning=('total_transactions',)
+    )
+    daily_params = [user_id, ops.adapt_datefield_value(day)] + counters + [
+        ops.adapt_decimalfield_value(txn.balance_after), ops.adapt_datetimefield_value(now)
+    ]
+
+    rollup_sql = build_upsert_sql(
+        TransactionAnalyticsRollup, ('user_id', 'period', 'period_start'), COUNTER_COLUMNS,
+        rows=len(ROLLUP_PERIODS)
+    )
+    rollup_params = []
+    for period in ROLLUP_PERIODS:
+        rollup_params.extend([user_id, period, ops.adapt_datefield_value(period_start(period, day))])
+        rollup_params.extend(counters)
+
+    with connection.cursor() as cursor:
+        cursor.execute(daily_sql, daily_params)
+        # The upsert holds the day row's lock, so exactly one transaction sees the first count
+        first_of_day = cursor.fetchone()[0] == 1
+        cursor.execute(rollup_sql, rollup_params)
+    return first_of_day
+
+
+def plan_range(start, end):
+    """
+    Fewest (period, period_start) rows whose periods exactly cover
+    [start, end]; PERIOD_DAY entries are daily rows.
+
+    Weeks do not nest in months, so the cover is the shortest path over
+    the days of the range, with an edge for every whole period that starts
+    on a day and ends inside the range.
+    """
+    days = (end - start).days + 1
+    if days <= 0:
+        return []
+
+    # best[i]: rows needed to cover day i to the end; step[i]: (period, length) taken at day i
+    best = [0] * (days + 1)
+    step = [None] * days
+    for index in range(days - 1, -1, -1):
+        day = start + timedelta(days=index)
+        best[index] = best[index + 1] + 1
+        step[index] = (PERIOD_DAY, 1)
+        for period in (PERIOD_YEAR, PERIOD_MONTH, PERIOD_WEEK):
+            if period_start(period, day) != day:
+                continue
+            length = (period_end(period, day) - day).days + 1
+            if index + length <= days and best[index + length] + 1 < best[index]:
+                best[index] = best[index + length] + 1
+                step[index] = (period, length)
+
+    plan = []
+    index = 0
+    while index < days:
+        period, length = step[index]
+        plan.append((period, start + timedelta(days=index)))
+        index += length
+    return plan
+
+
+def summarize_range(user_id, start, end):
+    """Totals of the counted columns over [start, end], summed in one query"""
+    qn = connection.ops.quote_name
+    ops = connection.ops
+    plan = plan_range(start, end)
+
+    by_period = {}
+    for period, first_day in plan:
+        by_period.setdefault(period, []).append(ops.adapt_datefield_value(first_day))
+
+    selected = ', '.join(qn(column) for column in COUNTER_COLUMNS)
+    parts = []
+    params = []
+    if PERIOD_DAY in by_period:
+        dates = by_period.pop(PERIOD_DAY)
+        parts.append(
+            f"SELECT {selected} FROM {qn(TransactionAnalytics._meta.db_table)} "
+            f"WHERE {qn('user_id')} = %s AND {qn('date')} IN ({', '.join(['%s'] * len(dates))})"
+        )
+        params.extend([user_id] + dates)
+    if by_period:
+        conditions = []
+        params.append(user_id)
+        for period, starts in by_period.items():
+            conditions.append(
+                f"({qn('period')} = %s AND {qn('period_start')} IN ({', '.join(['%s'] * len(starts))}))"
+            )
+            params.extend([period] + starts)
+        parts.append(
+            f"SELECT {selected} FROM {qn(TransactionAnalyticsRollup._meta.db_table)} "
+            f"WHERE {qn('user_id')} = %s AND ({' OR '.join(conditions)})"
+        )
+
+    totals = dict.fromkeys(COUNTER_COLUMNS, 0)
+    totals.update({column: Decimal('0.00') for column in AMOUNT_COLUMNS})
+    if not parts:
+        return totals
+
+    sums = ', '.join(f"COALESCE(SUM({qn(column)}), 0)" for column in COUNTER_COLUMNS)
+    sql = f"SELECT {sums} FROM ({' UNION ALL '.join(parts)}) covered"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    for column, value in zip(COUNTER_COLUMNS, row):
+        if column in AMOUNT_COLUMNS:
+            totals[column] = Decimal(str(value)).quantize(CENTS)
+        else:
+            totals[column] = int(value)
+    return totals
+
+
+def utc_midnight(day):
+    # Analytics days are UTC dates of created_at, as in record_transaction()
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def rebuild_daily(first_user_id, last_user_id, start=None, end=None, dry_run=False):
+    """
+    Recompute the daily rows of users first_user_id..last_user_id between
+    start and end (inclusive, either open) from completed transactions.
+
+    Returns counts of transactions read and rows created, updated,
+    unchanged and deleted, with a sample of the differences found.
+    """
+    ledger = Transaction.objects.filter(
+        status='completed',
+        wallet__user_id__gte=first_user_id,
+        wallet__user_id__lte=last_user_id
+    )
+    existing = TransactionAnalytics.objects.filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+    if start:
+        ledger = ledger.filter(created_at__gte=utc_midnight(start))
+        existing = existing.filter(date__gte=start)
+    if end:
+        ledger = ledger.filter(created_at__lt=utc_midnight(end + timedelta(days=1)))
+        existing = existing.filter(date__lte=end)
+
+    groups = (
+        ledger
+        .annotate(day=TruncDate('created_at', tzinfo=dt_timezone.utc))
+        .values('wallet_id', 'wallet__user_id', 'day', 'transaction_type', 'transaction_category')
+        .annotate(amount=Sum('amount'), count=Count('id'), last_id=Max('id'))
+        .order_by()
+    )
+
+    computed = {}
+    last_ids = {}
+    scanned = 0
+    for group in groups.iterator(chunk_size=10000):
+        key = (group['wallet__user_id'], group['day'])
+        deltas = group_deltas(
+            group['transaction_type'], group['transaction_category'], group['amount'], group['count']
+        )
+        totals = computed.get(key)
+        if totals is None:
+            computed[key] = deltas
+        else:
+            for column in COUNTER_COLUMNS:
+                totals[column] += deltas[column]
+        last_ids[key] = max(last_ids.get(key, 0), group['last_id'])
+        scanned += group['count']
+
+    # The closing balance is the balance after the day's last transaction
+    closing = {}
+    ids = list(last_ids.values())
+    for offset in range(0, len(ids), WRITE_BATCH_SIZE):
+        closing.update(
+            Transaction.objects.filter(id__in=ids[offset:offset + WRITE_BATCH_SIZE])
+            .values_list('id', 'balance_after')
+        )
+
+    current = {
+        (row['user_id'], row['date']): row
+        for row in existing.values('id', 'user_id', 'date', 'closing_balance', *COUNTER_COLUMNS)
+    }
+
+    writes = []
+    diffs = []
+    stats = {'transactions': scanned, 'rows': len(computed), 'created': 0, 'updated': 0, 'unchanged': 0}
+    for key, totals in computed.items():
+        for column in AMOUNT_COLUMNS:
+            totals[column] = Decimal(totals[column]).quantize(CENTS)
+        totals['closing_balance'] = closing[last_ids[key]]
+        row = current.pop(key, None)
+        if row is None:
+            stats['created'] += 1
+            if len(diffs) < DIFF_SAMPLE_SIZE:
+                diffs.append((key[0], key[1], 'row', None, 'created'))
+        else:
+            changed = [column for column in totals if row[column] != totals[column]]
+            if not changed:
+                stats['unchanged'] += 1
+                continue
+            stats['updated'] += 1
+            for column in changed:
+                if len(diffs) < DIFF_SAMPLE_SIZE:
+                    diffs.append((key[0], key[1], column, row[column], totals[column]))
+        writes.append(TransactionAnalytics(user_id=key[0], date=key[1], **totals))
+
+    # Rows left over have no completed transactions behind them
+    stale = [row['id'] for row in current.values()]
+    stats['deleted'] = len(stale)
+    for row in list(current.values())[:max(DIFF_SAMPLE_SIZE - len(diffs), 0)]:
+        diffs.append((row['user_id'], row['date'], 'row', 'exists', 'deleted'))
+    stats['diffs'] = diffs
+
+    if dry_run:
+        return stats
+
+    with transaction.atomic():
+        TransactionAnalytics.objects.bulk_create(
+            writes,
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=list(COUNTER_COLUMNS) + ['closing_balance']
+        )
+        for offset in range(0, len(stale), WRITE_BATCH_SIZE):
+            TransactionAnalytics.objects.filter(id__in=stale[offset:offset + WRITE_BATCH_SIZE]).delete()
+
+    return stats
+
+
+def rebuild_rollups(first_user_id, last_user_id, start=None, end=None):
+    """
+    Recompute the rollups of users first_user_id..last_user_id for every
+    period overlapping [start, end] from their daily rows; returns rows written
+    """
+    written = 0
+    for period in ROLLUP_PERIODS:
+        daily = TransactionAnalytics.objects.filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+        rollups = TransactionAnalyticsRollup.objects.filter(
+            user_id__gte=first_user_id, user_id__lte=last_user_id, period=period
+        )
+        # Whole periods, including days outside the range
+        if start:
+            first_period = period_start(period, start)
+            daily = daily.filter(date__gte=first_period)
+            rollups = rollups.filter(period_start__gte=first_period)
+        if end:
+            last_period = period_start(period, end)
+            daily = daily.filter(date__lte=period_end(period, last_period))
+            rollups = rollups.filter(period_start__lte=last_period)
+
+        rows = (
+            daily
+            .annotate(rollup_start=PERIOD_TRUNCS[period]('date'))
+            .values('user_id', 'rollup_start')
+            .annotate(**{f'sum_{column}': Sum(column) for column in COUNTER_COLUMNS})
+            .order_by()
+        )
+        objects = [
+            TransactionAnalyticsRollup(
+                user_id=row['user_id'],
+                period=period,
+                period_start=row['rollup_start'],
+                **{column: row[f'sum_{column}'] for column in COUNTER_COLUMNS}
+            )
+            for row in rows.iterator(chunk_size=10000)
+        ]
+        keys = {(rollup.user_id, rollup.period_start) for rollup in objects}
+        stale = [
+            rollup_id
+            for rollup_id, user_id, first_day in rollups.values_list('id', 'user_id', 'period_start')
+            if (user_id, first_day) not in keys
+        ]
+
+        with transaction.atomic():
+            TransactionAnalyticsRollup.objects.bulk_create(
+                objects,
+                batch_size=WRITE_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['user', 'period', 'period_start'],
+                update_fields=list(COUNTER_COLUMNS)
+            )
+            for offset in range(0, len(stale), WRITE_BATCH_SIZE):
+                TransactionAnalyticsRollup.objects.filter(id__in=stale[offset:offset + WRITE_BATCH_SIZE]).delete()
+        written += len(objects)
+
+    return written
+
+
+def rebuild_users(first_user_id, last_user_id, start=None, end=None, dry_run=False):
+    """
+    Rebuild the daily rows and rollups of users first_user_id..last_user_id.
+
+    Ledger writes upsert analytics while holding the owner's wallet row
+    lock, so the range's wallets are locked first, in id order. Every
+    transaction committed before is then in the recomputed totals, and
+    those waiting for a lock add themselves on top after the rebuild
+    commits. Transfers of these users wait meanwhile; keep partitions small
+    on a busy ledger. Returns the rebuild_daily() stats with 'rollups'.
+    """
+    if dry_run:
+        stats = rebuild_daily(first_user_id, last_user_id, start, end, dry_run=True)
+        stats['rollups'] = 0
+        return stats
+
+    with transaction.atomic():
+        list(
+            Wallet.objects.select_for_update()
+            .filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        stats = rebuild_daily(first_user_id, last_user_id, start, end)
+        stats['rollups'] = rebuild_rollups(first_user_id, last_user_id, start, end)
+    return stats
@@ -0,0 +1,212 @@
+"""
+Answer cache in front of the LLM.
+
+Most support questions are the same handful of FAQs. Answers to
+self-contained, non-personal questions are kept in a process-local LRU
+with a TTL and served again for the same question, or a close rewording
+of it, without calling the provider.
+
+Matching is exact on the normalized text first, then by character
+trigram Jaccard similarity through an inverted index, so a lookup only
+scores entries that share trigrams with the question.
+
+Nothing personal is ever cached: questions about the user's own balance,
+account or history are bypassed, and answers that mention the user's
+name, phone, account number or balance are not stored.
+"""
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+cache_requests = metrics.counter(
+    'ai_answer_cache_requests_total', 'Answer cache lookups by result', ['result']
+)
+cache_tokens_saved = metrics.counter(
+    'ai_answer_cache_tokens_saved_total', 'LLM tokens not spent thanks to answer cache hits'
+)
+cache_latency_saved = metrics.counter(
+    'ai_answer_cache_latency_saved_seconds_total', 'LLM latency avoided by answer cache hits'
+)
+cache_entries = metrics.gauge(
+    'ai_answer_cache_entries', 'Answers currently held in the answer cache'
+)
+
+PERSONAL_PATTERN = re.compile(
+    r"balance|how much|account number|phone number|my (account|name|transaction|transfer|payment|deposit|last|money|wallet)"
+    r"|did i\b|have i\b|where is my|\d{3,}"
+)
+NON_WORD = re.compile(r"[^\w\s]")
+SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return SPACES.sub(' ', NON_WORD.sub(' ', text.lower())).strip()
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def is_personal_question(normalized):
+    return bool(PERSONAL_PATTERN.search(normalized))
+
+
+def mentions_user(answer, user):
+    """True if the answer echoes any of the user's own details"""
+    details = [user.phone_number, user.account_number, user.full_name]
+    try:
+        details.append(str(user.wallet.balance))
+    except Exception:
+        pass
+    return any(detail and detail in answer for detail in details)
+
+
+class CachedAnswer:
+    __slots__ = ('key', 'grams', 'answer', 'tokens_used', 'response_time_ms', 'expires_at', 'hits')
+
+    def __init__(self, key, grams, answer, tokens_used, response_time_ms, expires_at):
+        self.key = key
+        self.grams = grams
+        self.answer = answer
+        self.tokens_used = tokens_used or 0
+        self.response_time_ms = response_time_ms or 0
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class AnswerCache:
+    def __init__(self, max_entries, ttl_seconds, min_similarity):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._index = {}
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        for gram in entry.grams:
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._index[gram]
+
+    def _closest(self, grams):
+        overlaps = Counter()
+        for gram in grams:
+            overlaps.update(self._index.get(gram, ()))
+
+        best, best_score = None, self.min_similarity
+        for key, overlap in overlaps.items():
+            entry = self._entries[key]
+            score = overlap / (len(grams) + len(entry.grams) - overlap)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def lookup(self, message):
+        """Return the CachedAnswer for this question, or None"""
+        key = normalize(message)
+        if not key or is_personal_question(key):
+            with self._lock:
+                self._bypassed += 1
+            cache_requests.inc(result='bypass')
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._closest(trigrams(key))
+
+            if entry is not None and entry.expires_at <= now:
+                self._remove(entry)
+                cache_entries.set(len(self._entries))
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                cache_requests.inc(result='miss')
+                return None
+
+            self._entries.move_to_end(entry.key)
+            entry.hits += 1
+            self._hits += 1
+
+        cache_requests.inc(result='hit')
+        cache_tokens_saved.inc(entry.tokens_used)
+        cache_latency_saved.inc(entry.response_time_ms / 1000)
+        return entry
+
+    def store(self, message, answer, tokens_used, response_time_ms):
+        key = normalize(message)
+        if not key or not answer or is_personal_question(key):
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(self._entries[key])
+
+            entry = CachedAnswer(
+                key, trigrams(key), answer, tokens_used, response_time_ms,
+                time.monotonic() + self.ttl_seconds
+            )
+            self._entries[key] = entry
+            for gram in entry.grams:
+                self._index.setdefault(gram, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries.values())))
+            cache_entries.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            cache_entries.set(0)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'bypassed': self._bypassed,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'tokens_saved': cache_tokens_saved.get(),
+                'latency_saved_seconds': round(cache_latency_saved.get(), 3),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """The process-wide answer cache, or None when AI_ANSWER_CACHE_ENABLED is off"""
+    global _cache
+    if not settings.AI_ANSWER_CACHE_ENABLED:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(
+                max_entries=settings.AI_ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.AI_ANSWER_CACHE_TTL,
+                min_similarity=settings.AI_ANSWER_CACHE_MIN_SIMILARITY,
+            )
+        return _cache
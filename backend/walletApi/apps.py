@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class WalletapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'walletApi'
+
+    def ready(self):
+        # Connects the receiver counting new wallets on the ops dashboard
+        from . import platform_counters  # noqa: F401
+        from .metering import check_shared_cache
+        checks.register(check_shared_cache, checks.Tags.caches)
@@ -0,0 +1,217 @@
+import inspect
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiExample
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .ai_service import agenerate_ai_response, astream_ai_response
+from .authentication import aauthenticate_request
+from .models import CustomerServiceChat
+from .realtime import encode_sse, sse_event_stream
+from .serializers import ChatRequestSerializer
+
+
+def unauthorized_response():
+    return JsonResponse({
+        'status': 'error',
+        'message': 'Authentication credentials were not provided or are invalid'
+    }, status=401)
+
+
+@require_GET
+async def wallet_event_stream(request):
+    """
+    Stream balance and transaction events for the authenticated user (SSE).
+
+    Needs an ASGI server; under WSGI each open stream would hold a worker.
+    """
+    user = await aauthenticate_request(request, allow_query_token=True)
+    if user is None:
+        return unauthorized_response()
+
+    response = StreamingHttpResponse(sse_event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+CHAT_EXAMPLES = [
+    OpenApiExample(
+        'Start new conversation',
+        value={
+            "message": "How do I send money to someone?"
+        }
+    ),
+    OpenApiExample(
+        'Continue existing conversation',
+        value={
+            "message": "What are the transaction limits?",
+            "session_id": "CS-20241126-ABC12345"
+        }
+    )
+]
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+
+    Authentication, permissions and throttles run in a thread, as they may
+    query the database or a network cache; the handler itself runs on the
+    event loop. Errors keep the status/message shape of the other endpoints.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if isinstance(response.data, dict) and 'detail' in response.data:
+            response.data = {
+                'status': 'error',
+                'message': str(response.data['detail'])
+            }
+        return response
+
+
+def read_chat_request(request):
+    """
+    Validate a chat request body.
+
+    Returns (error_response, None) or (None, (message, session_id)).
+    """
+    serializer = ChatRequestSerializer(data=request.data)
+
+    if not serializer.is_valid():
+        return Response({
+            'status': 'error',
+            'message': 'Validation failed',
+            'errors': serializer.errors
+        }, status=400), None
+
+    return None, (serializer.validated_data['message'], serializer.validated_data.get('session_id'))
+
+
+async def get_chat_session(user, session_id):
+    """The user's chat session with this id, or None to start a new one"""
+    if not session_id:
+        return None
+    try:
+        return await CustomerServiceChat.objects.aget(session_id=session_id, user=user)
+    except CustomerServiceChat.DoesNotExist:
+        return None
+
+
+@extend_schema(
+    tags=['AI Support'],
+    summary='Chat with AI Customer Service',
+    description='''
+    Interact with the AI-powered customer service chatbot.
+
+    **Features:**
+    - Context-aware responses (knows your balance, transactions)
+    - GPT-4 powered (with fallback to mock responses)
+    - Session continuity
+    - Sentiment analysis
+    - Auto-escalation to human support
+
+    **Topics the AI can help with:**
+    - How to send money
+    - Check balance
+    - Transaction issues
+    - Account settings
+    - App features and usage
+    ''',
+    request=ChatRequestSerializer,
+    responses={200: OpenApiTypes.OBJECT},
+    examples=CHAT_EXAMPLES
+)
+class CustomerServiceChatView(AsyncAPIView):
+    """
+    Chat with the AI customer service assistant.
+
+    Async so a slow completion waits on the event loop instead of holding a
+    worker thread; transfers keep flowing while chats are in flight.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        error_response, chat_request = read_chat_request(request)
+        if error_response:
+            return error_response
+
+        message, session_id = chat_request
+        user = request.user
+        chat_session = await get_chat_session(user, session_id)
+
+        # Generate AI response; new sessions are tagged with category and sentiment on creation
+        result = await agenerate_ai_response(user, message, chat_session)
+
+        return Response({
+            'status': 'success',
+            'message': 'Response generated',
+            'data': result
+        })
+
+
+@extend_schema(
+    tags=['AI Support'],
+    summary='Chat with AI Customer Service (streamed)',
+    description='''
+    Same request as support/chat/, answered as Server-Sent Events.
+
+    Events: `session` (session_id), `delta` (content chunk), then `done`
+    (the full result with first_token_ms) or `error`.
+    ''',
+    request=ChatRequestSerializer,
+    responses={(200, 'text/event-stream'): OpenApiTypes.STR},
+    examples=CHAT_EXAMPLES
+)
+class CustomerServiceChatStreamView(AsyncAPIView):
+    """
+    Same request as CustomerServiceChatView, answered as Server-Sent Events.
+
+    Events: 'session' (session_id), 'delta' (content chunk), then 'done'
+    (the full result with first_token_ms) or 'error'.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        error_response, chat_request = read_chat_request(request)
+        if error_response:
+            return error_response
+
+        message, session_id = chat_request
+        user = request.user
+        chat_session = await get_chat_session(user, session_id)
+
+        async def events():
+            async for event_type, data in astream_ai_response(user, message, chat_session):
+                yield encode_sse(event_type, data)
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,105 @@
+import hmac
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+import logging
+
+logger = logging.getLogger(__name__)
+
+jwt_authentication = JWTAuthentication()
+
+
+def get_user_from_token(raw_token):
+    """Validate a raw JWT access token and return its user, or None"""
+    if not raw_token:
+        return None
+
+    try:
+        validated_token = jwt_authentication.get_validated_token(raw_token)
+        return jwt_authentication.get_user(validated_token)
+    except (InvalidToken, AuthenticationFailed) as e:
+        logger.info(f"Rejected token: {str(e)}")
+        return None
+
+
+aget_user_from_token = sync_to_async(get_user_from_token)
+
+
+def get_raw_token_from_request(request, allow_query_token=False):
+    """
+    Read the token from the Authorization header.
+
+    Browsers cannot set headers on EventSource connections, so the event
+    stream passes allow_query_token to also accept ?token=. Everywhere else
+    the header is required, keeping tokens out of logged URLs.
+    """
+    header = jwt_authentication.get_header(request)
+    if header:
+        try:
+            raw_token = jwt_authentication.get_raw_token(header)
+        except AuthenticationFailed:
+            return None
+        if raw_token:
+            return raw_token
+
+    if allow_query_token:
+        return request.GET.get('token')
+    return None
+
+
+def get_raw_token_from_scope(scope):
+    """The header or ?token= token of a WebSocket connection's ASGI scope"""
+    headers = dict(scope.get('headers', []))
+    header = headers.get(b'authorization')
+    if header:
+        try:
+            raw_token = jwt_authentication.get_raw_token(header)
+        except AuthenticationFailed:
+            return None
+        if raw_token:
+            return raw_token
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    return query.get('token', [None])[0]
+
+
+async def aauthenticate_request(request, allow_query_token=False):
+    """Authenticate a plain Django request from async code"""
+    return await aget_user_from_token(get_raw_token_from_request(request, allow_query_token))
+
+
+METRICS_SCRAPER = 'metrics-scraper'
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accept 'Authorization: Bearer <METRICS_TOKEN>' so a Prometheus scraper
+    needs no staff account. Other headers fall through to JWT.
+    """
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = get_authorization_header(request).split()
+        if not token or len(header) != 2 or header[0].lower() != b'bearer':
+            return None
+        if not hmac.compare_digest(header[1], token.encode()):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="metrics"'
+
+
+class CanReadMetrics(BasePermission):
+    """Staff users, or a request carrying METRICS_TOKEN"""
+
+    def has_permission(self, request, view):
+        if request.auth == METRICS_SCRAPER:
+            return True
+        return bool(request.user and request.user.is_staff)
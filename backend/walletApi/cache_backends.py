@@ -0,0 +1,54 @@
+"""
+Cache backend wrapper counting hits and misses.
+
+CACHES['default'] uses InstrumentedCache with the real backend in
+CACHE_BACKEND; reads are counted in cache_requests_total and everything
+else is passed straight through.
+"""
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.module_loading import import_string
+from . import metrics
+
+cache_requests = metrics.counter(
+    'cache_requests_total', 'Cache reads by result (hit or miss)', ['result']
+)
+
+_missing = object()
+
+
+class InstrumentedCache:
+    def __init__(self, location, params):
+        params = dict(params)
+        self._cache = import_string(params.pop('CACHE_BACKEND'))(location, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def _count(self, hits, misses):
+        if hits:
+            cache_requests.inc(hits, result='hit')
+        if misses:
+            cache_requests.inc(misses, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = self._cache.get(key, _missing, version=version)
+        if value is _missing:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self._cache.get_many(keys, version=version)
+        self._count(len(values), len(keys) - len(values))
+        return values
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, _missing, version=version)
+        if value is _missing:
+            return self._cache.get_or_set(key, default, timeout=timeout, version=version)
+        return value
@@ -0,0 +1,305 @@
+"""
+Sub-categories for transfers (rent, food, family, utilities, other).
+
+Every transfer is transaction_category 'transfer', so the classifier
+labels what it was for from its narration, counterparty, amount and day
+of the month. Each of these becomes string features (narration words and
+word pairs, 'cp:<user id>', 'amt:<log2 bucket>', 'dom:<third of month>'),
+hashed with CRC32 into N_FEATURES buckets, and a multinomial Naive Bayes
+model scores them: one row of log likelihoods per feature, summed per
+transaction with NumPy.
+
+The model starts from SEED_EXAMPLES and the keywords on their own.
+train_from_ledger() adds transfers
+whose narration contains a keyword from KEYWORDS, which teaches it the
+counterparties and amounts that go with each label, and saves it to
+CATEGORIZER_MODEL_PATH for every process to load.
+
+A transaction is only given a label when it has evidence the model has
+seen (a known narration word or counterparty) and the label's posterior
+is at least CATEGORIZER_MIN_CONFIDENCE; otherwise it is 'other'.
+Transfers are labeled before their wallet rows are locked, in tens of
+microseconds once the model is loaded; label_range() labels stored
+transfers in batches for the label_transactions command.
+"""
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Max, Value, When
+from django.db.models.functions import Coalesce, ExtractDay
+from .models import Transaction, Wallet
+import logging
+
+logger = logging.getLogger(__name__)
+
+LABELS = ('rent', 'food', 'family', 'utilities', 'other')
+OTHER = 'other'
+
+N_FEATURES = 1 << 18
+# Small, since the hashed feature space is much larger than any training set
+SMOOTHING = 0.01
+UPDATE_BATCH_SIZE = 10000
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+# Words in every default narration, or in none in particular
+STOP_WORDS = frozenset({
+    'transfer', 'to', 'from', 'for', 'the', 'a', 'an', 'and', 'of', 'in', 'on', 'at', 'my', 'your', 'with', 'via',
+})
+
+KEYWORDS = {
+    'rent': {'rent', 'landlord', 'lease', 'tenancy', 'apartment', 'caretaker', 'agent', 'accommodation', 'hostel'},
+    'food': {'food', 'lunch', 'dinner', 'breakfast', 'groceries', 'grocery', 'restaurant', 'chops', 'suya',
+             'market', 'foodstuff', 'rice', 'pizza', 'snacks', 'meal', 'canteen', 'buka'},
+    'family': {'mum', 'mom', 'mummy', 'mother', 'dad', 'daddy', 'father', 'sister', 'brother', 'wife', 'husband',
+               'baby', 'son', 'daughter', 'family', 'aunty', 'uncle', 'grandma', 'upkeep', 'allowance', 'pocket'},
+    'utilities': {'electricity', 'nepa', 'light', 'prepaid', 'meter', 'water', 'gas', 'dstv', 'gotv', 'cable',
+                  'internet', 'wifi', 'data', 'airtime', 'waste', 'phcn', 'diesel'},
+}
+
+SEED_EXAMPLES = (
+    ('rent', 'house rent for january'), ('rent', 'rent payment'), ('rent', 'landlord balance'),
+    ('rent', 'shop rent'), ('rent', 'annual rent'), ('rent', 'rent and service charge'),
+    ('rent', 'caretaker fee'), ('rent', 'agent fee for apartment'), ('rent', 'hostel accommodation'),
+    ('rent', 'part payment of rent'), ('rent', 'lease renewal'), ('rent', 'monthly rent'),
+    ('food', 'lunch'), ('food', 'food money'), ('food', 'groceries'), ('food', 'dinner last night'),
+    ('food', 'foodstuff for the house'), ('food', 'market money'), ('food', 'suya and drinks'),
+    ('food', 'restaurant bill'), ('food', 'bag of rice'), ('food', 'breakfast'), ('food', 'pizza'),
+    ('food', 'canteen'), ('food', 'small chops for party'), ('food', 'snacks'),
+    ('family', 'for mum'), ('family', 'money for dad'), ('family', 'upkeep'), ('family', 'pocket money'),
+    ('family', 'allowance for my sister'), ('family', 'brother school fees'), ('family', 'wife upkeep'),
+    ('family', 'happy birthday mummy'), ('family', 'family support'), ('family', 'for the baby'),
+    ('family', 'daddy drugs'), ('family', 'aunty'), ('family', 'grandma'), ('family', 'sunday upkeep'),
+    ('utilities', 'electricity bill'), ('utilities', 'nepa bill'), ('utilities', 'prepaid meter'),
+    ('utilities', 'light bill'), ('utilities', 'water bill'), ('utilities', 'dstv subscription'),
+    ('utilities', 'gotv'), ('utilities', 'internet subscription'), ('utilities', 'wifi'),
+    ('utilities', 'gas refill'), ('utilities', 'waste management'), ('utilities', 'data subscription'),
+    ('utilities', 'diesel for generator'), ('utilities', 'cable tv'),
+    ('other', 'loan repayment'), ('other', 'refund'), ('other', 'balance'), ('other', 'contribution'),
+    ('other', 'ajo'), ('other', 'thanks'), ('other', 'business'), ('other', 'goods'), ('other', 'payment for job'),
+    ('other', 'transport fare'), ('other', 'school fees'), ('other', 'hospital bill'), ('other', 'gift'),
+    ('other', 'salary'), ('other', 'debt'), ('other', 'investment'), ('other', 'church offering'),
+)
+
+
+def words(narration):
+    return [word for word in TOKEN_PATTERN.findall((narration or '').lower()) if word not in STOP_WORDS]
+
+
+def features(narration, counterparty_id, amount, day):
+    """(hashed feature ids, evidence flags) for one transaction"""
+    tokens = words(narration)
+    names = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    if counterparty_id:
+        names.append(f"cp:{counterparty_id}")
+    evidence = len(names)
+    if amount is not None:
+        names.append(f"amt:{int(math.log2(float(amount) + 1))}")
+    if day:
+        names.append(f"dom:{min((day - 1) // 10, 2)}")
+    # Every row has at least one feature, which reduceat in predict() relies on
+    names.append('bias')
+    ids = [zlib.crc32(name.encode()) & (N_FEATURES - 1) for name in names]
+    return ids, [True] * evidence + [False] * (len(names) - evidence)
+
+
+def keyword_label(narration):
+    """The label whose keywords the narration uses, or None for none or several"""
+    found = {label for label, keywords in KEYWORDS.items() if keywords.intersection(words(narration))}
+    return found.pop() if len(found) == 1 else None
+
+
+class Categorizer:
+    """Multinomial Naive Bayes over hashed features"""
+
+    def __init__(self, log_prior, log_likelihood, known):
+        self.log_prior = log_prior            # (labels,)
+        self.log_likelihood = log_likelihood  # (N_FEATURES, labels), float32
+        self.known = known                    # (N_FEATURES,) bool, features seen in training
+
+    @classmethod
+    def fit(cls, examples):
+        """examples: iterable of (label, feature ids)"""
+        counts = np.zeros((N_FEATURES, len(LABELS)), dtype=np.float64)
+        documents = np.zeros(len(LABELS), dtype=np.float64)
+        rows, columns = [], []
+        for label, ids in examples:
+            column = LABELS.index(label)
+            documents[column] += 1
+            rows.extend(ids)
+            columns.extend([column] * len(ids))
+        np.add.at(counts, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), 1)
+
+        totals = counts.sum(axis=0) + SMOOTHING * N_FEATURES
+        log_likelihood = (np.log(counts + SMOOTHING) - np.log(totals)).astype(np.float32)
+        log_prior = np.log((documents + 1) / (documents.sum() + len(LABELS)))
+        return cls(log_prior, log_likelihood, counts.sum(axis=1) > 0)
+
+    def predict(self, rows):
+        """Labels for rows of (narration, counterparty id, amount, day of month)"""
+        ids, evidence, starts = [], [], []
+        for narration, counterparty_id, amount, day in rows:
+            starts.append(len(ids))
+            row_ids, row_evidence = features(narration, counterparty_id, amount, day)
+            ids.extend(row_ids)
+            evidence.extend(row_evidence)
+        if not starts:
+            return []
+
+        ids = np.array(ids, dtype=np.int64)
+        starts = np.array(starts, dtype=np.int64)
+        scores = np.add.reduceat(self.log_likelihood[ids], starts, axis=0) + self.log_prior
+        seen = np.add.reduceat((self.known[ids] & np.array(evidence, dtype=bool)).astype(np.int32), starts) > 0
+
+        best = scores.argmax(axis=1)
+        # Posterior of the best label: 1 / sum(exp(score - best score))
+        confidence = 1.0 / np.exp(scores - scores.max(axis=1, keepdims=True)).sum(axis=1)
+        confident = seen & (confidence >= settings.CATEGORIZER_MIN_CONFIDENCE)
+        return [LABELS[label] if keep else OTHER for label, keep in zip(best.tolist(), confident.tolist())]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(temporary, 'wb') as handle:
+            np.savez(handle, log_prior=self.log_prior, log_likelihood=self.log_likelihood, known=self.known)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['log_prior'], data['log_likelihood'], data['known'])
+
+
+def seed_examples():
+    """SEED_EXAMPLES and every keyword on its own"""
+    texts = list(SEED_EXAMPLES)
+    texts.extend((label, keyword) for label, keywords in KEYWORDS.items() for keyword in sorted(keywords))
+    return [(label, features(text, None, None, None)[0]) for label, text in texts]
+
+
+_model = None
+_model_mtime = None
+_model_checked_at = 0.0
+_model_lock = threading.Lock()
+
+
+def model_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_model():
+    """
+    The saved model, or one fitted on SEED_EXAMPLES when there is none.
+
+    It is loaded once per process. The file is checked for a newer model
+    at most every CATEGORIZER_RELOAD_CHECK_SECONDS.
+    """
+    global _model, _model_mtime, _model_checked_at
+    now = time.monotonic()
+    if _model is not None and now - _model_checked_at < settings.CATEGORIZER_RELOAD_CHECK_SECONDS:
+        return _model
+
+    with _model_lock:
+        if _model is None or now - _model_checked_at >= settings.CATEGORIZER_RELOAD_CHECK_SECONDS:
+            path = settings.CATEGORIZER_MODEL_PATH
+            mtime = model_mtime(path)
+            if _model is None or mtime != _model_mtime:
+                _model = Categorizer.load(path) if mtime is not None else Categorizer.fit(seed_examples())
+                _model_mtime = mtime
+            _model_checked_at = now
+    return _model
+
+
+def categorize(narration, counterparty_id, amount, day):
+    """Sub-category for one transfer"""
+    return get_model().predict([(narration, counterparty_id, amount, day)])[0]
+
+
+def categorize_many(rows):
+    """Sub-categories for rows of (narration, counterparty id, amount, day of month), in one pass"""
+    return get_model().predict(rows)
+
+
+def labeled_rows(first_id, last_id, relabel=False):
+    """Transfers in [first_id, last_id] as (id, narration, counterparty id, amount, day of month)"""
+    queryset = Transaction.objects.filter(id__gte=first_id, id__lte=last_id, transaction_category='transfer')
+    if not relabel:
+        queryset = queryset.filter(sub_category='')
+    return (
+        queryset
+        .annotate(
+            counterparty_id=Coalesce(
+                Case(When(transaction_type='debit', then=F('recipient_id')), default=F('sender_id')),
+                Value(0), output_field=BigIntegerField()
+            ),
+            day=ExtractDay('created_at'),
+        )
+        .order_by()
+        .values_list('id', 'narration', 'counterparty_id', 'amount', 'day')
+    )
+
+
+def train_from_ledger(limit=500000):
+    """Fit on SEED_EXAMPLES and keyword-labeled transfers, save, and return the model"""
+    examples = seed_examples()
+    seeded = len(examples)
+    matched = 0
+    last_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+    recent = labeled_rows(0, last_id, relabel=True).exclude(narration='').order_by('-id')[:limit]
+    for _, narration, counterparty_id, amount, day in recent.iterator(chunk_size=10000):
+        label = keyword_label(narration)
+        if label:
+            examples.append((label, features(narration, counterparty_id, amount, day)[0]))
+            matched += 1
+
+    model = Categorizer.fit(examples)
+    model.save(settings.CATEGORIZER_MODEL_PATH)
+    logger.info(f"Categorizer trained on {seeded} seed and {matched} ledger examples")
+    return model, matched
+
+
+def label_range(first_id, last_id, relabel=False, dry_run=False):
+    """
+    Label the transfers in [first_id, last_id] that have no sub-category
+    (all of them with relabel=True). Returns {label: count}.
+
+    The version of every wallet whose transfers changed label is bumped,
+    so history ETags and stored insights pick up the new labels.
+    """
+    rows = list(labeled_rows(first_id, last_id, relabel))
+    if not rows:
+        return {}
+    labels = get_model().predict([row[1:] for row in rows])
+
+    by_label = {}
+    for (transaction_id, *_), label in zip(rows, labels):
+        by_label.setdefault(label, []).append(transaction_id)
+
+    if not dry_run:
+        wallet_ids = set()
+        with transaction.atomic():
+            for label, ids in by_label.items():
+                for offset in range(0, len(ids), UPDATE_BATCH_SIZE):
+                    changed = (
+                        Transaction.objects
+                        .filter(id__in=ids[offset:offset + UPDATE_BATCH_SIZE])
+                        .exclude(sub_category=label)
+                    )
+                    wallet_ids.update(changed.values_list('wallet_id', flat=True))
+                    changed.update(sub_category=label)
+            wallet_ids = sorted(wallet_ids)
+            for offset in range(0, len(wallet_ids), UPDATE_BATCH_SIZE):
+                Wallet.objects.filter(id__in=wallet_ids[offset:offset + UPDATE_BATCH_SIZE]).update(
+                    version=F('version') + 1
+                )
+    return {label: len(ids) for label, ids in by_label.items()}
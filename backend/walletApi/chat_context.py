@@ -0,0 +1,122 @@
+"""
+Conversation context for AI chat turns.
+
+The prompt carries the most recent messages that fit in
+AI_HISTORY_TOKEN_BUDGET, newest first, so long sessions cost a bounded
+number of tokens per turn. Turns that fall out of the window are folded
+into a rolling summary stored on the session. Each message is folded
+once, when it first drops out, and the oldest summary lines are dropped
+to keep the summary within AI_SUMMARY_TOKEN_BUDGET.
+
+Token counts come from tiktoken when it is installed and from a
+characters/4 estimate otherwise.
+"""
+from functools import lru_cache
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Chat completion framing overhead per message, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 200
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def to_chat_message(message):
+    role = "user" if message.message_type == "user" else "assistant"
+    return {"role": role, "content": message.content}
+
+
+def summary_line(message):
+    speaker = "User" if message.message_type == "user" else "Assistant"
+    text = ' '.join(message.content.split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS - 3] + '...'
+    return f"{speaker}: {text}"
+
+
+def fold_into_summary(summary, messages):
+    """Append one line per message, dropping the oldest lines beyond the summary budget"""
+    lines = summary.splitlines() if summary else []
+    lines.extend(summary_line(message) for message in messages)
+
+    budget = settings.AI_SUMMARY_TOKEN_BUDGET
+    total = sum(count_tokens(line) for line in lines)
+    while lines and total > budget:
+        total -= count_tokens(lines.pop(0))
+    return '\n'.join(lines)
+
+
+def build_history(chat_session, user_message):
+    """
+    Chat messages for the prompt: the rolling summary, recent turns, then
+    the new user message (not saved yet).
+
+    The new message is always included, even alone over budget. Messages
+    that fell out of the window since the last turn are folded into the
+    session summary here.
+    """
+    budget = settings.AI_HISTORY_TOKEN_BUDGET
+    used = count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+
+    recent = []
+    if chat_session.total_messages:
+        recent = list(
+            chat_session.messages
+            .filter(message_type__in=['user', 'ai'], id__gt=chat_session.summarized_through)
+            .only('id', 'message_type', 'content')
+            .order_by('-id')[:settings.AI_HISTORY_MAX_MESSAGES]
+        )
+
+    window = []
+    for message in recent:
+        cost = count_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        window.append(message)
+        used += cost
+
+    # Fold anything older than the window, including what the row limit cut off
+    if len(window) < len(recent) or len(recent) == settings.AI_HISTORY_MAX_MESSAGES:
+        older = chat_session.messages.filter(
+            message_type__in=['user', 'ai'],
+            id__gt=chat_session.summarized_through
+        )
+        if window:
+            older = older.filter(id__lt=window[-1].id)
+        dropped = list(older.only('id', 'message_type', 'content').order_by('id'))
+        if dropped:
+            chat_session.summary = fold_into_summary(chat_session.summary, dropped)
+            chat_session.summarized_through = dropped[-1].id
+            chat_session.save(update_fields=['summary', 'summarized_through'])
+            logger.info(f"Folded {len(dropped)} messages into summary for session {chat_session.session_id}")
+
+    messages = []
+    if chat_session.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of earlier messages in this conversation:\n{chat_session.summary}"
+        })
+    messages.extend(to_chat_message(message) for message in reversed(window))
+    messages.append({"role": "user", "content": user_message})
+    return messages
@@ -0,0 +1,79 @@
+from django.utils.functional import cached_property
+from authApi.models import CustomUser
+
+RELATIONS = ('wallet', 'profile', 'transaction_pin')
+# User columns are already on request.user; only the related rows are read
+USER_FIELDS = tuple(field.name for field in CustomUser._meta.concrete_fields if not field.primary_key)
+
+
+class WalletContext:
+    """
+    The authenticated user with wallet, profile and transaction PIN attached.
+
+    The user is the one authentication already loaded onto request.user.
+    Its wallet, profile and PIN are read by one select_related query the
+    first time they are needed during a request and cached on that user, so
+    views, serializers and helpers such as verify_transaction_pin share the
+    same objects instead of re-querying.
+    """
+
+    def __init__(self, user):
+        self._user = user
+        self.user_id = user.pk
+
+    @cached_property
+    def user(self):
+        user = self._user
+        missing = [name for name in RELATIONS if not getattr(CustomUser, name).is_cached(user)]
+        if missing:
+            loaded = CustomUser.objects.select_related(*missing).defer(*USER_FIELDS).get(pk=user.pk)
+            for name in missing:
+                related = getattr(CustomUser, name).related
+                value = related.get_cached_value(loaded)
+                if value is not None:
+                    # Point the related row back at the full user, not the deferred copy
+                    related.field.set_cached_value(value, user)
+                related.set_cached_value(user, value)
+        return user
+
+    @property
+    def wallet(self):
+        """Raises Wallet.DoesNotExist when the user has no wallet"""
+        return self.user.wallet
+
+    @property
+    def profile(self):
+        return getattr(self.user, 'profile', None)
+
+    @property
+    def transaction_pin(self):
+        return getattr(self.user, 'transaction_pin', None)
+
+    @property
+    def has_pin(self):
+        pin = self.transaction_pin
+        return pin is not None and pin.is_active
+
+
+def get_wallet_context(request):
+    """Return the WalletContext memoized on the request"""
+    context = getattr(request, '_wallet_context', None)
+    if context is None or context.user_id != request.user.pk:
+        context = WalletContext(request.user)
+        request._wallet_context = context
+    return context
+
+
+class WalletContextMixin:
+    """DRF view mixin exposing the request-scoped WalletContext"""
+
+    @property
+    def wallet_context(self):
+        return get_wallet_context(self.request)
+
+    def get_serializer_context(self):
+        """Serializer context carrying the WalletContext, for serializers that show the caller"""
+        parent = getattr(super(), 'get_serializer_context', None)
+        context = parent() if parent else {'request': self.request, 'view': self}
+        context['wallet_context'] = self.wallet_context
+        return context
@@ -0,0 +1,171 @@
+"""
+Human escalation queue for support chats.
+
+When a chat turn escalates a session, a ticket is queued with a priority
+from 0 to 100 built from the user's sentiment and wallet balance. The
+priority sets the ticket's answer-by time (due_at), between
+ESCALATION_MIN_WAIT_SECONDS and ESCALATION_MAX_WAIT_SECONDS after it was
+queued. Agents are served in due_at order, so urgent tickets jump ahead
+while a waiting ticket's position only improves as newer ones arrive
+behind it; wait time needs no periodic rescoring.
+
+Queued tickets are covered by a partial index on due_at, so claiming the
+next ticket reads one index entry. The claim locks it with SKIP LOCKED so
+concurrent agents each get a different ticket, and the status change is
+conditional on the ticket still being queued for databases that do not
+support row locks.
+"""
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from . import metrics
+from .models import CustomerServiceChat, EscalationTicket, Wallet
+import logging
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_WEIGHT = 0.6
+VALUE_WEIGHT = 0.4
+CLAIM_ATTEMPTS = 3
+
+escalation_events = metrics.counter(
+    'escalation_tickets_total', 'Escalation tickets by event', ['event']
+)
+escalation_wait = metrics.histogram(
+    'escalation_wait_seconds', 'Time from queueing to an agent claiming a ticket',
+    buckets=(30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 14400)
+)
+queue_depth = metrics.gauge(
+    'escalation_queue_depth', 'Escalation tickets waiting for an agent'
+)
+oldest_wait = metrics.gauge(
+    'escalation_oldest_wait_seconds', 'Age of the oldest ticket waiting for an agent'
+)
+
+
+def escalation_priority(sentiment, balance):
+    """0-100: lower sentiment and higher wallet balance rank higher"""
+    unhappiness = 1 - (sentiment if sentiment is not None else 0.5)
+    high_value = settings.ESCALATION_HIGH_VALUE_BALANCE
+    value = min(math.log1p(max(float(balance or 0), 0)) / math.log1p(high_value), 1) if high_value > 0 else 0
+    return round(100 * (SENTIMENT_WEIGHT * unhappiness + VALUE_WEIGHT * value))
+
+
+def answer_by(priority, enqueued_at):
+    max_wait = settings.ESCALATION_MAX_WAIT_SECONDS
+    min_wait = settings.ESCALATION_MIN_WAIT_SECONDS
+    return enqueued_at + timedelta(seconds=max_wait - (max_wait - min_wait) * priority / 100)
+
+
+def enqueue_escalation(chat_session, sentiment=None):
+    """Queue the session for a human agent; a session already waiting keeps its place"""
+    balance = Wallet.objects.filter(user_id=chat_session.user_id).values_list('balance', flat=True).first()
+    if sentiment is None:
+        sentiment = chat_session.sentiment_score
+    elif chat_session.sentiment_score is not None:
+        sentiment = min(sentiment, chat_session.sentiment_score)
+
+    now = timezone.now()
+    priority = escalation_priority(sentiment, balance)
+    fields = {
+        'user_id': chat_session.user_id,
+        'status': 'queued',
+        'priority': priority,
+        'due_at': answer_by(priority, now),
+        'enqueued_at': now,
+        'claimed_by': None,
+        'claimed_at': None,
+        'resolved_at': None,
+        'resolution_note': '',
+    }
+
+    ticket, created = EscalationTicket.objects.get_or_create(chat=chat_session, defaults=fields)
+    if not created:
+        if ticket.status != 'resolved':
+            return ticket
+        # Escalated again after an agent closed it
+        EscalationTicket.objects.filter(pk=ticket.pk, status='resolved').update(**fields)
+        ticket.refresh_from_db()
+
+    escalation_events.inc(event='queued')
+    logger.info(f"Queued escalation for session {chat_session.session_id} with priority {priority}")
+    return ticket
+
+
+def claim_next(agent):
+    """Assign the most urgent queued ticket to the agent; None if the queue is empty"""
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            ticket = (
+                EscalationTicket.objects
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('chat', 'user')
+                .filter(status='queued')
+                .order_by('due_at')
+                .first()
+            )
+            if ticket is None:
+                return None
+
+            now = timezone.now()
+            claimed = EscalationTicket.objects.filter(pk=ticket.pk, status='queued').update(
+                status='claimed', claimed_by=agent, claimed_at=now
+            )
+        if not claimed:
+            # Taken by another agent between the read and the update
+            continue
+
+        ticket.status = 'claimed'
+        ticket.claimed_by = agent
+        ticket.claimed_at = now
+        escalation_events.inc(event='claimed')
+        escalation_wait.observe((now - ticket.enqueued_at).total_seconds())
+        logger.info(f"Agent {agent.pk} claimed escalation for session {ticket.chat.session_id}")
+        return ticket
+
+    return None
+
+
+def resolve_ticket(ticket, note=''):
+    """Close a claimed ticket and its chat session"""
+    now = timezone.now()
+    with transaction.atomic():
+        EscalationTicket.objects.filter(pk=ticket.pk).update(
+            status='resolved', resolved_at=now, resolution_note=note
+        )
+        CustomerServiceChat.objects.filter(pk=ticket.chat_id).update(status='resolved', ended_at=now)
+
+    ticket.status = 'resolved'
+    ticket.resolved_at = now
+    ticket.resolution_note = note
+    escalation_events.inc(event='resolved')
+    logger.info(f"Resolved escalation {ticket.pk} for chat {ticket.chat_id}")
+    return ticket
+
+
+def queue_stats():
+    """Depth, overdue count and oldest wait of the queue, in one indexed query"""
+    now = timezone.now()
+    stats = EscalationTicket.objects.filter(status='queued').aggregate(
+        depth=Count('id'),
+        overdue=Count('id', filter=Q(due_at__lte=now)),
+        oldest=Min('enqueued_at'),
+    )
+    return {
+        'depth': stats['depth'],
+        'overdue': stats['overdue'],
+        'oldest_wait_seconds': int((now - stats['oldest']).total_seconds()) if stats['oldest'] else 0,
+    }
+
+
+def collect_queue_gauges():
+    """Set both queue gauges from one queue_stats() query per /metrics render"""
+    stats = queue_stats()
+    queue_depth.set(stats['depth'])
+    oldest_wait.set(stats['oldest_wait_seconds'])
+
+
+metrics.on_render(collect_queue_gauges, queue_depth, oldest_wait)
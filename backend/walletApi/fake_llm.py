@@ -0,0 +1,185 @@
+"""
+Local OpenAI-compatible chat completions server for offline runs.
+
+Serves POST /v1/chat/completions, plain or streamed, on a loopback port
+with configurable latency and error rate (also mid-stream), so the chat path can be timed
+and replayed without network access or an API key. The reply text is
+fixed. Token usage is estimated from the request at four characters per
+token. A system prompt prefix that was seen before is reported as cached
+prompt tokens, like a provider's prompt cache, if it is at least
+CACHE_MIN_TOKENS long.
+
+Used by the replay_chats command, and runnable on its own with
+manage.py fake_llm_server.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_TEXT = "Thanks for reaching out to Swift Wallet support. Here is how you can do that in the app."
+# OpenAI does not cache shorter prompts
+CACHE_MIN_TOKENS = 1024
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle's
+    # algorithm and delayed ACKs add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+            return
+
+        server.record_request(request)
+        time.sleep(server.sample_latency())
+
+        if server.should_fail():
+            self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            return
+
+        usage = server.usage_for(request)
+        if request.get('stream'):
+            self.stream_reply(request, usage)
+        else:
+            self.send_json(200, {
+                'id': f"chatcmpl-fake-{server.request_count}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': REPLY_TEXT},
+                }],
+                'usage': usage,
+            })
+
+    def stream_reply(self, request, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        base = {
+            'id': f"chatcmpl-fake-{self.server.request_count}",
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+        }
+        words = REPLY_TEXT.split(' ')
+        for index, word in enumerate(words):
+            if index == self.server.fail_after_chunks:
+                # How the provider reports an error once the stream has started
+                error = {'error': {'message': 'Injected stream failure', 'type': 'server_error'}}
+                self.wfile.write(f"data: {json.dumps(error)}\n\n".encode())
+                self.wfile.flush()
+                return
+            content = word if index == 0 else ' ' + word
+            chunk = dict(base, choices=[{'index': 0, 'delta': {'content': content}, 'finish_reason': None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+
+        final = dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+        if (request.get('stream_options') or {}).get('include_usage'):
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=200, jitter_ms=50, error_rate=0.0, chunk_delay_ms=10, seed=None,
+                 fail_after_chunks=None):
+        super().__init__(('127.0.0.1', port), FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay_ms / 1000
+        # Streams send this many chunks, then an error event
+        self.fail_after_chunks = fail_after_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.request_count = 0
+        self.models = {}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def record_request(self, request):
+        with self._lock:
+            self.request_count += 1
+            model = request.get('model', '')
+            self.models[model] = self.models.get(model, 0) + 1
+
+    def sample_latency(self):
+        with self._lock:
+            latency = self._random.gauss(self.latency_ms, self.jitter_ms) if self.jitter_ms else self.latency_ms
+        return max(latency, 0) / 1000
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def usage_for(self, request):
+        messages = request.get('messages', [])
+        prompt_tokens = sum(estimate_tokens(message.get('content') or '') + 4 for message in messages)
+
+        cached_tokens = 0
+        if messages and messages[0].get('role') == 'system':
+            prefix = messages[0].get('content') or ''
+            with self._lock:
+                if prefix in self._seen_prefixes and estimate_tokens(prefix) >= CACHE_MIN_TOKENS:
+                    cached_tokens = estimate_tokens(prefix)
+                self._seen_prefixes.add(prefix)
+
+        completion_tokens = estimate_tokens(REPLY_TEXT)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        }
+
+    def start(self):
+        """Serve from a background thread; returns self"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,375 @@
+"""
+Spending insights computed with NumPy.
+
+A wallet's completed transactions over the last INSIGHTS_HISTORY_DAYS are
+loaded once into flat arrays (amounts in integer minor units, local
+timestamps, category codes, counterparties), and every insight is a
+vectorized reduction over them: category breakdown, weekday and hour
+histograms, daily spend with moving averages, month-over-month changes
+and recurring payments.
+
+Results are stored in SpendingInsight with the wallet version they were
+computed at, so the endpoint recomputes only after a ledger write or on
+a new day. The compute_insights command precomputes them for all users,
+loading transactions for a chunk of wallets per query.
+"""
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+import numpy as np
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, F, Func, IntegerField, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+from .models import SpendingInsight, Transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transfers labeled by walletApi.categorizer count under their sub-category; 'other' stays 'transfer'
+SUB_CATEGORY_NAMES = [name for name, _ in Transaction.SUB_CATEGORIES if name != 'other']
+CATEGORY_NAMES = [name for name, _ in Transaction.TRANSACTION_CATEGORIES] + SUB_CATEGORY_NAMES
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORY_NAMES)}
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+SECONDS_PER_DAY = 86400
+DAILY_SERIES_DAYS = 30
+LONGEST_AVERAGE_DAYS = 90
+MONTHS_SHOWN = 12
+
+# Recurring payments: typical cadences in days and how far intervals may stray
+CADENCES = ((7, 'weekly', 2), (14, 'fortnightly', 3), (30.44, 'monthly', 4), (91.31, 'quarterly', 10), (365.25, 'yearly', 20))
+MIN_OCCURRENCES = 3
+AMOUNT_TOLERANCE = 0.1
+
+
+class TransactionArrays(NamedTuple):
+    """Completed transactions of one wallet, oldest first"""
+    local_ts: np.ndarray      # int64 seconds since the epoch, shifted to local time
+    amount_minor: np.ndarray  # int64 amount in minor units (cents)
+    is_debit: np.ndarray      # bool
+    category: np.ndarray      # int8 index into CATEGORY_NAMES
+    counterparty: np.ndarray  # int64 user id on the other side, 0 when none
+
+    @property
+    def day(self):
+        """Local day number since 1970-01-01"""
+        return self.local_ts // SECONDS_PER_DAY
+
+    def __len__(self):
+        return len(self.amount_minor)
+
+
+def history_start():
+    return timezone.now() - timedelta(days=settings.INSIGHTS_HISTORY_DAYS)
+
+
+def to_local_seconds(utc_seconds):
+    """Shift UTC epoch seconds to the current time zone, resolving the offset once per distinct hour"""
+    if not len(utc_seconds):
+        return utc_seconds
+    tz = timezone.get_current_timezone()
+    hours, inverse = np.unique(utc_seconds // 3600, return_inverse=True)
+    offsets = np.fromiter(
+        (datetime.fromtimestamp(int(hour) * 3600, tz).utcoffset().total_seconds() for hour in hours),
+        dtype=np.int64, count=len(hours)
+    )
+    return utc_seconds + offsets[inverse]
+
+
+class EpochSeconds(Func):
+    """Whole seconds since the Unix epoch of a datetime column"""
+    output_field = BigIntegerField()
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                              **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='CAST(UNIX_TIMESTAMP(%(expressions)s) AS SIGNED)',
+                              **extra_context)
+
+
+def transaction_rows(wallet_ids, since):
+    """
+    One tuple of integers per transaction, converted by the database so
+    the rows can go straight into an array: wallet id, UTC epoch seconds,
+    amount in minor units, debit flag, category code and counterparty.
+    """
+    return (
+        Transaction.objects
+        .filter(wallet_id__in=wallet_ids, status='completed', created_at__gte=since)
+        .annotate(
+            epoch=EpochSeconds('created_at'),
+            amount_minor=Cast(Round(F('amount') * 100), BigIntegerField()),
+            debit=Case(When(transaction_type='debit', then=Value(1)), default=Value(0), output_field=IntegerField()),
+            category_code=Case(
+                *(
+                    When(transaction_category='transfer', sub_category=name, then=Value(CATEGORY_CODES[name]))
+                    for name in SUB_CATEGORY_NAMES
+                ),
+                *(
+                    When(transaction_category=name, then=Value(CATEGORY_CODES[name]))
+                    for name, _ in Transaction.TRANSACTION_CATEGORIES
+                ),
+                default=Value(0), output_field=IntegerField()
+            ),
+            # The other party: the recipient of a debit, the sender of a credit
+            counterparty_id=Coalesce(
+                Case(When(transaction_type='debit', then=F('recipient_id')), default=F('sender_id')),
+                Value(0), output_field=BigIntegerField()
+            ),
+        )
+        .order_by('wallet_id', 'created_at', 'id')
+        .values_list('wallet_id', 'epoch', 'amount_minor', 'debit', 'category_code', 'counterparty_id')
+    )
+
+
+def rows_to_arrays(rows):
+    """(wallet_id array, TransactionArrays) for rows from transaction_rows()"""
+    table = np.array(rows, dtype=np.int64).reshape(-1, 6)
+    arrays = TransactionArrays(
+        local_ts=to_local_seconds(table[:, 1]),
+        amount_minor=table[:, 2].copy(),
+        is_debit=table[:, 3].astype(bool),
+        category=table[:, 4].astype(np.int8),
+        counterparty=table[:, 5].copy(),
+    )
+    return table[:, 0].copy(), arrays
+
+
+def load_wallet_transactions(wallet_id):
+    _, arrays = rows_to_arrays(list(transaction_rows([wallet_id], history_start())))
+    return arrays
+
+
+def load_chunk(wallet_ids):
+    """{wallet_id: TransactionArrays} for several wallets from one query"""
+    ids, arrays = rows_to_arrays(list(transaction_rows(wallet_ids, history_start())))
+    chunk = {}
+    if len(ids):
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+        for start, end in zip(starts, ends):
+            chunk[int(ids[start])] = TransactionArrays(*(column[start:end] for column in arrays))
+    empty = TransactionArrays(*(column[:0] for column in arrays))
+    for wallet_id in wallet_ids:
+        chunk.setdefault(wallet_id, empty)
+    return chunk
+
+
+def major(minor):
+    return round(float(minor) / 100, 2)
+
+
+def day_to_date(day):
+    return date(1970, 1, 1) + timedelta(days=int(day))
+
+
+def category_breakdown(arrays):
+    debit = arrays.is_debit
+    sums = np.bincount(arrays.category[debit], weights=arrays.amount_minor[debit], minlength=len(CATEGORY_NAMES))
+    counts = np.bincount(arrays.category[debit], minlength=len(CATEGORY_NAMES))
+    total = sums.sum()
+    order = np.argsort(-sums, kind='stable')
+    return [
+        {
+            'category': CATEGORY_NAMES[code],
+            'amount': major(sums[code]),
+            'count': int(counts[code]),
+            'share': round(float(sums[code] / total) * 100, 1) if total else 0.0,
+        }
+        for code in order if counts[code]
+    ]
+
+
+def time_histograms(arrays):
+    debit = arrays.is_debit
+    seconds = arrays.local_ts[debit]
+    amounts = arrays.amount_minor[debit]
+    # 1970-01-01 was a Thursday
+    weekday = (seconds // SECONDS_PER_DAY + 3) % 7
+    hour = (seconds % SECONDS_PER_DAY) // 3600
+    by_weekday = np.bincount(weekday, weights=amounts, minlength=7)
+    by_hour = np.bincount(hour, weights=amounts, minlength=24)
+    return (
+        [{'day': name, 'amount': major(value)} for name, value in zip(WEEKDAYS, by_weekday)],
+        [major(value) for value in by_hour],
+    )
+
+
+def daily_spend(arrays, today):
+    """Spend per day for the last DAILY_SERIES_DAYS days, with 7 and 30 day moving averages"""
+    first = today - (DAILY_SERIES_DAYS + LONGEST_AVERAGE_DAYS) + 1
+    debit = arrays.is_debit
+    days = arrays.day[debit]
+    in_range = days >= first
+    series = np.bincount(
+        days[in_range] - first, weights=arrays.amount_minor[debit][in_range], minlength=today - first + 1
+    )[:today - first + 1]
+
+    cumulative = np.r_[0.0, np.cumsum(series)]
+
+    def moving_average(window):
+        # Average of the window ending on each day of the series
+        return (cumulative[window:] - cumulative[:-window]) / window
+
+    ma7 = moving_average(7)[-DAILY_SERIES_DAYS:]
+    ma30 = moving_average(30)[-DAILY_SERIES_DAYS:]
+    recent = series[-DAILY_SERIES_DAYS:]
+
+    return (
+        [
+            {'date': day_to_date(today - DAILY_SERIES_DAYS + 1 + index).isoformat(),
+             'amount': major(recent[index]), 'avg_7d': major(ma7[index]), 'avg_30d': major(ma30[index])}
+            for index in range(DAILY_SERIES_DAYS)
+        ],
+        {
+            '7_day': major(moving_average(7)[-1]),
+            '30_day': major(moving_average(30)[-1]),
+            '90_day': major(moving_average(LONGEST_AVERAGE_DAYS)[-1]),
+        },
+    )
+
+
+def monthly_changes(arrays, today):
+    """Spent and received for the last MONTHS_SHOWN months, with the change in spend from the month before"""
+    months = arrays.day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    current = np.datetime64(day_to_date(today), 'M').astype(np.int64)
+    first = current - MONTHS_SHOWN  # one extra month for the first change
+    in_range = months >= first
+    index = months[in_range] - first
+    amounts = arrays.amount_minor[in_range]
+    debit = arrays.is_debit[in_range]
+
+    spent = np.bincount(index[debit], weights=amounts[debit], minlength=MONTHS_SHOWN + 1)
+    received = np.bincount(index[~debit], weights=amounts[~debit], minlength=MONTHS_SHOWN + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(spent[:-1] > 0, (spent[1:] - spent[:-1]) / spent[:-1] * 100, np.nan)
+
+    return [
+        {
+            'month': str(np.datetime64(int(first + offset + 1), 'M')),
+            'spent': major(spent[offset + 1]),
+            'received': major(received[offset + 1]),
+            'spent_change_pct': None if np.isnan(change[offset]) else round(float(change[offset]), 1),
+        }
+        for offset in range(MONTHS_SHOWN)
+    ]
+
+
+def recurring_payments(arrays, today):
+    """
+    Debits repeating at a regular cadence with a steady amount.
+
+    Payments are grouped by category and counterparty (and exact amount
+    when there is no counterparty, as for bills). Within each group the
+    gaps between payments must stay close to one of CADENCES, amounts
+    within AMOUNT_TOLERANCE of their mean, and the last payment must be
+    recent enough for the next one to still be expected.
+    """
+    debit = arrays.is_debit
+    if debit.sum() < MIN_OCCURRENCES:
+        return []
+
+    days = arrays.day[debit]
+    amounts = arrays.amount_minor[debit]
+    counterparty = arrays.counterparty[debit]
+    keys = np.stack([
+        arrays.category[debit].astype(np.int64),
+        counterparty,
+        np.where(counterparty == 0, amounts, 0),
+    ], axis=1)
+    _, group = np.unique(keys, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+
+    order = np.lexsort((days, group))
+    group, days, amounts = group[order], days[order], amounts[order]
+    categories, counterparty = arrays.category[debit][order], counterparty[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    counts = np.diff(np.r_[starts, len(group)])
+
+    # Gaps between consecutive payments; the first gap of each group is not one
+    gaps = np.diff(days, prepend=days[0]).astype(np.float64)
+    gaps[starts] = 0
+    gap_sums = np.add.reduceat(gaps, starts)
+    mean_gap = np.divide(gap_sums, counts - 1, out=np.zeros(len(starts)), where=counts > 1)
+    mean_amount = np.add.reduceat(amounts.astype(np.float64), starts) / counts
+
+    per_row_gap = np.abs(gaps - np.repeat(mean_gap, counts))
+    per_row_gap[starts] = 0
+    gap_spread = np.maximum.reduceat(per_row_gap, starts)
+    amount_spread = np.maximum.reduceat(np.abs(amounts - np.repeat(mean_amount, counts)), starts) / mean_amount
+    last_day = days[np.r_[starts[1:], len(days)] - 1]
+
+    found = []
+    candidates = np.flatnonzero((counts >= MIN_OCCURRENCES) & (amount_spread <= AMOUNT_TOLERANCE))
+    for index in candidates:
+        for cadence, label, tolerance in CADENCES:
+            if abs(mean_gap[index] - cadence) <= tolerance and gap_spread[index] <= tolerance:
+                next_day = int(last_day[index] + round(mean_gap[index]))
+                if next_day + tolerance < today:
+                    break  # lapsed
+                first_row = starts[index]
+                found.append({
+                    'category': CATEGORY_NAMES[categories[first_row]],
+                    'counterparty_id': int(counterparty[first_row]) or None,
+                    'amount': major(mean_amount[index]),
+                    'cadence': label,
+                    'occurrences': int(counts[index]),
+                    'last_paid': day_to_date(last_day[index]).isoformat(),
+                    'next_expected': day_to_date(next_day).isoformat(),
+                })
+                break
+
+    found.sort(key=lambda item: item['next_expected'])
+    return found
+
+
+def compute_insights(arrays, today=None):
+    """Insights for one wallet's TransactionArrays, as a JSON-ready dict"""
+    if today is None:
+        today = (timezone.localdate() - date(1970, 1, 1)).days
+
+    debit = arrays.is_debit
+    by_weekday, by_hour = time_histograms(arrays)
+    daily, moving_averages = daily_spend(arrays, today)
+
+    return {
+        'history_days': settings.INSIGHTS_HISTORY_DAYS,
+        'as_of': day_to_date(today).isoformat(),
+        'totals': {
+            'spent': major(arrays.amount_minor[debit].sum()),
+            'received': major(arrays.amount_minor[~debit].sum()),
+            'transactions': len(arrays),
+        },
+        'categories': category_breakdown(arrays),
+        'by_weekday': by_weekday,
+        'by_hour': by_hour,
+        'daily_spend': daily,
+        'moving_averages': moving_averages,
+        'monthly': monthly_changes(arrays, today),
+        'recurring': recurring_payments(arrays, today),
+    }
+
+
+def is_current(insight, wallet):
+    return (
+        insight.wallet_version == wallet.version
+        and timezone.localdate(insight.computed_at) == timezone.localdate()
+    )
+
+
+def get_wallet_insights(wallet):
+    """Stored insights if nothing changed since they were computed, otherwise compute and store them"""
+    insight = SpendingInsight.objects.filter(user_id=wallet.user_id).first()
+    if insight and is_current(insight, wallet):
+        return insight.data
+
+    arrays = load_wallet_transactions(wallet.id)
+    data = compute_insights(arrays)
+    SpendingInsight.objects.update_or_create(
+        user_id=wallet.user_id,
+        defaults={'wallet_version': wallet.version, 'transactions': len(arrays), 'data': data}
+    )
+    return data
@@ -0,0 +1,176 @@
+"""
+Keyword intent classification for support messages.
+
+Every keyword list used by the support flow (mock reply rules, issue
+categories, sentiment words, resolution and escalation phrases) is
+compiled at import into one regular expression. A single scan of the
+lowercased message finds every keyword it contains, and classify()
+derives all of the results from that one scan.
+
+Keywords match as plain substrings, as the original keyword scans did.
+The pattern is a zero-width lookahead tried at every position, built as
+a trie so each position costs a few character tests. Each keyword also
+implies every keyword that is a substring of it ("thanks" implies
+"thank"), so overlapping and nested keywords are all found. Found
+keywords are collected as a bitmask and every rule is a mask test.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# Checked in order; the first rule whose keyword groups all match picks the
+# mock reply. A group matches when any of its keywords is in the message.
+MOCK_RULES = [
+    ('balance', [['balance']]),
+    ('send_money', [['send money', 'transfer']]),
+    ('add_money', [['add money', 'deposit']]),
+    ('transaction_history', [['transaction'], ['history', 'view']]),
+    ('pin', [['pin']]),
+    ('limits', [['limit', 'maximum']]),
+    ('help', [['help', 'problem', 'issue']]),
+    ('greeting', [['hello', 'hi', 'hey']]),
+    ('thanks', [['thank', 'thanks']]),
+]
+
+MOCK_REPLIES = {
+    'balance': "To check your balance, go to the Dashboard or Wallet section in the app. Your current balance is displayed at the top.",
+    'send_money': "To send money: 1) Go to Send Money, 2) Enter recipient's phone or account number, 3) Enter amount, 4) Confirm with your PIN. Minimum amount is $1.00.",
+    'add_money': "To add money to your wallet, go to Add Money section and choose your payment method. Minimum deposit is $10.00. Note: This is a demo app with simulated transactions.",
+    'transaction_history': "You can view all your transactions in the Transaction History section. Each transaction shows the amount, recipient/sender, date, and status.",
+    'pin': "Your transaction PIN is a 4-digit security code required for transfers. You can set or change it in Settings > Security > Transaction PIN.",
+    'limits': "Transaction limits: Minimum transfer $1, Maximum transfer $100,000. Minimum deposit $10. These limits ensure security and proper usage.",
+    'help': "I'm here to help! Common issues: failed transactions, login problems, or balance inquiries. Please describe your specific issue and I'll assist you.",
+    'greeting': "Hello! I'm your Swift Wallet assistant. How can I help you today? I can assist with transactions, balance inquiries, and app features.",
+    'thanks': "You're welcome! Is there anything else I can help you with? If not, have a great day!",
+    'default': "I understand you need assistance. Could you please provide more details about your question? I can help with transactions, balance, deposits, or app features.",
+}
+
+# Checked in order; the first category with a matching keyword wins
+ISSUE_CATEGORIES = {
+    'balance_inquiry': ['balance', 'how much', 'check balance'],
+    'transaction_issue': ['failed', 'pending', 'didn\'t receive', 'transaction error'],
+    'send_money': ['send money', 'transfer', 'pay someone'],
+    'add_money': ['add money', 'deposit', 'fund wallet'],
+    'pin_issue': ['forgot pin', 'reset pin', 'change pin', 'pin locked'],
+    'general_inquiry': ['how to', 'what is', 'explain'],
+}
+
+POSITIVE_WORDS = ['thank', 'great', 'good', 'helpful', 'appreciate', 'solved', 'fixed', 'excellent']
+NEGATIVE_WORDS = ['bad', 'terrible', 'awful', 'angry', 'frustrated', 'disappointed', 'useless', 'problem']
+
+RESOLVED_WORDS = ['thank', 'thanks', 'resolved', 'fixed', 'solved']
+ESCALATION_WORDS = ['speak to human', 'human agent', 'escalate', 'manager']
+
+
+class MessageIntent(NamedTuple):
+    category: str
+    positive_count: int
+    negative_count: int
+    resolved: bool
+    escalation: bool
+    mock_rule: str
+
+    @property
+    def sentiment(self):
+        """0-1, where 0 is negative and 1 is positive; 0.5 when no sentiment words match"""
+        total = self.positive_count + self.negative_count
+        if total == 0:
+            return 0.5
+        return self.positive_count / total
+
+    @property
+    def mock_reply(self):
+        return MOCK_REPLIES[self.mock_rule]
+
+
+def trie_pattern(keywords):
+    """Regex source matching any of the keywords, longest first, factored into a trie"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ending here is the shorter option, tried after the longer ones
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+ALL_KEYWORDS = sorted(set(
+    [keyword for _, groups in MOCK_RULES for group in groups for keyword in group]
+    + [keyword for keywords in ISSUE_CATEGORIES.values() for keyword in keywords]
+    + POSITIVE_WORDS + NEGATIVE_WORDS + RESOLVED_WORDS + ESCALATION_WORDS
+))
+KEYWORD_BITS = {keyword: 1 << position for position, keyword in enumerate(ALL_KEYWORDS)}
+KEYWORD_PATTERN = re.compile('(?=(' + trie_pattern(ALL_KEYWORDS) + '))')
+
+
+def keyword_mask(keywords):
+    mask = 0
+    for keyword in keywords:
+        mask |= KEYWORD_BITS[keyword]
+    return mask
+
+
+# A match implies every keyword contained in it
+MATCH_MASKS = {
+    keyword: keyword_mask(other for other in ALL_KEYWORDS if other in keyword)
+    for keyword in ALL_KEYWORDS
+}
+CATEGORY_MASKS = [(category, keyword_mask(keywords)) for category, keywords in ISSUE_CATEGORIES.items()]
+MOCK_RULE_MASKS = [(name, [keyword_mask(group) for group in groups]) for name, groups in MOCK_RULES]
+POSITIVE_MASK = keyword_mask(POSITIVE_WORDS)
+NEGATIVE_MASK = keyword_mask(NEGATIVE_WORDS)
+RESOLVED_MASK = keyword_mask(RESOLVED_WORDS)
+ESCALATION_MASK = keyword_mask(ESCALATION_WORDS)
+
+
+def find_keywords(message_lower):
+    """Bitmask of every known keyword contained in the lowercased message, in one scan"""
+    found = 0
+    for keyword in set(KEYWORD_PATTERN.findall(message_lower)):
+        found |= MATCH_MASKS[keyword]
+    return found
+
+
+@lru_cache(maxsize=4096)
+def classify_found(found):
+    """Derive every result from a keyword mask; few distinct masks occur, so results are cached"""
+    category = 'other'
+    for name, mask in CATEGORY_MASKS:
+        if found & mask:
+            category = name
+            break
+
+    mock_rule = 'default'
+    for name, masks in MOCK_RULE_MASKS:
+        if all(found & mask for mask in masks):
+            mock_rule = name
+            break
+
+    return MessageIntent(
+        category=category,
+        positive_count=(found & POSITIVE_MASK).bit_count(),
+        negative_count=(found & NEGATIVE_MASK).bit_count(),
+        resolved=bool(found & RESOLVED_MASK),
+        escalation=bool(found & ESCALATION_MASK),
+        mock_rule=mock_rule,
+    )
+
+
+@lru_cache(maxsize=1024)
+def classify(message):
+    """Classify one message; cached because a turn classifies the same text more than once"""
+    return classify_found(find_keywords(message.lower()))
+
+
+def classify_many(messages):
+    """Classify a batch of messages, e.g. for offline re-scoring"""
+    return [classify_found(find_keywords(message.lower())) for message in messages]
@@ -0,0 +1,296 @@
+"""
+Process-wide access to the LLM provider.
+
+One OpenAI client (one connection pool) per process for sync callers, and
+one AsyncOpenAI client per event loop, all with deadlines from settings.
+Every call goes through a guard that enforces:
+
+- a circuit breaker that opens when the recent error rate crosses
+  OPENAI_BREAKER_ERROR_RATE and fails fast until OPENAI_BREAKER_RESET_SECONDS
+  have passed, then lets a single probe call through;
+- a bulkhead capping in-flight calls at OPENAI_MAX_CONCURRENCY, so a slow
+  provider cannot tie up every worker.
+
+Callers catch LLMUnavailable and fall back to the mock responses.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+llm_requests = metrics.counter(
+    'llm_requests_total', 'LLM provider calls by outcome', ['outcome']
+)
+llm_latency = metrics.histogram(
+    'llm_request_duration_seconds', 'LLM provider call latency in seconds'
+)
+llm_in_flight = metrics.gauge(
+    'llm_in_flight_requests', 'LLM provider calls currently in flight'
+)
+llm_breaker_state = metrics.gauge(
+    'llm_circuit_breaker_state', 'LLM circuit breaker state (0 closed, 1 half open, 2 open)',
+    multiprocess_mode='max'
+)
+
+
+class LLMUnavailable(Exception):
+    """The provider is not configured, the breaker is open or the bulkhead is full"""
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over a sliding time window"""
+
+    def __init__(self, error_rate, min_calls, window_seconds, reset_seconds):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.reset_seconds = reset_seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = deque()
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        llm_breaker_state.set(BREAKER_STATES['closed'])
+
+    @property
+    def state(self):
+        return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            logger.warning(f"LLM circuit breaker {self._state} -> {state}")
+            self._state = state
+            llm_breaker_state.set(BREAKER_STATES[state])
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._set_state('half_open')
+
+            if self._state == 'half_open':
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+
+            return True
+
+    def cancel(self):
+        """The allowed call never reached the provider; free the half-open probe slot"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == 'half_open':
+                self._probe_in_flight = False
+                if success:
+                    self._outcomes.clear()
+                    self._set_state('closed')
+                else:
+                    self._opened_at = now
+                    self._set_state('open')
+                return
+
+            self._outcomes.append((now, success))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if calls >= self.min_calls and failures / calls >= self.error_rate:
+                self._opened_at = now
+                self._set_state('open')
+
+
+def is_provider_failure(error):
+    """Timeouts, connection errors, 429 and 5xx count against the breaker; bad requests do not"""
+    try:
+        import openai
+    except ImportError:
+        return True
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError, TimeoutError))
+
+
+class LLMClientManager:
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            error_rate=settings.OPENAI_BREAKER_ERROR_RATE,
+            min_calls=settings.OPENAI_BREAKER_MIN_CALLS,
+            window_seconds=settings.OPENAI_BREAKER_WINDOW_SECONDS,
+            reset_seconds=settings.OPENAI_BREAKER_RESET_SECONDS,
+        )
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphore = threading.BoundedSemaphore(settings.OPENAI_MAX_CONCURRENCY)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def configured(self):
+        return bool(settings.OPENAI_API_KEY)
+
+    def _client_options(self):
+        import httpx
+
+        return {
+            'api_key': settings.OPENAI_API_KEY,
+            'base_url': settings.OPENAI_BASE_URL or None,
+            'timeout': httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+            'max_retries': settings.OPENAI_MAX_RETRIES,
+        }
+
+    def _pool_limits(self):
+        import httpx
+
+        return httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONCURRENCY,
+            max_keepalive_connections=settings.OPENAI_MAX_CONCURRENCY,
+        )
+
+    def get_client(self):
+        """The shared sync client, or None if OpenAI is not configured or installed"""
+        if not self.configured:
+            return None
+
+        with self._lock:
+            if self._client is None:
+                try:
+                    from openai import OpenAI, DefaultHttpxClient
+                    self._client = OpenAI(
+                        http_client=DefaultHttpxClient(limits=self._pool_limits()),
+                        **self._client_options()
+                    )
+                except ImportError:
+                    logger.error("OpenAI library not installed")
+                    return None
+            return self._client
+
+    def get_async_client(self):
+        """The AsyncOpenAI client bound to the running event loop"""
+        if not self.configured:
+            return None
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            try:
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            except ImportError:
+                logger.error("OpenAI library not installed")
+                return None
+            client = self._async_clients[loop] = AsyncOpenAI(
+                http_client=DefaultAsyncHttpxClient(limits=self._pool_limits()),
+                **self._client_options()
+            )
+        return client
+
+    def _get_async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+        return semaphore
+
+    def _check_breaker(self):
+        if not self.breaker.allow_request():
+            llm_requests.inc(outcome='rejected_breaker')
+            raise LLMUnavailable("LLM circuit breaker is open")
+
+    def _record(self, start_time, error=None):
+        elapsed = time.monotonic() - start_time
+        llm_latency.observe(elapsed)
+        if error is None:
+            llm_requests.inc(outcome='success')
+            self.breaker.record(True)
+        elif is_provider_failure(error):
+            llm_requests.inc(outcome='failure')
+            self.breaker.record(False)
+        else:
+            llm_requests.inc(outcome='error')
+            self.breaker.record(True)
+
+    @contextmanager
+    def guard(self):
+        """Wrap one sync provider call (including reading a streamed body)"""
+        self._check_breaker()
+        if not self._semaphore.acquire(timeout=settings.OPENAI_BULKHEAD_TIMEOUT):
+            llm_requests.inc(outcome='rejected_bulkhead')
+            self.breaker.cancel()
+            raise LLMUnavailable("Too many LLM calls in flight")
+
+        llm_in_flight.inc()
+        start_time = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._record(start_time, e)
+            raise
+        else:
+            self._record(start_time)
+        finally:
+            llm_in_flight.dec()
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def aguard(self):
+        """Async counterpart of guard(); waits for a bulkhead slot without blocking the loop"""
+        self._check_breaker()
+        semaphore = self._get_async_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), settings.OPENAI_BULKHEAD_TIMEOUT)
+        except asyncio.TimeoutError:
+            llm_requests.inc(outcome='rejected_bulkhead')
+            self.breaker.cancel()
+            raise LLMUnavailable("Too many LLM calls in flight")
+
+        llm_in_flight.inc()
+        start_time = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled, or the streaming generator around us was closed
+            self.breaker.cancel()
+            raise
+        except Exception as e:
+            self._record(start_time, e)
+            raise
+        else:
+            self._record(start_time)
+        finally:
+            llm_in_flight.dec()
+            semaphore.release()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_llm_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = LLMClientManager()
+        return _manager
+
+
+def reset_llm_manager():
+    """Drop the shared clients and breaker, e.g. after changing OPENAI_* settings"""
+    global _manager
+    with _manager_lock:
+        _manager = None
@@ -0,0 +1,72 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from walletApi.insights import compute_insights, load_chunk
+from walletApi.models import SpendingInsight, Wallet
+
+
+class Command(BaseCommand):
+    help = 'Precompute spending insights for every wallet, loading transactions a chunk of wallets at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Wallets per query')
+        parser.add_argument('--stale-only', action='store_true',
+                            help='Skip wallets whose stored insights are still current')
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        today = timezone.localdate()
+        computed = skipped = transactions = 0
+        last_id = 0
+        began = time.perf_counter()
+
+        while True:
+            wallets = list(
+                Wallet.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id', 'version')[:chunk_size]
+            )
+            if not wallets:
+                break
+            last_id = wallets[-1][0]
+
+            if options['stale_only']:
+                current = {
+                    (user_id, version)
+                    for user_id, version, computed_at in SpendingInsight.objects.filter(
+                        user_id__in=[user_id for _, user_id, _ in wallets]
+                    ).values_list('user_id', 'wallet_version', 'computed_at')
+                    if timezone.localdate(computed_at) == today
+                }
+                fresh = [wallet for wallet in wallets if (wallet[1], wallet[2]) not in current]
+                skipped += len(wallets) - len(fresh)
+                wallets = fresh
+                if not wallets:
+                    continue
+
+            chunk = load_chunk([wallet_id for wallet_id, _, _ in wallets])
+            now = timezone.now()
+            insights = []
+            for wallet_id, user_id, version in wallets:
+                arrays = chunk[wallet_id]
+                insights.append(SpendingInsight(
+                    user_id=user_id,
+                    wallet_version=version,
+                    transactions=len(arrays),
+                    data=compute_insights(arrays),
+                    computed_at=now
+                ))
+                transactions += len(arrays)
+
+            SpendingInsight.objects.bulk_create(
+                insights,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['wallet_version', 'transactions', 'data', 'computed_at']
+            )
+            computed += len(insights)
+
+        elapsed = time.perf_counter() - began
+        rate = computed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Computed insights for {computed} wallets ({transactions} transactions) in {elapsed:.1f}s, "
+            f"{rate:,.0f} wallets/sec; {skipped} already current"
+        ))
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from walletApi.snapshots import export_snapshot, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = (
+        'Export the transaction ledger to a columnar .npy snapshot for analytics jobs, '
+        'appending transactions created since the last export'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default='', help='Snapshot directory (default: TRANSACTION_SNAPSHOT_DIR)')
+        parser.add_argument('--full', action='store_true',
+                            help='Rewrite the snapshot as one segment, picking up status changes')
+        parser.add_argument('--batch-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or snapshot_dir()
+        began = time.perf_counter()
+        try:
+            result = export_snapshot(directory, full=options['full'], batch_size=max(options['batch_size'], 1))
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - began
+
+        manifest = result['manifest']
+        if result['segment'] is None:
+            self.stdout.write(f"No new transactions since id {manifest['last_id']}")
+            return
+
+        rate = result['rows'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {result['rows']} transactions to {result['segment']} in {elapsed:.1f}s ({rate:,.0f} rows/sec); "
+            f"snapshot has {manifest['rows']} rows in {len(manifest['segments'])} segments at {directory}"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from walletApi.fake_llm import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local OpenAI-compatible chat completions server for offline testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency-ms', type=float, default=200)
+        parser.add_argument('--jitter-ms', type=float, default=50)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--chunk-delay-ms', type=float, default=10, help='Delay between streamed chunks')
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            chunk_delay_ms=options['chunk_delay_ms'],
+        )
+        self.stdout.write(f"Fake LLM listening on {server.base_url}")
+        self.stdout.write(f"Point the app at it with OPENAI_BASE_URL={server.base_url} and any OPENAI_API_KEY")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,94 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Max, Min
+from walletApi.categorizer import label_range, train_from_ledger
+from walletApi.models import Transaction
+
+
+def init_worker():
+    django.setup()
+
+
+def label_partition(first_id, last_id, relabel, dry_run):
+    """Label one transaction-id range; runs in a worker process"""
+    return label_range(first_id, last_id, relabel, dry_run)
+
+
+class Command(BaseCommand):
+    help = (
+        'Assign transfer sub-categories (rent, food, family, utilities, other) with the local classifier, '
+        'in parallel over transaction-id ranges'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--train', action='store_true', help='Retrain the model from the ledger first')
+        parser.add_argument('--relabel', action='store_true', help='Also relabel transfers that have a sub-category')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 8))
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Transaction ids per partition')
+        parser.add_argument('--dry-run', action='store_true', help='Report the labels without writing')
+
+    def handle(self, *args, **options):
+        if options['train']:
+            began = time.perf_counter()
+            _, matched = train_from_ledger()
+            self.stdout.write(
+                f"Trained on {matched} keyword-labeled transfers in {time.perf_counter() - began:.1f}s"
+            )
+
+        transfers = Transaction.objects.filter(transaction_category='transfer')
+        if not options['relabel']:
+            transfers = transfers.filter(sub_category='')
+        bounds = transfers.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No transfers to label')
+            return
+
+        size = max(options['chunk_size'], 1)
+        partitions = [
+            (first, min(first + size - 1, bounds['last']))
+            for first in range(bounds['first'], bounds['last'] + 1, size)
+        ]
+
+        workers = max(options['workers'], 1)
+        if connection.vendor == 'sqlite' and workers > 1 and not options['dry_run']:
+            # SQLite takes one writer at a time; parallel partitions would only wait on each other
+            self.stdout.write('SQLite allows a single writer, using one worker')
+            workers = 1
+
+        totals = {}
+        began = time.perf_counter()
+
+        def collect(counts):
+            for label, count in counts.items():
+                totals[label] = totals.get(label, 0) + count
+
+        if workers == 1 or len(partitions) == 1:
+            for first, last in partitions:
+                collect(label_partition(first, last, options['relabel'], options['dry_run']))
+        else:
+            # Children must open their own connections, not share the parent's sockets
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [
+                    pool.submit(label_partition, first, last, options['relabel'], options['dry_run'])
+                    for first, last in partitions
+                ]
+                for future in as_completed(futures):
+                    collect(future.result())
+
+        elapsed = time.perf_counter() - began
+        labeled = sum(totals.values())
+        rate = labeled / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{'Would label' if options['dry_run'] else 'Labeled'} {labeled} transfers in {elapsed:.1f}s "
+            f"({len(partitions)} partitions, {workers} workers, {rate:,.0f} transfers/sec)"
+        )
+        for label, count in sorted(totals.items(), key=lambda item: -item[1]):
+            share = count / labeled * 100 if labeled else 0
+            self.stdout.write(f"  {label}: {count} ({share:.1f}%)")
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Transfers labeled'))
@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max, Min
+from walletApi.analytics import rebuild_users
+from walletApi.models import Wallet
+
+DIFF_LIMIT = 20
+STAT_KEYS = ('transactions', 'rows', 'created', 'updated', 'unchanged', 'deleted', 'rollups')
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def init_worker():
+    django.setup()
+
+
+def rebuild_partition(first_user_id, last_user_id, start, end, dry_run):
+    """Rebuild one user-id range; runs in a worker process"""
+    return rebuild_users(first_user_id, last_user_id, start, end, dry_run)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute daily transaction analytics and their rollups from the transaction ledger, '
+        'in parallel over user-id ranges'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day to rebuild (YYYY-MM-DD, UTC)')
+        parser.add_argument('--end', type=parse_date, help='Last day to rebuild (YYYY-MM-DD, UTC)')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 8))
+        parser.add_argument('--partition-size', type=int, default=5000,
+                            help="User ids per partition; their transfers wait while it is rebuilt")
+        parser.add_argument('--dry-run', action='store_true', help='Report differences without writing')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+
+        bounds = Wallet.objects.aggregate(first=Min('user_id'), last=Max('user_id'))
+        if bounds['first'] is None:
+            self.stdout.write('No wallets to rebuild')
+            return
+
+        size = max(options['partition_size'], 1)
+        partitions = [
+            (first, min(first + size - 1, bounds['last']))
+            for first in range(bounds['first'], bounds['last'] + 1, size)
+        ]
+
+        workers = max(options['workers'], 1)
+        if connection.vendor == 'sqlite' and workers > 1 and not options['dry_run']:
+            # SQLite takes one writer at a time; parallel partitions would only wait on each other
+            self.stdout.write('SQLite allows a single writer, using one worker')
+            workers = 1
+
+        totals = dict.fromkeys(STAT_KEYS, 0)
+        diffs = []
+        began = time.perf_counter()
+
+        def collect(stats):
+            for key in STAT_KEYS:
+                totals[key] += stats[key]
+            diffs.extend(stats['diffs'][:DIFF_LIMIT - len(diffs)])
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f"  partition: {stats['transactions']} transactions, {stats['rows']} rows, "
+                    f"{stats['created']} created, {stats['updated']} updated, {stats['deleted']} deleted"
+                )
+
+        if workers == 1 or len(partitions) == 1:
+            for first, last in partitions:
+                collect(rebuild_partition(first, last, start, end, options['dry_run']))
+        else:
+            # Children must open their own connections, not share the parent's sockets
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [
+                    pool.submit(rebuild_partition, first, last, start, end, options['dry_run'])
+                    for first, last in partitions
+                ]
+                for future in as_completed(futures):
+                    collect(future.result())
+
+        elapsed = time.perf_counter() - began
+        self.report(totals, diffs, elapsed, len(partitions), workers, options['dry_run'])
+
+    def report(self, totals, diffs, elapsed, partition_count, workers, dry_run):
+        rate = totals['transactions'] / elapsed if elapsed else 0
+        row_rate = totals['rows'] / elapsed if elapsed else 0
+        changed = totals['created'] + totals['updated'] + totals['deleted']
+
+        self.stdout.write(
+            f"Read {totals['transactions']} transactions into {totals['rows']} daily rows "
+            f"in {elapsed:.1f}s ({partition_count} partitions, {workers} workers)"
+        )
+        self.stdout.write(f"  {rate:,.0f} transactions/sec, {row_rate:,.0f} rows/sec")
+
+        if dry_run:
+            self.stdout.write(
+                f"  Would create {totals['created']}, update {totals['updated']} and delete {totals['deleted']} "
+                f"daily rows; {totals['unchanged']} unchanged"
+            )
+            for user_id, day, field, old, new in diffs:
+                self.stdout.write(f"    user {user_id} {day} {field}: {old} -> {new}")
+        else:
+            self.stdout.write(
+                f"  Created {totals['created']}, updated {totals['updated']} and deleted {totals['deleted']} "
+                f"daily rows; {totals['unchanged']} unchanged; {totals['rollups']} rollup rows written"
+            )
+
+        if not changed:
+            self.stdout.write(self.style.SUCCESS('Analytics match the ledger'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{changed} daily rows differ from the ledger"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Analytics rebuilt'))
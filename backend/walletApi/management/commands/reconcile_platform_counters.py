@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from walletApi.platform_counters import (
+    BUCKET_PERIODS, prune, reconcile_buckets, reconcile_totals, retention_start
+)
+
+DIFF_LIMIT = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the platform counters behind the ops dashboard from the transaction ledger: '
+        'closed minute, hour and day buckets of the last --days days and the all-time totals'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='Days of buckets to recompute, including today')
+        parser.add_argument('--skip-totals', action='store_true', help='Leave the all-time totals and float alone')
+        parser.add_argument('--dry-run', action='store_true', help='Report differences without writing')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        now = timezone.now()
+        since = now - timedelta(days=options['days'] - 1)
+        # Older minute and hour rows are pruned, not rebuilt
+        starts = {period: max(since, retention_start(period, now)) for period in BUCKET_PERIODS}
+
+        dry_run = options['dry_run']
+        diffs = []
+        began = time.perf_counter()
+        for period in BUCKET_PERIODS:
+            written, found = reconcile_buckets(period, starts[period], now=now, dry_run=dry_run)
+            diffs.extend((period, *diff) for diff in found)
+            self.stdout.write(f"  {period}: {len(found)} differences, {written} rows written")
+
+        if not options['skip_totals']:
+            found = reconcile_totals(dry_run=dry_run)
+            diffs.extend(('total', *diff) for diff in found)
+            self.stdout.write(f"  total: {len(found)} differences")
+
+        pruned = 0 if dry_run else prune(now)
+        elapsed = time.perf_counter() - began
+        self.stdout.write(f"Reconciled in {elapsed:.1f}s; {pruned} expired rows pruned")
+
+        for period, bucket, column, old, new in diffs[:DIFF_LIMIT]:
+            self.stdout.write(f"    {period} {bucket:%Y-%m-%d %H:%M} {column}: {old} -> {new}")
+
+        if not diffs:
+            self.stdout.write(self.style.SUCCESS('Platform counters match the ledger'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{len(diffs)} counter values differ from the ledger"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Platform counters reconciled'))
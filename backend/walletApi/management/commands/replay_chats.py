@@ -0,0 +1,250 @@
+import json
+import time
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from authApi.models import CustomUser
+from walletApi.ai_service import astream_ai_response, generate_ai_response
+from walletApi.fake_llm import FakeLLMServer
+from walletApi.llm import get_llm_manager, reset_llm_manager
+from walletApi.models import ChatMessage, CustomerServiceChat, Wallet
+
+SYNTHETIC_CONVERSATIONS = [
+    ["Hi", "How do I send money to a friend?", "What is the maximum I can transfer?", "Thanks!"],
+    ["My transfer failed but the money left my wallet", "It was yesterday around 5pm", "Can you check again?",
+     "This is frustrating", "I want to speak to human support"],
+    ["How do I add money?", "Which payment methods can I use?", "Is there a fee for deposits?"],
+    ["I forgot pin", "How do I reset it?", "Will my beneficiaries be kept?", "Great, thank you"],
+    ["Can I schedule a bill payment for next week?", "What bills can I pay in the app?",
+     "Do airtime purchases count towards my limits?", "How long do bill payments take?",
+     "Where can I see my bill payment history?", "Can I download a statement?"],
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class StatementCounter:
+    """execute_wrapper that counts queries and writes"""
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+
+    def reset(self):
+        self.queries = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay stored or synthetic support conversations through the AI chat path against '
+        'a local fake LLM, and report latency, DB writes and prompt tokens per turn'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=0, help='Most recent stored sessions to replay')
+        parser.add_argument('--synthetic', type=int, default=0, help='Synthetic conversations to replay')
+        parser.add_argument('--stream', action='store_true', help='Use the streaming chat path')
+        parser.add_argument('--latency-ms', type=float, default=200)
+        parser.add_argument('--jitter-ms', type=float, default=50)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--base-url', default='', help='Use an already running OpenAI-compatible server instead')
+        parser.add_argument('--keep', action='store_true', help='Keep the replayed sessions instead of rolling back')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not options['sessions'] and not options['synthetic']:
+            options['synthetic'] = len(SYNTHETIC_CONVERSATIONS)
+
+        server = None
+        base_url = options['base_url']
+        if not base_url:
+            server = FakeLLMServer(
+                latency_ms=options['latency_ms'],
+                jitter_ms=options['jitter_ms'],
+                error_rate=options['error_rate'],
+                seed=options['seed'],
+            ).start()
+            base_url = server.base_url
+
+        overrides = {
+            'OPENAI_API_KEY': settings.OPENAI_API_KEY or 'replay',
+            'OPENAI_BASE_URL': base_url,
+            # Keep replayed usage out of the shared token meters
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'chat-replay'}},
+        }
+
+        try:
+            with override_settings(**overrides):
+                reset_llm_manager()
+                with transaction.atomic():
+                    conversations = self.load_conversations(options)
+                    if not conversations:
+                        raise CommandError('No conversations to replay')
+                    samples = self.replay(conversations, options['stream'])
+                    if not options['keep']:
+                        transaction.set_rollback(True)
+        finally:
+            reset_llm_manager()
+            if server:
+                server.stop()
+
+        report = self.build_report(samples, len(conversations), server)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def load_conversations(self, options):
+        """List of (user, [user messages])"""
+        conversations = []
+
+        if options['sessions']:
+            chats = CustomerServiceChat.objects.select_related('user').order_by('-started_at')[:options['sessions']]
+            for chat in chats:
+                messages = list(
+                    chat.messages.filter(message_type='user').order_by('id').values_list('content', flat=True)
+                )
+                if messages:
+                    conversations.append((chat.user, messages))
+
+        for index in range(options['synthetic']):
+            user = CustomUser.objects.create_user(
+                phone_number=f"0990{index:07d}",
+                password=None,
+                full_name=f"Replay User {index}"
+            )
+            Wallet.objects.create(user=user)
+            conversations.append((user, SYNTHETIC_CONVERSATIONS[index % len(SYNTHETIC_CONVERSATIONS)]))
+
+        return conversations
+
+    async def stream_turn(self, user, message, chat_session):
+        result = None
+        async for event_type, data in astream_ai_response(user, message, chat_session):
+            if event_type in ('done', 'error'):
+                result = data
+        return result
+
+    def replay(self, conversations, stream):
+        counter = StatementCounter()
+        samples = []
+
+        # Import the OpenAI client and open its pool before timing anything
+        get_llm_manager().get_client()
+
+        for user, messages in conversations:
+            chat_session = None
+            for message in messages:
+                last_id = ChatMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                counter.reset()
+                start = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    if stream:
+                        result = async_to_sync(self.stream_turn)(user, message, chat_session)
+                    else:
+                        result = generate_ai_response(user, message, chat_session)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+
+                if chat_session is None and result.get('session_id'):
+                    chat_session = CustomerServiceChat.objects.filter(session_id=result['session_id']).first()
+
+                reply = None
+                if chat_session:
+                    reply = (
+                        ChatMessage.objects.filter(chat=chat_session, message_type='ai', id__gt=last_id)
+                        .values('prompt_tokens', 'cached_tokens', 'route_tier').first()
+                    )
+
+                if result.get('cached'):
+                    tier = 'cached'
+                elif reply:
+                    tier = reply['route_tier'] or 'fallback'
+                else:
+                    tier = 'error'
+
+                samples.append({
+                    'latency_ms': elapsed_ms,
+                    'queries': counter.queries,
+                    'writes': counter.writes,
+                    'prompt_tokens': (reply or {}).get('prompt_tokens'),
+                    'cached_tokens': (reply or {}).get('cached_tokens'),
+                    'tier': tier,
+                    'error': 'error' in result,
+                    'fallback': bool(result.get('mock')),
+                })
+
+        return samples
+
+    def build_report(self, samples, conversation_count, server):
+        latencies = [sample['latency_ms'] for sample in samples]
+        prompt_tokens = [sample['prompt_tokens'] for sample in samples if sample['prompt_tokens'] is not None]
+        tiers = {}
+        for sample in samples:
+            tiers[sample['tier']] = tiers.get(sample['tier'], 0) + 1
+
+        report = {
+            'conversations': conversation_count,
+            'turns': len(samples),
+            'errors': sum(sample['error'] for sample in samples),
+            'fallbacks': sum(sample['fallback'] for sample in samples),
+            'tiers': tiers,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 1),
+                'p95': round(percentile(latencies, 0.95), 1),
+                'p99': round(percentile(latencies, 0.99), 1),
+                'max': round(max(latencies), 1),
+            },
+            'db_writes_per_turn': {
+                'mean': round(sum(sample['writes'] for sample in samples) / len(samples), 2),
+                'max': max(sample['writes'] for sample in samples),
+            },
+            'db_queries_per_turn': round(sum(sample['queries'] for sample in samples) / len(samples), 2),
+            'prompt_tokens': {
+                'model_turns': len(prompt_tokens),
+                'mean': round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else 0,
+                'p95': percentile(prompt_tokens, 0.95) if prompt_tokens else 0,
+                'total': sum(prompt_tokens),
+                'cached_total': sum(sample['cached_tokens'] or 0 for sample in samples),
+            },
+        }
+        if server:
+            report['llm_requests'] = server.request_count
+            report['llm_models'] = server.models
+        return report
+
+    def print_report(self, report):
+        latency = report['latency_ms']
+        writes = report['db_writes_per_turn']
+        tokens = report['prompt_tokens']
+
+        self.stdout.write(f"Replayed {report['turns']} turns from {report['conversations']} conversations")
+        self.stdout.write(f"  Errors: {report['errors']}, fallbacks to built-in replies: {report['fallbacks']}")
+        self.stdout.write(f"  Tiers: {', '.join(f'{tier}={count}' for tier, count in sorted(report['tiers'].items()))}")
+        self.stdout.write(
+            f"  Latency ms: p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}, max {latency['max']}"
+        )
+        self.stdout.write(
+            f"  DB writes per turn: mean {writes['mean']}, max {writes['max']}; "
+            f"queries per turn: {report['db_queries_per_turn']}"
+        )
+        self.stdout.write(
+            f"  Prompt tokens over {tokens['model_turns']} model turns: mean {tokens['mean']}, "
+            f"p95 {tokens['p95']}, total {tokens['total']}, cached {tokens['cached_total']}"
+        )
+        if 'llm_requests' in report:
+            self.stdout.write(f"  Fake LLM requests: {report['llm_requests']} {report['llm_models']}")
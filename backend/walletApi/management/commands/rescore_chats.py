@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from walletApi.intents import classify_many
+from walletApi.models import ChatMessage, CustomerServiceChat
+
+
+class Command(BaseCommand):
+    help = 'Recompute issue category and sentiment for chat sessions from their first user message'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        changed = scanned = 0
+        last_id = 0
+
+        while True:
+            chats = list(CustomerServiceChat.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not chats:
+                break
+            last_id = chats[-1].id
+
+            first_messages = {}
+            for chat_id, content in (
+                ChatMessage.objects.filter(chat__in=chats, message_type='user')
+                .order_by('chat_id', 'created_at')
+                .values_list('chat_id', 'content')
+            ):
+                first_messages.setdefault(chat_id, content)
+
+            scored = [chat for chat in chats if chat.id in first_messages]
+            intents = classify_many([first_messages[chat.id] for chat in scored])
+
+            updates = []
+            for chat, intent in zip(scored, intents):
+                if chat.issue_category != intent.category or chat.sentiment_score != intent.sentiment:
+                    chat.issue_category = intent.category
+                    chat.sentiment_score = intent.sentiment
+                    updates.append(chat)
+
+            if updates and not options['dry_run']:
+                CustomerServiceChat.objects.bulk_update(updates, ['issue_category', 'sentiment_score'])
+
+            scanned += len(chats)
+            changed += len(updates)
+
+        verb = 'would change' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(f"Scanned {scanned} chats, {verb} {changed}"))
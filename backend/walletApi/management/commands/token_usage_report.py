@@ -0,0 +1,30 @@
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from walletApi.models import TokenUsageDaily
+
+
+class Command(BaseCommand):
+    help = 'Report AI token usage per day and the heaviest users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Days to include, counting today')
+        parser.add_argument('--top', type=int, default=10, help='Users to list')
+
+    def handle(self, *args, **options):
+        since = timezone.localdate() - timedelta(days=options['days'] - 1)
+        usage = TokenUsageDaily.objects.filter(date__gte=since)
+
+        self.stdout.write(f"Token usage since {since}")
+        for row in usage.values('date').annotate(tokens=Sum('tokens_used'), requests=Sum('requests')).order_by('date'):
+            self.stdout.write(f"  {row['date']}  {row['tokens']:>10} tokens  {row['requests']:>6} requests")
+
+        self.stdout.write(f"Top {options['top']} users")
+        top_users = (
+            usage.values('user__phone_number')
+            .annotate(tokens=Sum('tokens_used'), requests=Sum('requests'))
+            .order_by('-tokens')[:options['top']]
+        )
+        for row in top_users:
+            self.stdout.write(f"  {row['user__phone_number']:<15} {row['tokens']:>10} tokens  {row['requests']:>6} requests")
@@ -0,0 +1,125 @@
+"""
+AI token metering and daily budgets.
+
+Tokens are counted per user and globally in the default cache under
+keys for the current local date, so the check before each turn is one
+get_many() round trip. The same usage is rolled up into
+TokenUsageDaily for reporting, since cache counters may be evicted or
+lost on restart.
+
+Budgets (AI_USER_DAILY_SOFT_TOKENS, AI_USER_DAILY_HARD_TOKENS,
+AI_GLOBAL_DAILY_HARD_TOKENS) return a budget level that the chat path
+uses to downgrade replies to the built-in answers. Each worker must see
+the same counters, so check_shared_cache() warns at startup when a budget
+is set and the default cache is local to each process.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import metrics
+from .models import TokenUsageDaily
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUDGET_OK = 'ok'
+BUDGET_SOFT = 'soft'
+BUDGET_HARD = 'hard'
+
+# Counters outlive their day briefly so late writes near midnight still land
+COUNTER_TTL = 2 * 24 * 60 * 60
+
+tokens_metered = metrics.counter(
+    'ai_tokens_metered_total', 'LLM tokens recorded against user budgets'
+)
+budget_downgrades = metrics.counter(
+    'ai_budget_downgrades_total', 'Chat turns downgraded to built-in answers by budget', ['budget']
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """System check: budgets counted in a per-process cache let each worker spend the full budget"""
+    budgets = (
+        settings.AI_USER_DAILY_SOFT_TOKENS, settings.AI_USER_DAILY_HARD_TOKENS, settings.AI_GLOBAL_DAILY_HARD_TOKENS
+    )
+    if not any(budgets):
+        return []
+    # InstrumentedCache wraps the configured backend
+    backend = caches['default']
+    backend = getattr(backend, '_cache', backend)
+    if not isinstance(backend, (LocMemCache, DummyCache)):
+        return []
+    return [checks.Warning(
+        f"AI token budgets are counted in {type(backend).__name__}, which each worker process keeps to itself.",
+        hint="Set CACHE_BACKEND to a shared cache such as django.core.cache.backends.redis.RedisCache, "
+             "or set the AI_*_DAILY_*_TOKENS budgets to 0.",
+        id='walletApi.W001',
+    )]
+
+
+def user_key(user_id, day):
+    return f"ai-tokens:user:{user_id}:{day.isoformat()}"
+
+
+def global_key(day):
+    return f"ai-tokens:global:{day.isoformat()}"
+
+
+def get_token_budget(user_id):
+    """BUDGET_OK, BUDGET_SOFT or BUDGET_HARD for the user's next turn"""
+    day = timezone.localdate()
+    keys = [user_key(user_id, day), global_key(day)]
+    counts = cache.get_many(keys)
+    user_tokens = counts.get(keys[0], 0)
+    global_tokens = counts.get(keys[1], 0)
+
+    if settings.AI_GLOBAL_DAILY_HARD_TOKENS and global_tokens >= settings.AI_GLOBAL_DAILY_HARD_TOKENS:
+        return BUDGET_HARD
+    if settings.AI_USER_DAILY_HARD_TOKENS and user_tokens >= settings.AI_USER_DAILY_HARD_TOKENS:
+        return BUDGET_HARD
+    if settings.AI_USER_DAILY_SOFT_TOKENS and user_tokens >= settings.AI_USER_DAILY_SOFT_TOKENS:
+        return BUDGET_SOFT
+    return BUDGET_OK
+
+
+def increment(key, amount):
+    # add() is a no-op when the key exists, so concurrent first writes do not reset it
+    cache.add(key, 0, COUNTER_TTL)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, COUNTER_TTL)
+
+
+def record_token_usage(user_id, tokens):
+    """Count a provider reply's tokens against the user's and the global budget"""
+    if not tokens:
+        return
+
+    day = timezone.localdate()
+    increment(user_key(user_id, day), tokens)
+    increment(global_key(day), tokens)
+    tokens_metered.inc(tokens)
+
+    updated = TokenUsageDaily.objects.filter(user_id=user_id, date=day).update(
+        tokens_used=F('tokens_used') + tokens,
+        requests=F('requests') + 1,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                TokenUsageDaily.objects.create(user_id=user_id, date=day, tokens_used=tokens, requests=1)
+        except IntegrityError:
+            # Another request created today's row first
+            TokenUsageDaily.objects.filter(user_id=user_id, date=day).update(
+                tokens_used=F('tokens_used') + tokens,
+                requests=F('requests') + 1,
+                updated_at=timezone.now()
+            )
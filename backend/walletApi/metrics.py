@@ -0,0 +1,531 @@
+"""
+Process metrics with Prometheus text exposition.
+
+Metrics are created once at import time with counter(), gauge() or
+histogram() and updated from request code. Updates take a per-metric lock
+held only for a dict update.
+Gauges read from elsewhere, such as a count in the database, are set by
+an on_render() callback, which runs once per render in the rendering
+process.
+
+With several worker processes, set METRICS_MULTIPROCESS_DIR to a directory
+they share. Each process then writes a snapshot of its values to its own
+file there, at most every METRICS_FLUSH_SECONDS (flush_if_due() is called
+after each request) and on exit, and render_all() merges the files:
+counters and histograms are summed over every process that ever wrote,
+gauges over the processes still running ('sum', or 'max' for states).
+The files of processes that have exited are folded into archive.json
+when rendering, so the directory holds one file per running process plus
+the archive. A file is named after its process's pid and start time, so a
+new process that happens to get the pid of an exited one is not mistaken
+for it. Clear it when the service is deployed, as Prometheus expects
+counters to restart from zero then anyway.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# In METRICS_MULTIPROCESS_DIR: totals of exited processes, and the lock taken to update it
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = '.lock'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, labels, value) tuples"""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield '', tuple(zip(self.labelnames, key)), value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self):
+        """{label values: value} copy of the current values"""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values):
+        """Add another process's snapshot"""
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def merge(self, values):
+        if self.multiprocess_mode != 'max':
+            super().merge(values)
+            return
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = max(self._values.get(key, value), value)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @property
+    def is_render_local(self):
+        """Set by an on_render() callback in the rendering process, rather than merged from every process"""
+        return getattr(self, '_render_local', False)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts, then sum and count
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(state) for key, state in self._values.items()}
+
+    def merge(self, values):
+        with self._lock:
+            for key, state in values.items():
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = list(state)
+                else:
+                    self._values[key] = [mine + theirs for mine, theirs in zip(current, state)]
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in values.items():
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield '_bucket', labels + (('le', format_value(bound)),), cumulative
+            yield '_sum', labels, state[-2]
+            yield '_count', labels, state[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._callbacks = []
+
+    def on_render(self, callback, gauges):
+        with self._lock:
+            self._callbacks.append((callback, gauges))
+        for gauge in gauges:
+            gauge._render_local = True
+
+    def run_callbacks(self):
+        """Refresh the on_render() gauges, once per render"""
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback, gauges in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Could not collect {', '.join(gauge.name for gauge in gauges)}: {str(e)}")
+                for gauge in gauges:
+                    gauge.reset()
+
+    def get_or_create(self, cls, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        self.run_callbacks()
+        lines = []
+        for metric in sorted(self.metrics(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """JSON-ready values of every metric; on_render() gauges are read by the rendering process instead"""
+        snapshot = {}
+        for metric in self.metrics():
+            if isinstance(metric, Gauge) and metric.is_render_local:
+                continue
+            entry = {
+                'type': metric.type,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'pid': os.getpid(),
+                'values': [[list(key), value] for key, value in metric.snapshot().items()],
+            }
+            if isinstance(metric, Histogram):
+                entry['buckets'] = [bound for bound in metric.buckets if bound != math.inf]
+            if isinstance(metric, Gauge):
+                entry['mode'] = metric.multiprocess_mode
+            snapshot[metric.name] = entry
+        return snapshot
+
+    def reset(self):
+        """Drop values inherited from the parent process after a fork"""
+        for metric in self.metrics():
+            metric.reset()
+
+
+REGISTRY = Registry()
+METRIC_TYPES = {cls.type: cls for cls in (Counter, Gauge, Histogram)}
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=(), multiprocess_mode='sum'):
+    """multiprocess_mode: 'sum' adds up running processes, 'max' takes the highest"""
+    return REGISTRY.get_or_create(Gauge, name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def on_render(callback, *gauges):
+    """
+    Call callback() once before each render to set gauges, e.g. from one
+    query for several of them. Only the rendering process reports these
+    gauges, so a value read from the database is not summed over workers.
+    """
+    REGISTRY.on_render(callback, gauges)
+
+
+def multiprocess_dir():
+    from django.conf import settings
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', '') or ''
+
+
+class ProcessFile:
+    """This process's snapshot file in the shared directory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._name = None
+
+    def name(self):
+        if self._name is None:
+            self._name = process_file_name(os.getpid())
+        return self._name
+
+    def flush(self):
+        directory = multiprocess_dir()
+        if not directory or not self._lock.acquire(blocking=False):
+            return
+        try:
+            path = Path(directory) / self.name()
+            temporary = path.with_name(f".{path.name}.tmp")
+            temporary.write_text(json.dumps(REGISTRY.snapshot()))
+            os.replace(temporary, path)
+            self._last_flush = time.monotonic()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not write metrics to {directory}: {str(e)}")
+        finally:
+            self._lock.release()
+
+    def flush_if_due(self):
+        from django.conf import settings
+        if time.monotonic() - self._last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 1):
+            self.flush()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._name = None
+
+
+PROCESS_FILE = ProcessFile()
+
+
+def flush_if_due():
+    """Write this process's values to METRICS_MULTIPROCESS_DIR when the last write is old enough"""
+    if multiprocess_dir():
+        PROCESS_FILE.flush_if_due()
+
+
+def process_start_time(pid):
+    """When a process started, in clock ticks since boot, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/stat") as handle:
+            stat = handle.read()
+    except OSError:
+        return None
+    # Fields after the parenthesised command name, which may itself hold spaces; starttime is field 22
+    fields = stat.rpartition(')')[2].split()
+    return int(fields[19]) if len(fields) > 19 and fields[19].isdigit() else None
+
+
+def process_file_name(pid):
+    """'<pid>-<start time>.json', with a random suffix where start times cannot be read"""
+    started = process_start_time(pid)
+    return f"{pid}-{started if started is not None else uuid.uuid4().hex[:8]}.json"
+
+
+def process_running(pid, started):
+    """Whether the process that wrote a file is still running, rather than a later one given its pid"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    current = process_start_time(pid)
+    if current is None:
+        # No start time to compare against, so trust the pid
+        return True
+    return str(current) == started
+
+
+def file_process(path):
+    """(pid, start time) from a process file name, or (None, None)"""
+    pid, _, started = path.stem.partition('-')
+    return (int(pid), started) if pid.isdigit() else (None, None)
+
+
+@contextmanager
+def directory_lock(directory):
+    """Exclusive lock on the shared directory; yields False where flock is unavailable"""
+    if fcntl is None:
+        yield False
+        return
+    with open(Path(directory) / LOCK_NAME, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        # A file being replaced or from an older format; its process writes it again
+        logger.warning(f"Could not read metrics from {path}: {str(e)}")
+        return None
+
+
+def merge_snapshot(registry, snapshot, gauges=True):
+    """Add a snapshot file's values to registry, leaving out gauges unless gauges is True"""
+    for name, entry in snapshot.items():
+        cls = METRIC_TYPES.get(entry['type'])
+        existing = registry._metrics.get(name)
+        if cls is None or (cls is Gauge and not gauges) or (isinstance(existing, Gauge) and existing.is_render_local):
+            continue
+        kwargs = {}
+        if cls is Histogram:
+            kwargs['buckets'] = entry['buckets']
+        elif cls is Gauge:
+            kwargs['multiprocess_mode'] = entry.get('mode', 'sum')
+        try:
+            metric = registry.get_or_create(cls, name, entry['help'], entry['labelnames'], **kwargs)
+        except ValueError:
+            continue
+        metric.merge({tuple(key): value for key, value in entry['values']})
+
+
+def read_archive(directory):
+    """(metrics snapshot, names of the files already folded in) from the archive file"""
+    path = Path(directory) / ARCHIVE_NAME
+    archive = read_snapshot(path) if path.exists() else {}
+    if archive is None:
+        return None, set()
+    return archive.get('metrics', {}), set(archive.get('folded', []))
+
+
+def archive_finished(directory):
+    """
+    Fold the files of processes that have exited into the archive file and delete them.
+
+    Their counters and histograms are added to the archive; their gauges are
+    dropped. The archive lists the files it holds, so one left behind by a
+    failed delete is not counted twice. Call with directory_lock held.
+    """
+    directory = Path(directory)
+    finished = [
+        path for path in directory.glob('*.json')
+        if file_process(path)[0] is not None and not process_running(*file_process(path))
+    ]
+    if not finished:
+        return
+    snapshot, folded = read_archive(directory)
+    if snapshot is None:
+        # Keep the files rather than start a new archive without the old totals
+        return
+
+    archive = Registry()
+    merge_snapshot(archive, snapshot, gauges=False)
+    # Names of files deleted since the last fold no longer need remembering
+    folded = {name for name in folded if (directory / name).exists()}
+    for path in finished:
+        if path.name in folded:
+            continue
+        snapshot = read_snapshot(path)
+        if snapshot is not None:
+            merge_snapshot(archive, snapshot, gauges=False)
+            folded.add(path.name)
+
+    path = directory / ARCHIVE_NAME
+    temporary = path.with_name(f".{path.name}.tmp")
+    try:
+        temporary.write_text(json.dumps({'folded': sorted(folded), 'metrics': archive.snapshot()}))
+        os.replace(temporary, path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not write metrics archive to {directory}: {str(e)}")
+        return
+    for path in finished:
+        if path.name in folded:
+            path.unlink(missing_ok=True)
+
+
+def render_all():
+    """This process's metrics, or with METRICS_MULTIPROCESS_DIR those of every process"""
+    directory = multiprocess_dir()
+    if not directory:
+        return REGISTRY.render()
+
+    PROCESS_FILE.flush()
+    merged = Registry()
+    # on_render() gauges are read here, once, rather than summed over processes
+    REGISTRY.run_callbacks()
+    for metric in REGISTRY.metrics():
+        if isinstance(metric, Gauge) and metric.is_render_local:
+            merged._metrics[metric.name] = metric
+
+    # Held while reading too, so a fold in another process cannot move values between files mid-read
+    with directory_lock(directory) as locked:
+        if locked:
+            archive_finished(directory)
+        snapshot, folded = read_archive(directory)
+        if snapshot:
+            merge_snapshot(merged, snapshot, gauges=False)
+
+        running = {}
+        for path in Path(directory).glob('*.json'):
+            if path.name == ARCHIVE_NAME or path.name in folded:
+                continue
+            snapshot = read_snapshot(path)
+            if snapshot is None:
+                continue
+            # Gauges only count while their process runs
+            process = file_process(path)
+            if process not in running:
+                running[process] = process[0] is not None and process_running(*process)
+            merge_snapshot(merged, snapshot, gauges=running[process])
+    return merged.render()
+
+
+def after_fork():
+    # A forked worker starts from zero under its own file; the parent still reports what it counted
+    REGISTRY.reset()
+    PROCESS_FILE.after_fork()
+
+
+atexit.register(PROCESS_FILE.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork)
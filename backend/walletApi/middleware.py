@@ -0,0 +1,123 @@
+"""
+Per-route request metrics.
+
+RequestMetricsMiddleware times every request and counts the database
+queries it runs, labeled by the URL pattern that matched (e.g.
+'api/wallet/transactions/<str:reference>/'), so the label set stays small
+whatever the ids in the path. Streaming responses are timed until their
+headers are ready.
+
+Queries are timed by a wrapper added to every database connection as it
+opens. It reports to the request in a context variable, which also
+reaches sync views run in a thread under ASGI, where the thread has its
+own connection.
+"""
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from . import metrics
+
+UNMATCHED_ROUTE = 'unmatched'
+KNOWN_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+http_requests = metrics.counter(
+    'http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status']
+)
+http_latency = metrics.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ['method', 'route']
+)
+db_queries = metrics.counter(
+    'db_queries_total', 'Database queries run by requests, by route', ['route']
+)
+db_query_time = metrics.counter(
+    'db_query_seconds_total', 'Time spent in database queries by requests, by route', ['route']
+)
+db_query_latency = metrics.histogram(
+    'db_query_duration_seconds', 'Database query latency',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+
+class RequestQueries:
+    """Queries run by one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+request_queries = ContextVar('request_queries', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every query"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        db_query_latency.observe(elapsed)
+        queries = request_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += elapsed
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # Connections fire this again on every reconnect
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='walletApi.middleware.install_query_timer')
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.route if match is not None else '') or UNMATCHED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        queries = RequestQueries()
+        token = request_queries.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        self.record(request, response, started, queries)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        queries = RequestQueries()
+        token = request_queries.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        self.record(request, response, started, queries)
+        return response
+
+    def record(self, request, response, started, queries):
+        route = route_of(request)
+        method = request.method if request.method in KNOWN_METHODS else 'other'
+        http_latency.observe(time.perf_counter() - started, method=method, route=route)
+        http_requests.inc(method=method, route=route, status=response.status_code)
+        if queries.count:
+            db_queries.inc(queries.count, route=route)
+            db_query_time.inc(queries.seconds, route=route)
+        metrics.flush_if_due()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Incremented on every write, used for ETags'),
+        ),
+    ]
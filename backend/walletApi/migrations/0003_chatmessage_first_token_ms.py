@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0002_wallet_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='first_token_ms',
+            field=models.IntegerField(blank=True, help_text='Time to first streamed token in milliseconds', null=True),
+        ),
+    ]
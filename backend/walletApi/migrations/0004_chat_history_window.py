@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0003_chatmessage_first_token_ms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='prompt_tokens',
+            field=models.IntegerField(blank=True, help_text='Prompt tokens sent for this reply', null=True),
+        ),
+        migrations.AddField(
+            model_name='customerservicechat',
+            name='summarized_through',
+            field=models.BigIntegerField(default=0, help_text='Last message id folded into the summary'),
+        ),
+        migrations.AddField(
+            model_name='customerservicechat',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0004_chat_history_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='cached_tokens',
+            field=models.IntegerField(blank=True, help_text='Prompt tokens served from the provider cache', null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='prompt_version',
+            field=models.CharField(blank=True, help_text='Version of the static system prompt', max_length=20),
+        ),
+    ]
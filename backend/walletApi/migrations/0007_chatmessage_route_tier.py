@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0006_tokenusagedaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='route_tier',
+            field=models.CharField(blank=True, help_text='Routing tier that answered: local, fast or large', max_length=10),
+        ),
+    ]
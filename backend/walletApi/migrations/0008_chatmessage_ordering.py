@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0007_chatmessage_route_tier'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={'ordering': ['created_at', 'id'], 'verbose_name': 'Chat Message', 'verbose_name_plural': 'Chat Messages'},
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0008_chatmessage_ordering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscalationTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('claimed', 'Claimed'), ('resolved', 'Resolved')], default='queued', max_length=20)),
+                ('priority', models.PositiveSmallIntegerField(default=0, help_text='0-100, from sentiment and wallet value')),
+                ('due_at', models.DateTimeField(help_text='Answer-by time; the queue is served in due_at order')),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('resolution_note', models.TextField(blank=True)),
+                ('chat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='escalation', to='walletApi.customerservicechat')),
+                ('claimed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_escalations', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='escalations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Escalation Ticket',
+                'verbose_name_plural': 'Escalation Tickets',
+                'ordering': ['due_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['due_at'], name='escalation_queue_idx'), models.Index(fields=['claimed_by', 'status'], name='escalation_agent_idx')],
+            },
+        ),
+    ]
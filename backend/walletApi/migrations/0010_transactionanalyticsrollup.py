@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:35
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+COUNTERS = ['total_credits', 'total_debits', 'total_transactions', 'transfers_sent',
+            'transfers_received', 'bill_payments', 'airtime_purchases']
+
+
+def backfill_rollups(apps, schema_editor):
+    TransactionAnalytics = apps.get_model('walletApi', 'TransactionAnalytics')
+    TransactionAnalyticsRollup = apps.get_model('walletApi', 'TransactionAnalyticsRollup')
+
+    for period, trunc in (('week', TruncWeek), ('month', TruncMonth), ('year', TruncYear)):
+        rows = (
+            TransactionAnalytics.objects
+            .annotate(period_start=trunc('date'))
+            .values('user_id', 'period_start')
+            .annotate(**{f'sum_{name}': Sum(name) for name in COUNTERS})
+            .order_by()
+        )
+        TransactionAnalyticsRollup.objects.bulk_create(
+            (
+                TransactionAnalyticsRollup(
+                    user_id=row['user_id'],
+                    period=period,
+                    period_start=row['period_start'],
+                    **{name: row[f'sum_{name}'] for name in COUNTERS}
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0009_escalationticket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionAnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('period_start', models.DateField(help_text='Monday, first of the month or January 1st')),
+                ('total_credits', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total_debits', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total_transactions', models.IntegerField(default=0)),
+                ('transfers_sent', models.IntegerField(default=0)),
+                ('transfers_received', models.IntegerField(default=0)),
+                ('bill_payments', models.IntegerField(default=0)),
+                ('airtime_purchases', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transaction Analytics Rollup',
+                'verbose_name_plural': 'Transaction Analytics Rollups',
+                'ordering': ['-period_start'],
+                'unique_together': {('user', 'period', 'period_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0010_transactionanalyticsrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingInsight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wallet_version', models.PositiveBigIntegerField(default=0)),
+                ('transactions', models.PositiveIntegerField(default=0, help_text='Transactions analysed')),
+                ('data', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='spending_insight', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Spending Insight',
+                'verbose_name_plural': 'Spending Insights',
+            },
+        ),
+    ]
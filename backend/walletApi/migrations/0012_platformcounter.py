@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:49
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0011_spendinginsight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=6)),
+                ('bucket_start', models.DateTimeField(help_text='UTC start of the minute, hour or day; the epoch for all-time rows')),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('transactions', models.BigIntegerField(default=0, help_text='Completed ledger entries')),
+                ('credit_volume', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('debit_volume', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('failed', models.BigIntegerField(default=0, help_text='Rejected transfers, deposits and bill payments')),
+                ('wallets_opened', models.BigIntegerField(default=0)),
+                ('active_wallets', models.BigIntegerField(default=0, help_text='Day rows: wallets with a completed transaction')),
+                ('float_balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='All-time rows: sum of wallet balances', max_digits=18)),
+            ],
+            options={
+                'verbose_name': 'Platform Counter',
+                'verbose_name_plural': 'Platform Counters',
+                'ordering': ['-bucket_start'],
+                'unique_together': {('period', 'bucket_start', 'shard')},
+            },
+        ),
+    ]
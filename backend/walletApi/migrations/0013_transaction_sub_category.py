@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walletApi', '0012_platformcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='sub_category',
+            field=models.CharField(blank=True, choices=[('rent', 'Rent'), ('food', 'Food'), ('family', 'Family'), ('utilities', 'Utilities'), ('other', 'Other')], help_text='Transfers only; blank until labeled', max_length=20),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from authApi.models import CustomUser
@@ -17,6 +18,8 @@ class Wallet(models.Model):
     is_active = models.BooleanField(default=True)
     is_frozen = models.BooleanField(default=False, help_text="Frozen wallets cannot transact")
 
+    version = models.PositiveBigIntegerField(default=0, editable=False, help_text="Incremented on every write, used for ETags")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -27,6 +30,14 @@ class Wallet(models.Model):
     def __str__(self):
         return f"Wallet for {self.user.phone_number} - Balance: {self.currency} {self.balance}"
 
+    def save(self, *args, **kwargs):
+        # Ledger writes hold a row lock, so a plain increment is race free there
+        self.version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+
     def can_transact(self, amount):
         """Check if wallet can make a transaction"""
         return self.is_active and not self.is_frozen and self.balance >= amount
@@ -55,6 +66,15 @@ class Transaction(models.Model):
         ('bonus', 'Bonus'),
     )
 
+    # What a transfer was for, assigned from its narration by walletApi.categorizer
+    SUB_CATEGORIES = (
+        ('rent', 'Rent'),
+        ('food', 'Food'),
+        ('family', 'Family'),
+        ('utilities', 'Utilities'),
+        ('other', 'Other'),
+    )
+
     # Transaction identification
     reference = models.CharField(max_length=50, unique=True, db_index=True)
 
@@ -66,6 +86,7 @@ class Transaction(models.Model):
     # Transaction details
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     transaction_category = models.CharField(max_length=20, choices=TRANSACTION_CATEGORIES, default='transfer')
+    sub_category = models.CharField(max_length=20, choices=SUB_CATEGORIES, blank=True, help_text="Transfers only; blank until labeled")
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     currency = models.CharField(max_length=3, default='USD')
 
@@ -175,6 +196,87 @@ class TransactionAnalytics(models.Model):
         return f"Analytics for {self.user.phone_number} - {self.date}"
 
 
+class TransactionAnalyticsRollup(models.Model):
+    """Weekly, monthly and yearly totals of TransactionAnalytics, kept up to date with it"""
+    PERIODS = (
+        ('week', 'Week'),
+        ('month', 'Month'),
+        ('year', 'Year'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='analytics_rollups')
+    period = models.CharField(max_length=5, choices=PERIODS)
+    period_start = models.DateField(help_text="Monday, first of the month or January 1st")
+
+    total_credits = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    total_debits = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    total_transactions = models.IntegerField(default=0)
+
+    transfers_sent = models.IntegerField(default=0)
+    transfers_received = models.IntegerField(default=0)
+    bill_payments = models.IntegerField(default=0)
+    airtime_purchases = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Transaction Analytics Rollup'
+        verbose_name_plural = 'Transaction Analytics Rollups'
+        unique_together = ['user', 'period', 'period_start']
+        ordering = ['-period_start']
+
+    def __str__(self):
+        return f"{self.period.title()} analytics for {self.user.phone_number} - {self.period_start}"
+
+
+class SpendingInsight(models.Model):
+    """Precomputed spending insights, valid while the wallet version matches"""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='spending_insight')
+    wallet_version = models.PositiveBigIntegerField(default=0)
+    transactions = models.PositiveIntegerField(default=0, help_text="Transactions analysed")
+    data = models.JSONField(default=dict)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Spending Insight'
+        verbose_name_plural = 'Spending Insights'
+
+    def __str__(self):
+        return f"Spending insights for {self.user.phone_number}"
+
+
+class PlatformCounter(models.Model):
+    """Platform-wide totals per minute, hour, day and all time, split over shards to spread write contention"""
+    PERIODS = (
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('total', 'All time'),
+    )
+
+    period = models.CharField(max_length=6, choices=PERIODS)
+    bucket_start = models.DateTimeField(help_text="UTC start of the minute, hour or day; the epoch for all-time rows")
+    shard = models.PositiveSmallIntegerField(default=0)
+
+    transactions = models.BigIntegerField(default=0, help_text="Completed ledger entries")
+    credit_volume = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    debit_volume = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    failed = models.BigIntegerField(default=0, help_text="Rejected transfers, deposits and bill payments")
+    wallets_opened = models.BigIntegerField(default=0)
+    active_wallets = models.BigIntegerField(default=0, help_text="Day rows: wallets with a completed transaction")
+    float_balance = models.DecimalField(
+        max_digits=18, decimal_places=2, default=Decimal('0.00'),
+        help_text="All-time rows: sum of wallet balances"
+    )
+
+    class Meta:
+        verbose_name = 'Platform Counter'
+        verbose_name_plural = 'Platform Counters'
+        unique_together = ['period', 'bucket_start', 'shard']
+        ordering = ['-bucket_start']
+
+    def __str__(self):
+        return f"{self.get_period_display()} counters from {self.bucket_start:%Y-%m-%d %H:%M} (shard {self.shard})"
+
+
 class CustomerServiceChat(models.Model):
     """Chat sessions with AI customer service"""
     CHAT_STATUS = (
@@ -197,6 +299,10 @@ class CustomerServiceChat(models.Model):
     ai_model_used = models.CharField(max_length=50, default='gpt-4')
     total_messages = models.IntegerField(default=0)
 
+    # Rolling summary of turns that no longer fit in the prompt window
+    summary = models.TextField(blank=True)
+    summarized_through = models.BigIntegerField(default=0, help_text="Last message id folded into the summary")
+
     resolved_by_ai = models.BooleanField(default=False)
 
     class Meta:
@@ -222,14 +328,78 @@ class ChatMessage(models.Model):
 
     # AI metadata
     tokens_used = models.IntegerField(null=True, blank=True)
+    prompt_tokens = models.IntegerField(null=True, blank=True, help_text="Prompt tokens sent for this reply")
+    cached_tokens = models.IntegerField(null=True, blank=True, help_text="Prompt tokens served from the provider cache")
+    prompt_version = models.CharField(max_length=20, blank=True, help_text="Version of the static system prompt")
+    route_tier = models.CharField(max_length=10, blank=True, help_text="Routing tier that answered: local, fast or large")
     response_time_ms = models.IntegerField(null=True, blank=True, help_text="AI response time in milliseconds")
+    first_token_ms = models.IntegerField(null=True, blank=True, help_text="Time to first streamed token in milliseconds")
 
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = 'Chat Message'
         verbose_name_plural = 'Chat Messages'
-        ordering = ['created_at']
+        # A turn's user and AI messages are inserted together with the same timestamp
+        ordering = ['created_at', 'id']
 
     def __str__(self):
         return f"{self.message_type} - {self.created_at}"
+
+
+class TokenUsageDaily(models.Model):
+    """Daily AI token usage per user"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='token_usage')
+    date = models.DateField(db_index=True)
+
+    tokens_used = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Token Usage'
+        verbose_name_plural = 'Token Usage'
+        unique_together = ['user', 'date']
+        ordering = ['-date', '-tokens_used']
+
+    def __str__(self):
+        return f"Token usage for {self.user.phone_number} - {self.date}"
+
+
+class EscalationTicket(models.Model):
+    """A support chat waiting for, or handled by, a human agent"""
+    TICKET_STATUS = (
+        ('queued', 'Queued'),
+        ('claimed', 'Claimed'),
+        ('resolved', 'Resolved'),
+    )
+
+    chat = models.OneToOneField(CustomerServiceChat, on_delete=models.CASCADE, related_name='escalation')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='escalations')
+    status = models.CharField(max_length=20, choices=TICKET_STATUS, default='queued')
+
+    priority = models.PositiveSmallIntegerField(default=0, help_text="0-100, from sentiment and wallet value")
+    due_at = models.DateTimeField(help_text="Answer-by time; the queue is served in due_at order")
+
+    claimed_by = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_escalations'
+    )
+
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolution_note = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = 'Escalation Ticket'
+        verbose_name_plural = 'Escalation Tickets'
+        ordering = ['due_at']
+        indexes = [
+            # Agent polling reads the head of this index and nothing else
+            models.Index(fields=['due_at'], condition=models.Q(status='queued'), name='escalation_queue_idx'),
+            models.Index(fields=['claimed_by', 'status'], name='escalation_agent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Escalation {self.chat.session_id} - {self.status}"
@@ -0,0 +1,397 @@
+"""
+Platform-wide counters for the operations dashboard.
+
+Every completed ledger entry, rejected transaction request and new wallet
+is added to PlatformCounter rows for its UTC minute, hour and day and to
+the all-time row, with one multi-row INSERT ... ON CONFLICT DO UPDATE in
+the same database transaction as the change it counts. The all-time row
+also carries the platform float, the sum of wallet balances.
+
+Every write on the platform would otherwise queue on the same few rows,
+so each bucket is split into PLATFORM_COUNTER_SHARDS rows and a write
+goes to the shard of its wallet; readers sum the shards. The dashboard
+reads a few dozen rows and never touches Transaction.
+
+New wallets are counted by a post_save receiver on Wallet, so signup,
+the admin and scripts all add to wallets_opened and the float.
+
+Active wallets are only counted per day: the daily analytics upsert tells
+whether an entry is its user's first of the day.
+
+reconcile_buckets() and reconcile_totals() rewrite closed buckets and the
+all-time row from the ledger and wallet table, for the
+reconcile_platform_counters command.
+Rejected requests are not in the ledger, so their counts are kept.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.db.models.signals import post_save
+from django.utils import timezone
+from . import metrics
+from .analytics import CENTS, build_upsert_sql
+from .models import PlatformCounter, Transaction, Wallet
+import logging
+
+logger = logging.getLogger(__name__)
+
+PERIOD_MINUTE = 'minute'
+PERIOD_HOUR = 'hour'
+PERIOD_DAY = 'day'
+PERIOD_TOTAL = 'total'
+BUCKET_PERIODS = (PERIOD_MINUTE, PERIOD_HOUR, PERIOD_DAY)
+PERIOD_LENGTHS = {
+    PERIOD_MINUTE: timedelta(minutes=1),
+    PERIOD_HOUR: timedelta(hours=1),
+    PERIOD_DAY: timedelta(days=1),
+}
+PERIOD_TRUNCS = {PERIOD_MINUTE: TruncMinute, PERIOD_HOUR: TruncHour, PERIOD_DAY: TruncDay}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+KEY_COLUMNS = ('period', 'bucket_start', 'shard')
+COUNTER_COLUMNS = (
+    'transactions', 'credit_volume', 'debit_volume', 'failed',
+    'wallets_opened', 'active_wallets', 'float_balance',
+)
+AMOUNT_COLUMNS = ('credit_volume', 'debit_volume', 'float_balance')
+# Columns reconcile() recomputes; failed is only known to the request path
+LEDGER_COLUMNS = tuple(column for column in COUNTER_COLUMNS if column != 'failed')
+
+HOURLY_POINTS = 24
+DAILY_POINTS = 30
+
+ledger_failures = metrics.counter(
+    'ledger_failed_requests_total', 'Transaction requests rejected or failed on the ledger path'
+)
+
+
+def truncate(period, moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    if period == PERIOD_MINUTE:
+        return moment.replace(second=0, microsecond=0)
+    if period == PERIOD_HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if period == PERIOD_DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return EPOCH
+
+
+def shard_for(key):
+    return key % max(settings.PLATFORM_COUNTER_SHARDS, 1)
+
+
+def add_to_counters(moment, shard, deltas, day_deltas=None, total_deltas=None):
+    """
+    Add deltas to the minute, hour, day and all-time rows of one shard in
+    a single statement; day_deltas and total_deltas only go to those rows
+    """
+    ops = connection.ops
+    sql = build_upsert_sql(
+        PlatformCounter, KEY_COLUMNS, COUNTER_COLUMNS, rows=len(BUCKET_PERIODS) + 1,
+        counter_columns=COUNTER_COLUMNS
+    )
+    params = []
+    for period in BUCKET_PERIODS + (PERIOD_TOTAL,):
+        row = dict(deltas)
+        if period == PERIOD_DAY:
+            row.update(day_deltas or {})
+        elif period == PERIOD_TOTAL:
+            row.update(total_deltas or {})
+        params.extend([period, ops.adapt_datetimefield_value(truncate(period, moment)), shard])
+        params.extend(
+            ops.adapt_decimalfield_value(Decimal(row.get(column, 0))) if column in AMOUNT_COLUMNS
+            else row.get(column, 0)
+            for column in COUNTER_COLUMNS
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def count_transaction(txn, first_of_day=False):
+    """Add a completed ledger entry; first_of_day marks its user's first entry of the UTC day"""
+    signed = txn.amount if txn.transaction_type == 'credit' else -txn.amount
+    add_to_counters(
+        txn.created_at or timezone.now(),
+        shard_for(txn.wallet_id),
+        {
+            'transactions': 1,
+            'credit_volume': txn.amount if txn.transaction_type == 'credit' else 0,
+            'debit_volume': txn.amount if txn.transaction_type == 'debit' else 0,
+        },
+        day_deltas={'active_wallets': 1 if first_of_day else 0},
+        total_deltas={'float_balance': signed},
+    )
+
+
+def count_failure(user_id):
+    """
+    Add a rejected transaction request. Runs after the request's own
+    transaction has rolled back, so a counter write that fails is logged
+    rather than turning the rejection into a server error.
+    """
+    try:
+        add_to_counters(timezone.now(), shard_for(user_id or 0), {'failed': 1})
+    except DatabaseError as e:
+        logger.warning(f"Could not count failed transaction: {str(e)}")
+    ledger_failures.inc()
+
+
+def count_wallet_opened(wallet):
+    """Add a new wallet and its opening balance"""
+    add_to_counters(
+        wallet.created_at or timezone.now(),
+        shard_for(wallet.id),
+        {'wallets_opened': 1},
+        total_deltas={'float_balance': wallet.balance},
+    )
+
+
+def count_new_wallet(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver: every new wallet is counted once, whatever code created it"""
+    if created and not raw:
+        count_wallet_opened(instance)
+
+
+post_save.connect(count_new_wallet, sender=Wallet, dispatch_uid='walletApi.platform_counters.count_new_wallet')
+
+
+def empty_totals():
+    totals = dict.fromkeys(COUNTER_COLUMNS, 0)
+    totals.update({column: Decimal('0.00') for column in AMOUNT_COLUMNS})
+    return totals
+
+
+def as_totals(row):
+    totals = empty_totals()
+    for column in COUNTER_COLUMNS:
+        value = row.get(column) or 0
+        totals[column] = Decimal(str(value)).quantize(CENTS) if column in AMOUNT_COLUMNS else int(value)
+    return totals
+
+
+def kpis(totals):
+    attempts = totals['transactions'] + totals['failed']
+    return {
+        'transactions': totals['transactions'],
+        'credit_volume': totals['credit_volume'],
+        'debit_volume': totals['debit_volume'],
+        'net_flow': totals['credit_volume'] - totals['debit_volume'],
+        'failed': totals['failed'],
+        'failure_rate': round(totals['failed'] / attempts, 4) if attempts else 0.0,
+        'wallets_opened': totals['wallets_opened'],
+    }
+
+
+def bucket_kpis(period, totals):
+    values = kpis(totals)
+    if period == PERIOD_DAY:
+        values['active_wallets'] = totals['active_wallets']
+    return values
+
+
+def dashboard(now=None):
+    """Platform KPIs for the last hour, day and month and all time, from one grouped read of the counters"""
+    now = now or timezone.now()
+    minute_from = truncate(PERIOD_MINUTE, now) - timedelta(minutes=59)
+    hour_from = truncate(PERIOD_HOUR, now) - timedelta(hours=HOURLY_POINTS - 1)
+    day_from = truncate(PERIOD_DAY, now) - timedelta(days=DAILY_POINTS - 1)
+
+    rows = (
+        PlatformCounter.objects
+        .filter(
+            Q(period=PERIOD_MINUTE, bucket_start__gte=minute_from)
+            | Q(period=PERIOD_HOUR, bucket_start__gte=hour_from)
+            | Q(period=PERIOD_DAY, bucket_start__gte=day_from)
+            | Q(period=PERIOD_TOTAL)
+        )
+        .values('period', 'bucket_start')
+        .annotate(**{column: Sum(column) for column in COUNTER_COLUMNS})
+        .order_by('bucket_start')
+    )
+
+    buckets = {period: {} for period in BUCKET_PERIODS}
+    total = empty_totals()
+    for row in rows:
+        if row['period'] == PERIOD_TOTAL:
+            total = as_totals(row)
+        else:
+            buckets[row['period']][row['bucket_start']] = as_totals(row)
+
+    def series(period, first, points):
+        starts = (first + PERIOD_LENGTHS[period] * index for index in range(points))
+        return [{'start': start, **bucket_kpis(period, buckets[period].get(start, empty_totals()))} for start in starts]
+
+    def combined(period):
+        totals = empty_totals()
+        for row in buckets[period].values():
+            for column in COUNTER_COLUMNS:
+                totals[column] += row[column]
+        return kpis(totals)
+
+    today = buckets[PERIOD_DAY].get(truncate(PERIOD_DAY, now), empty_totals())
+    return {
+        'generated_at': now,
+        'float': total['float_balance'],
+        'all_time': {**kpis(total), 'wallets': total['wallets_opened']},
+        'today': bucket_kpis(PERIOD_DAY, today),
+        'last_60_minutes': combined(PERIOD_MINUTE),
+        'last_24_hours': combined(PERIOD_HOUR),
+        'hourly': series(PERIOD_HOUR, hour_from, HOURLY_POINTS),
+        'daily': series(PERIOD_DAY, day_from, DAILY_POINTS),
+    }
+
+
+def ledger_totals(queryset):
+    """Counter values of a completed-transaction queryset, as aggregate expressions"""
+    zero = Value(Decimal('0.00'))
+    amount = F('amount')
+    return {
+        'transactions': Count('id'),
+        'credit_volume': Sum(Case(When(transaction_type='credit', then=amount), default=zero,
+                                  output_field=DecimalField())),
+        'debit_volume': Sum(Case(When(transaction_type='debit', then=amount), default=zero,
+                                 output_field=DecimalField())),
+    }
+
+
+def ledger_buckets(period, start, end):
+    """{bucket start: counter values} from the ledger and wallet table for buckets in [start, end)"""
+    trunc = PERIOD_TRUNCS[period]
+    completed = Transaction.objects.filter(status='completed', created_at__gte=start, created_at__lt=end).order_by()
+    aggregates = ledger_totals(completed)
+    if period == PERIOD_DAY:
+        aggregates['active_wallets'] = Count('wallet_id', distinct=True)
+
+    buckets = {}
+    for row in (
+        completed.annotate(bucket=trunc('created_at', tzinfo=dt_timezone.utc))
+        .values('bucket').annotate(**aggregates)
+    ):
+        buckets[row.pop('bucket')] = as_totals(row)
+
+    opened = (
+        Wallet.objects.filter(created_at__gte=start, created_at__lt=end).order_by()
+        .annotate(bucket=trunc('created_at', tzinfo=dt_timezone.utc))
+        .values('bucket').annotate(wallets_opened=Count('id'))
+    )
+    for row in opened:
+        buckets.setdefault(row['bucket'], empty_totals())['wallets_opened'] = row['wallets_opened']
+    return buckets
+
+
+def stored_buckets(period, start, end):
+    """{bucket start: counter values} summed over shards for buckets in [start, end)"""
+    return {
+        row.pop('bucket_start'): as_totals(row)
+        for row in (
+            PlatformCounter.objects
+            .filter(period=period, bucket_start__gte=start, bucket_start__lt=end)
+            .values('bucket_start')
+            .annotate(**{column: Sum(column) for column in COUNTER_COLUMNS})
+            .order_by()
+        )
+    }
+
+
+def differences(stored, computed):
+    """[(bucket, column, stored, computed)] for ledger columns that disagree"""
+    found = []
+    for bucket in sorted(stored.keys() | computed.keys()):
+        old = stored.get(bucket, empty_totals())
+        new = computed.get(bucket, empty_totals())
+        found.extend(
+            (bucket, column, old[column], new[column])
+            for column in LEDGER_COLUMNS if old[column] != new[column]
+        )
+    return found
+
+
+def write_buckets(period, start, end, stored, computed):
+    """Replace the rows of [start, end) with one shard-0 row per bucket, keeping failed counts"""
+    rows = []
+    for bucket in stored.keys() | computed.keys():
+        values = computed.get(bucket, empty_totals())
+        values['failed'] = stored.get(bucket, empty_totals())['failed']
+        if any(values[column] for column in COUNTER_COLUMNS):
+            rows.append(PlatformCounter(period=period, bucket_start=bucket, shard=0, **values))
+
+    PlatformCounter.objects.filter(period=period, bucket_start__gte=start, bucket_start__lt=end).delete()
+    PlatformCounter.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def reconcile_buckets(period, start, now=None, dry_run=False):
+    """
+    Rewrite the closed buckets of `period` from `start` up to the open
+    one from the ledger. Returns (rows written, differences found).
+    """
+    end = truncate(period, now or timezone.now())
+    start = truncate(period, start)
+    if start >= end:
+        return 0, []
+
+    computed = ledger_buckets(period, start, end)
+    with transaction.atomic():
+        stored = stored_buckets(period, start, end)
+        found = differences(stored, computed)
+        written = 0 if dry_run else write_buckets(period, start, end, stored, computed)
+    return written, found
+
+
+def reconcile_totals(dry_run=False):
+    """
+    Rewrite the all-time row from the whole ledger and the wallet table.
+
+    The ledger is summed up to its current last id without locks. The
+    all-time rows are then locked, which waits for transactions that have
+    already counted themselves, and the entries after that id, the float
+    and the wallet count are read before writing.
+    """
+    last_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+    completed = Transaction.objects.filter(status='completed').order_by()
+    before = as_totals(completed.filter(id__lte=last_id).aggregate(**ledger_totals(completed)))
+
+    with transaction.atomic():
+        locked = list(PlatformCounter.objects.select_for_update().filter(period=PERIOD_TOTAL).order_by('shard'))
+        stored = empty_totals()
+        for row in locked:
+            for column in COUNTER_COLUMNS:
+                stored[column] += getattr(row, column)
+
+        after = as_totals(completed.filter(id__gt=last_id).aggregate(**ledger_totals(completed)))
+        wallets = Wallet.objects.aggregate(count=Count('id'), balance=Sum('balance'))
+        computed = empty_totals()
+        for column in ('transactions', 'credit_volume', 'debit_volume'):
+            computed[column] = before[column] + after[column]
+        computed['wallets_opened'] = wallets['count']
+        computed['float_balance'] = Decimal(str(wallets['balance'] or 0)).quantize(CENTS)
+
+        found = differences({EPOCH: stored}, {EPOCH: computed})
+        if not dry_run:
+            computed['failed'] = stored['failed']
+            PlatformCounter.objects.filter(period=PERIOD_TOTAL).delete()
+            PlatformCounter.objects.create(period=PERIOD_TOTAL, bucket_start=EPOCH, shard=0, **computed)
+    return found
+
+
+def retention_start(period, now):
+    """First bucket of `period` that is kept; minute and hour rows before it are pruned"""
+    if period == PERIOD_MINUTE:
+        return truncate(period, now - timedelta(hours=settings.PLATFORM_COUNTER_MINUTE_RETENTION_HOURS))
+    if period == PERIOD_HOUR:
+        return truncate(period, now - timedelta(days=settings.PLATFORM_COUNTER_HOUR_RETENTION_DAYS))
+    return EPOCH
+
+
+def prune(now=None):
+    """Delete minute and hour rows past their retention; returns rows deleted"""
+    now = now or timezone.now()
+    deleted, _ = PlatformCounter.objects.filter(
+        Q(period=PERIOD_MINUTE, bucket_start__lt=retention_start(PERIOD_MINUTE, now))
+        | Q(period=PERIOD_HOUR, bucket_start__lt=retention_start(PERIOD_HOUR, now))
+    ).delete()
+    return deleted
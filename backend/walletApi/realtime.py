@@ -0,0 +1,254 @@
+"""
+Real-time wallet events.
+
+Ledger code publishes balance and transaction events after commit, and
+connected clients receive them over Server-Sent Events or WebSockets.
+Delivery goes through a pluggable backend, chosen with REALTIME_BACKEND:
+
+- InProcessBackend fans events out to subscribers in the same process. It
+  is the default and what tests use.
+- RedisBackend publishes through Redis pub/sub so every worker sees every
+  event. Each worker holds one Redis subscription and fans out locally.
+  It needs the redis package (the 'realtime' extra). A lost subscription
+  is re-established with backoff; events published while it is down are
+  missed, so clients should refresh the balance after reconnecting.
+
+A subscriber is an asyncio.Queue bound to its event loop, so an idle
+connection costs a coroutine and a small queue. Tens of thousands fit in
+one worker.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Delay before the Redis listener resubscribes, doubled after each failure
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+
+def wallet_channel(user_id):
+    return f"wallet:{user_id}"
+
+
+def encode_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class Subscription:
+    """A bounded event queue read by one connection"""
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop. Slow consumers lose the oldest events
+        # rather than holding memory for them.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Wait for the next event; returns None when timeout expires first"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBackend:
+    """Fan out events to subscribers in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        """Deliver a message; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(subscription)
+
+    async def subscribe(self, channel):
+        subscription = Subscription(channel, settings.REALTIME_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class RedisBackend(InProcessBackend):
+    """Publish through Redis pub/sub; each worker fans out to its own subscribers"""
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RedisBackend requires the redis package. Install with: pip install 'redis>=5.0.1'")
+
+        self._url = settings.REALTIME_REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+        self._listeners = {}
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.done():
+            self._listeners[loop] = loop.create_task(self._listen())
+        return await super().subscribe(channel)
+
+    async def _listen(self):
+        """Fan out Redis events to this loop's subscribers, resubscribing whenever the connection drops"""
+        import redis.asyncio
+
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            client = redis.asyncio.Redis.from_url(self._url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(wallet_channel('*'))
+                if delay > RECONNECT_MIN_SECONDS:
+                    logger.info("Realtime listener resubscribed to Redis")
+                delay = RECONNECT_MIN_SECONDS
+                async for item in pubsub.listen():
+                    if item['type'] != 'pmessage':
+                        continue
+                    try:
+                        InProcessBackend.publish(self, item['channel'].decode(), json.loads(item['data']))
+                    except (ValueError, UnicodeDecodeError) as e:
+                        logger.error(f"Dropping malformed realtime event: {str(e)}")
+                logger.warning(f"Realtime Redis subscription ended, resubscribing in {delay:.1f}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime Redis listener failed, resubscribing in {delay:.1f}s: {str(e)}")
+            finally:
+                await self._close(pubsub, client)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    @staticmethod
+    async def _close(pubsub, client):
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.info(f"Error closing realtime Redis connection: {str(e)}")
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.REALTIME_BACKEND)()
+
+
+def publish_wallet_event(user_id, event_type, data):
+    """Publish an event to a user's wallet channel once the current transaction commits"""
+    message = {'type': event_type, 'data': data}
+    channel = wallet_channel(user_id)
+
+    def send():
+        try:
+            get_backend().publish(channel, message)
+        except Exception as e:
+            # Notifications must never fail a committed ledger write
+            logger.error(f"Realtime publish failed for {channel}: {str(e)}")
+
+    transaction.on_commit(send)
+
+
+async def sse_event_stream(user_id):
+    """Yield a user's wallet events encoded as Server-Sent Events"""
+    heartbeat = settings.REALTIME_HEARTBEAT_SECONDS
+    backend = get_backend()
+    subscription = await backend.subscribe(wallet_channel(user_id))
+    try:
+        yield b"retry: 5000\n\n"
+        while True:
+            message = await subscription.get(timeout=heartbeat)
+            if message is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+                continue
+            yield encode_sse(message['type'], message['data'])
+    finally:
+        backend.unsubscribe(subscription)
+
+
+async def websocket_application(scope, receive, send):
+    """
+    Raw ASGI app serving wallet events at /ws/wallet/.
+
+    Authenticates with the access token from the Authorization header or
+    ?token=, then forwards each event as a JSON text frame until the client
+    disconnects.
+    """
+    from .authentication import aget_user_from_token, get_raw_token_from_scope
+
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    if scope['path'].rstrip('/') != '/ws/wallet':
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    user = await aget_user_from_token(get_raw_token_from_scope(scope))
+    if user is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    async def forward_events(subscription):
+        while True:
+            message = await subscription.get()
+            await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def wait_for_disconnect():
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+
+    backend = get_backend()
+    subscription = await backend.subscribe(wallet_channel(user.pk))
+    tasks = [
+        asyncio.create_task(forward_events(subscription)),
+        asyncio.create_task(wait_for_disconnect()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        backend.unsubscribe(subscription)
@@ -0,0 +1,256 @@
+"""
+Inline risk scoring for transfers.
+
+Each user has a compact feature state in the default cache:
+- debits in the last RISK_VELOCITY_WINDOW_SECONDS, for velocity;
+- a running count, mean and variance of log debit amounts, for the
+  amount z-score;
+- the recipients they have paid most recently, for new beneficiaries;
+- when their device and account number last changed.
+
+The state is updated in place by events once their transaction commits:
+each completed debit, and each device or account number change, so
+rolled-back transfers never count. It is only built from history when it
+is missing from the cache. Scoring a transfer is
+one cache read and some arithmetic.
+
+Each feature adds up to its weight to a score from 0 to 100. Scores at
+RISK_HOLD_SCORE or above hold the transfer until the user confirms it
+with their transaction PIN; scores at RISK_BLOCK_SCORE or above block it.
+"""
+import math
+import time
+from typing import NamedTuple
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+from .models import BeneficiaryContact, Transaction
+from authApi.models import AccountNumberChangeLog, DeviceChangeLog
+import logging
+
+logger = logging.getLogger(__name__)
+
+ALLOW = 'allow'
+HOLD = 'hold'
+BLOCK = 'block'
+
+STATE_VERSION = 1
+STATE_TTL = 7 * 24 * 60 * 60
+HISTORY_SIZE = 200
+MAX_BENEFICIARIES = 200
+MIN_AMOUNT_HISTORY = 5
+# Floor for the log-amount deviation, so users who always send the same amount are not flagged for cents
+MIN_DEVIATION = 0.25
+
+# Most each feature adds to the score
+VELOCITY_WEIGHT = 30
+AMOUNT_WEIGHT = 30
+NEW_BENEFICIARY_WEIGHT = 20
+DEVICE_CHANGE_WEIGHT = 25
+ACCOUNT_CHANGE_WEIGHT = 20
+# Added when a new beneficiary follows a recent device or account change
+TAKEOVER_WEIGHT = 15
+
+risk_decisions = metrics.counter(
+    'risk_decisions_total', 'Transfer risk decisions', ['action']
+)
+risk_state_builds = metrics.counter(
+    'risk_state_builds_total', 'Risk feature states built from history after a cache miss'
+)
+risk_scoring_seconds = metrics.histogram(
+    'risk_scoring_seconds', 'Time to score a transfer',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+)
+
+
+class RiskDecision(NamedTuple):
+    action: str
+    score: int
+    reasons: tuple
+
+
+def state_key(user_id):
+    return f"risk:state:{user_id}"
+
+
+def new_state():
+    return {
+        'v': STATE_VERSION,
+        'recent': [],        # epoch seconds of debits inside the velocity window, up to the limit
+        'n': 0,              # debits seen
+        'mean': 0.0,         # mean of log1p(amount)
+        'm2': 0.0,           # sum of squared deviations of log1p(amount)
+        'payees': [],        # recipient ids, most recent last
+        'device_changed': None,
+        'account_changed': None,
+    }
+
+
+def add_amount(state, amount):
+    """Welford update of the log-amount mean and variance"""
+    value = math.log1p(float(amount))
+    state['n'] += 1
+    delta = value - state['mean']
+    state['mean'] += delta / state['n']
+    state['m2'] += delta * (value - state['mean'])
+
+
+def add_payee(state, recipient_id):
+    payees = state['payees']
+    if recipient_id in payees:
+        payees.remove(recipient_id)
+    payees.append(recipient_id)
+    del payees[:-MAX_BENEFICIARIES]
+
+
+def add_recent(state, moment, now):
+    # Velocity saturates at the limit, so older entries past it are not needed
+    cutoff = now - settings.RISK_VELOCITY_WINDOW_SECONDS
+    recent = [seen for seen in state['recent'] if seen >= cutoff]
+    if moment >= cutoff:
+        recent.append(moment)
+    state['recent'] = recent[-max(settings.RISK_VELOCITY_LIMIT, 1):]
+
+
+def build_state(user_id):
+    """Feature state from the user's history, for a cache miss"""
+    state = new_state()
+    debits = list(
+        Transaction.objects
+        .filter(wallet__user_id=user_id, transaction_type='debit', status='completed')
+        .order_by('-id')
+        .values_list('created_at', 'amount')[:HISTORY_SIZE]
+    )
+    now = time.time()
+    for created_at, amount in reversed(debits):
+        add_amount(state, amount)
+        add_recent(state, created_at.timestamp(), now)
+
+    state['payees'] = list(reversed(
+        BeneficiaryContact.objects.filter(user_id=user_id)
+        .order_by('-last_transaction_at')
+        .values_list('beneficiary_id', flat=True)[:MAX_BENEFICIARIES]
+    ))
+
+    device_changed = DeviceChangeLog.objects.filter(user_id=user_id).order_by('-changed_at').values_list(
+        'changed_at', flat=True
+    ).first()
+    account_changed = AccountNumberChangeLog.objects.filter(user_id=user_id).order_by('-changed_at').values_list(
+        'changed_at', flat=True
+    ).first()
+    state['device_changed'] = device_changed.timestamp() if device_changed else None
+    state['account_changed'] = account_changed.timestamp() if account_changed else None
+
+    risk_state_builds.inc()
+    return state
+
+
+def get_state(user_id):
+    state = cache.get(state_key(user_id))
+    if state is None or state.get('v') != STATE_VERSION:
+        state = build_state(user_id)
+        cache.set(state_key(user_id), state, STATE_TTL)
+    return state
+
+
+def observe_debit(txn):
+    """
+    Add a completed debit to its owner's state. Runs after the ledger
+    transaction commits; a state built from history on a miss already
+    includes the debit.
+    """
+    user_id = txn.wallet.user_id
+    state = cache.get(state_key(user_id))
+    if state is None or state.get('v') != STATE_VERSION:
+        cache.set(state_key(user_id), build_state(user_id), STATE_TTL)
+        return
+
+    moment = txn.created_at.timestamp() if txn.created_at else time.time()
+    add_recent(state, moment, time.time())
+    add_amount(state, txn.amount)
+    if txn.transaction_category == 'transfer' and txn.recipient_id:
+        add_payee(state, txn.recipient_id)
+    cache.set(state_key(user_id), state, STATE_TTL)
+
+
+def observe_change(user_id, field, changed_at):
+    """Record a device ('device_changed') or account number ('account_changed') change"""
+    state = cache.get(state_key(user_id))
+    if state is None or state.get('v') != STATE_VERSION:
+        # The next read builds the state from the change logs
+        return
+    state[field] = changed_at.timestamp()
+    cache.set(state_key(user_id), state, STATE_TTL)
+
+
+def recency(changed_at, now):
+    """1.0 for a change just now, falling to 0 after RISK_RECENT_CHANGE_HOURS"""
+    if changed_at is None:
+        return 0.0
+    window = settings.RISK_RECENT_CHANGE_HOURS * 3600
+    return max(0.0, 1.0 - (now - changed_at) / window) if window else 0.0
+
+
+def score_state(state, recipient_id, amount, now):
+    """(score, reasons) for a transfer of `amount` to recipient_id given a feature state"""
+    score = 0.0
+    reasons = []
+
+    window_start = now - settings.RISK_VELOCITY_WINDOW_SECONDS
+    recent = sum(1 for seen in state['recent'] if seen >= window_start)
+    if recent:
+        velocity = min(recent / max(settings.RISK_VELOCITY_LIMIT, 1), 1.0)
+        score += VELOCITY_WEIGHT * velocity
+        if velocity >= 0.5:
+            reasons.append('velocity')
+
+    if state['n'] >= MIN_AMOUNT_HISTORY:
+        deviation = max(math.sqrt(state['m2'] / (state['n'] - 1)), MIN_DEVIATION)
+        z_score = (math.log1p(float(amount)) - state['mean']) / deviation
+        # Amounts within a deviation of usual add nothing; four or more add the full weight
+        unusual = min(max((z_score - 1) / 3, 0.0), 1.0)
+        score += AMOUNT_WEIGHT * unusual
+        if unusual >= 0.5:
+            reasons.append('unusual_amount')
+
+    new_beneficiary = recipient_id not in state['payees']
+    if new_beneficiary:
+        # Everyone pays someone new sometimes; it matters more for users with a history
+        score += NEW_BENEFICIARY_WEIGHT * (1.0 if state['n'] else 0.5)
+        reasons.append('new_beneficiary')
+
+    device = recency(state['device_changed'], now)
+    account = recency(state['account_changed'], now)
+    if device:
+        score += DEVICE_CHANGE_WEIGHT * device
+        reasons.append('recent_device_change')
+    if account:
+        score += ACCOUNT_CHANGE_WEIGHT * account
+        reasons.append('recent_account_change')
+    if new_beneficiary and max(device, account) >= 0.5:
+        score += TAKEOVER_WEIGHT
+        reasons.append('new_beneficiary_after_change')
+
+    return min(int(round(score)), 100), tuple(reasons)
+
+
+def score_transfer(user_id, recipient_id, amount):
+    """RiskDecision for a transfer about to be made"""
+    if not settings.RISK_SCORING_ENABLED:
+        return RiskDecision(ALLOW, 0, ())
+
+    started = time.perf_counter()
+    now = time.time()
+    score, reasons = score_state(get_state(user_id), recipient_id, amount, now)
+    if score >= settings.RISK_BLOCK_SCORE:
+        action = BLOCK
+    elif score >= settings.RISK_HOLD_SCORE:
+        action = HOLD
+    else:
+        action = ALLOW
+    risk_scoring_seconds.observe(time.perf_counter() - started)
+    risk_decisions.inc(action=action)
+
+    if action != ALLOW:
+        logger.warning(f"Transfer by user {user_id} to {recipient_id} scored {score} ({action}): {', '.join(reasons)}")
+    return RiskDecision(action, score, reasons)
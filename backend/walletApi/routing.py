@@ -0,0 +1,80 @@
+"""
+Model routing for AI chat turns.
+
+Each turn goes to the cheapest tier that can answer it:
+
+- local: short greetings, thanks and plain FAQ questions are answered by
+  the built-in replies without calling the provider;
+- fast: other simple questions go to OPENAI_FAST_MODEL;
+- large: escalations, complaints, failed transactions, PIN problems,
+  long messages and longer conversations go to OPENAI_MODEL.
+
+Every decision is logged with its reason and counted, and the latency of
+each tier is recorded, so the thresholds can be tuned against p95
+latency and cost.
+"""
+from typing import NamedTuple
+from django.conf import settings
+from . import metrics
+from .intents import classify
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIER_LOCAL = 'local'
+TIER_FAST = 'fast'
+TIER_LARGE = 'large'
+
+# Built-in replies that fully answer a short question
+LOCAL_RULES = {'greeting', 'thanks', 'send_money', 'add_money', 'transaction_history', 'pin', 'limits'}
+LARGE_CATEGORIES = {'transaction_issue', 'pin_issue'}
+
+route_decisions = metrics.counter(
+    'ai_route_decisions_total', 'Chat turns by routing tier and reason', ['tier', 'reason']
+)
+route_latency = metrics.histogram(
+    'ai_route_latency_seconds', 'Chat turn reply latency by routing tier', ['tier']
+)
+
+
+class Route(NamedTuple):
+    tier: str
+    model: str
+    reason: str
+
+
+def choose_route(user_message, total_messages):
+    """Pick the tier for a message, given how many messages the session already has"""
+    if not settings.AI_ROUTING_ENABLED:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, 'routing_disabled')
+
+    intent = classify(user_message)
+    words = len(user_message.split())
+
+    if intent.escalation:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, 'escalation')
+    if intent.negative_count:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, 'negative_sentiment')
+    if intent.category in LARGE_CATEGORIES:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, intent.category)
+    if total_messages >= settings.AI_ROUTER_LARGE_AFTER_MESSAGES:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, 'long_conversation')
+    if words > settings.AI_ROUTER_FAST_MAX_WORDS:
+        return Route(TIER_LARGE, settings.OPENAI_MODEL, 'long_message')
+
+    if intent.mock_rule in LOCAL_RULES and words <= settings.AI_ROUTER_LOCAL_MAX_WORDS:
+        return Route(TIER_LOCAL, '', intent.mock_rule)
+
+    if settings.OPENAI_FAST_MODEL:
+        return Route(TIER_FAST, settings.OPENAI_FAST_MODEL, 'simple_question')
+    return Route(TIER_LARGE, settings.OPENAI_MODEL, 'no_fast_model')
+
+
+def route_chat_turn(chat_session, user_message):
+    route = choose_route(user_message, chat_session.total_messages)
+    route_decisions.inc(tier=route.tier, reason=route.reason)
+    logger.info(
+        f"Routed session {chat_session.session_id} to {route.tier}"
+        f"{' (' + route.model + ')' if route.model else ''}: {route.reason}"
+    )
+    return route
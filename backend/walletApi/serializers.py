@@ -2,16 +2,36 @@ from rest_framework import serializers
 from decimal import Decimal
 from .models import (
     Wallet, Transaction, TransactionPin, BeneficiaryContact,
-    TransactionAnalytics, CustomerServiceChat, ChatMessage
+    TransactionAnalytics, TransactionAnalyticsRollup, CustomerServiceChat, ChatMessage, EscalationTicket
 )
 from authApi.models import CustomUser
 
 
-class WalletSerializer(serializers.ModelSerializer):
+class WalletContextSerializerMixin:
+    """
+    Read the caller from context['wallet_context'] (see WalletContextMixin)
+    instead of loading it again for each user foreign key in
+    context_user_fields that points at them
+    """
+    context_user_fields = ()
+
+    def to_representation(self, instance):
+        wallet_context = self.context.get('wallet_context')
+        if wallet_context is not None:
+            for name in self.context_user_fields:
+                field = instance._meta.get_field(name)
+                if getattr(instance, field.attname) == wallet_context.user_id and not field.is_cached(instance):
+                    field.set_cached_value(instance, wallet_context.user)
+        return super().to_representation(instance)
+
+
+class WalletSerializer(WalletContextSerializerMixin, serializers.ModelSerializer):
     user_phone = serializers.CharField(source='user.phone_number', read_only=True)
     user_name = serializers.CharField(source='user.full_name', read_only=True)
     account_number = serializers.CharField(source='user.account_number', read_only=True)
 
+    context_user_fields = ('user',)
+
     class Meta:
         model = Wallet
         fields = ['id', 'user_phone', 'user_name', 'account_number', 'balance',
@@ -19,19 +39,21 @@ class WalletSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(WalletContextSerializerMixin, serializers.ModelSerializer):
     sender_phone = serializers.CharField(source='sender.phone_number', read_only=True)
     sender_name = serializers.CharField(source='sender.full_name', read_only=True)
     recipient_phone = serializers.CharField(source='recipient.phone_number', read_only=True)
     recipient_name = serializers.CharField(source='recipient.full_name', read_only=True)
 
+    context_user_fields = ('sender', 'recipient')
+
     class Meta:
         model = Transaction
-        fields = ['id', 'reference', 'transaction_type', 'transaction_category',
+        fields = ['id', 'reference', 'transaction_type', 'transaction_category', 'sub_category',
                   'amount', 'currency', 'sender_phone', 'sender_name',
                   'recipient_phone', 'recipient_name', 'balance_before', 'balance_after',
                   'status', 'description', 'narration', 'created_at', 'completed_at']
-        read_only_fields = ['id', 'reference', 'balance_before', 'balance_after',
+        read_only_fields = ['id', 'reference', 'sub_category', 'balance_before', 'balance_after',
                            'created_at', 'completed_at']
 
 
@@ -144,6 +166,16 @@ class TransactionAnalyticsSerializer(serializers.ModelSerializer):
                   'airtime_purchases', 'closing_balance']
 
 
+class TransactionAnalyticsRollupSerializer(serializers.ModelSerializer):
+    """A weekly or monthly rollup listed like a daily analytics row, dated by its first day"""
+    date = serializers.DateField(source='period_start')
+
+    class Meta:
+        model = TransactionAnalyticsRollup
+        fields = ['date', 'period', 'total_credits', 'total_debits', 'total_transactions',
+                  'transfers_sent', 'transfers_received', 'bill_payments', 'airtime_purchases']
+
+
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
@@ -163,6 +195,22 @@ class CustomerServiceChatSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'session_id', 'started_at', 'ended_at']
 
 
+class EscalationTicketSerializer(serializers.ModelSerializer):
+    session_id = serializers.CharField(source='chat.session_id', read_only=True)
+    issue_category = serializers.CharField(source='chat.issue_category', read_only=True)
+    sentiment_score = serializers.FloatField(source='chat.sentiment_score', read_only=True)
+    summary = serializers.CharField(source='chat.summary', read_only=True)
+    user_phone = serializers.CharField(source='user.phone_number', read_only=True)
+    user_name = serializers.CharField(source='user.full_name', read_only=True)
+
+    class Meta:
+        model = EscalationTicket
+        fields = ['id', 'session_id', 'user_phone', 'user_name', 'status', 'priority',
+                  'issue_category', 'sentiment_score', 'summary', 'enqueued_at', 'due_at',
+                  'claimed_at', 'resolved_at', 'resolution_note']
+        read_only_fields = fields
+
+
 class ChatRequestSerializer(serializers.Serializer):
     message = serializers.CharField()
     session_id = serializers.CharField(required=False, allow_blank=True)
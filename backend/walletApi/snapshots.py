@@ -0,0 +1,309 @@
+"""
+Columnar snapshot of the transaction ledger for analytics and ML jobs.
+
+The snapshot is a directory of segments, each holding one fixed-width
+.npy file per column (see COLUMNS), plus manifest.json describing the
+segments, their id ranges and the code tables for the small-int columns.
+Rows are in id order within a segment. An export appends a new segment
+with the transactions created since the last one; --full rewrites the
+snapshot as a single segment, which also picks up later status changes.
+
+Ids are handed out before their transaction commits, so a lower id can
+commit after a higher one was exported. Each export records the ids
+missing below its upper bound in the manifest ('gaps') and looks for them
+again next time, adding any that have appeared to the new segment. Gaps
+older than TRANSACTION_SNAPSHOT_GAP_SECONDS are taken to be rolled back
+and dropped.
+
+Jobs open it with TransactionSnapshot, which maps every column with
+np.load(mmap_mode='r'). Pages are shared through the OS page cache, so
+any number of processes can read the same snapshot without copying it
+into their own memory.
+
+Segments and the manifest are written to temporary names and renamed
+into place, so readers never see a partial export.
+"""
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from datetime import datetime, timedelta
+from django.db.models import BigIntegerField, Case, F, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+from .insights import EpochSeconds
+from .models import Transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+COLUMNS = (
+    ('id', np.int64),
+    ('wallet_id', np.int64),
+    ('ts', np.int64),                # UTC seconds since the epoch
+    ('amount_minor', np.int64),      # amount in cents
+    ('type_code', np.int8),          # index into manifest 'types'
+    ('category_code', np.int8),      # index into manifest 'categories'
+    ('status_code', np.int8),        # index into manifest 'statuses'
+    ('counterparty_id', np.int64),   # recipient of a debit, sender of a credit; 0 when none
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+TYPES = [name for name, _ in Transaction.TRANSACTION_TYPES]
+CATEGORIES = [name for name, _ in Transaction.TRANSACTION_CATEGORIES]
+STATUSES = [name for name, _ in Transaction.TRANSACTION_STATUS]
+
+
+def snapshot_dir():
+    return Path(settings.TRANSACTION_SNAPSHOT_DIR)
+
+
+def code_case(field, names):
+    return Case(
+        *(When(**{field: name}, then=Value(code)) for code, name in enumerate(names)),
+        default=Value(0), output_field=IntegerField()
+    )
+
+
+def column_rows(condition):
+    """Integer tuples in COLUMNS order for the transactions matching condition, converted by the database"""
+    return (
+        Transaction.objects
+        .filter(condition)
+        .annotate(
+            ts=EpochSeconds('created_at'),
+            amount_minor=Cast(Round(F('amount') * 100), BigIntegerField()),
+            type_code=code_case('transaction_type', TYPES),
+            category_code=code_case('transaction_category', CATEGORIES),
+            status_code=code_case('status', STATUSES),
+            counterparty_id=Coalesce(
+                Case(When(transaction_type='debit', then=F('recipient_id')), default=F('sender_id')),
+                Value(0), output_field=BigIntegerField()
+            ),
+        )
+        .order_by('id')
+        .values_list(*COLUMN_NAMES)
+    )
+
+
+def read_manifest(directory):
+    path = Path(directory) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST_NAME
+    temporary = path.with_name(f".{MANIFEST_NAME}.{uuid.uuid4().hex}")
+    with open(temporary, 'w') as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(temporary, path)
+
+
+def new_manifest():
+    return {
+        'format_version': FORMAT_VERSION,
+        'columns': {name: np.dtype(dtype).str for name, dtype in COLUMNS},
+        'types': TYPES,
+        'categories': CATEGORIES,
+        'statuses': STATUSES,
+        'segments': [],
+        'rows': 0,
+        'last_id': 0,
+        'gaps': [],
+    }
+
+
+def write_segment(directory, name, condition, rows, batch_size):
+    """
+    Fill one .npy file per column with `rows` transactions matching condition.
+
+    Columns are preallocated with open_memmap and filled batch by batch,
+    so memory use is bounded by batch_size, not by the segment size.
+    """
+    staging = Path(directory) / f".{name}.{uuid.uuid4().hex}"
+    staging.mkdir(parents=True)
+    try:
+        outputs = {
+            column: np.lib.format.open_memmap(staging / f"{column}.npy", mode='w+', dtype=dtype, shape=(rows,))
+            for column, dtype in COLUMNS
+        }
+        written = 0
+        cursor = None
+        while written < rows:
+            page = condition if cursor is None else condition & Q(id__gt=cursor)
+            batch = list(column_rows(page)[:batch_size])
+            if not batch:
+                break
+            table = np.array(batch, dtype=np.int64)
+            end = min(written + len(table), rows)
+            for index, (column, dtype) in enumerate(COLUMNS):
+                outputs[column][written:end] = table[:end - written, index].astype(dtype)
+            written = end
+            cursor = int(table[-1, 0])
+
+        for output in outputs.values():
+            output.flush()
+        del outputs
+
+        if written < rows:
+            # Rows were deleted after they were counted; keep only what was read
+            for column, dtype in COLUMNS:
+                path = staging / f"{column}.npy"
+                data = np.load(path)[:written]
+                np.save(path, data)
+
+        os.replace(staging, Path(directory) / name)
+        return written
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def find_gaps(ids, first_id, last_id):
+    """(first, last) ranges of the ids in (first_id, last_id] missing from the sorted array ids"""
+    bounds = np.concatenate(([first_id], ids, [last_id + 1])).astype(np.int64)
+    return [
+        (int(bounds[index]) + 1, int(bounds[index + 1]) - 1)
+        for index in np.flatnonzero(np.diff(bounds) > 1)
+    ]
+
+
+def open_gaps(manifest, now):
+    """The manifest's gaps still young enough to be waited for, as (first, last, found_at)"""
+    oldest = now - timedelta(seconds=settings.TRANSACTION_SNAPSHOT_GAP_SECONDS)
+    return [
+        (first, last, found_at)
+        for first, last, found_at in manifest.get('gaps', [])
+        if datetime.fromisoformat(found_at) >= oldest
+    ]
+
+
+def export_snapshot(directory=None, full=False, batch_size=50000):
+    """
+    Append transactions created since the last export, and those that
+    committed late into a recorded gap, as a new segment; or rewrite the
+    whole snapshot when full=True or none exists.
+
+    Returns a dict with the segment name (None if nothing was new), rows
+    written and the manifest.
+    """
+    directory = Path(directory or snapshot_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+
+    manifest = None if full else read_manifest(directory)
+    if manifest is not None and manifest.get('columns') != new_manifest()['columns']:
+        raise ValueError(f"Snapshot in {directory} has a different column layout; export with full=True")
+    previous = manifest
+    if manifest is None:
+        manifest = new_manifest()
+
+    now = timezone.now()
+    gaps = open_gaps(manifest, now)
+    first_id = manifest['last_id']
+    # Fix the upper bound so rows committed during the export wait for the next one
+    last_id = max(Transaction.objects.aggregate(last=Max('id'))['last'] or 0, first_id)
+    condition = Q(id__gt=first_id, id__lte=last_id)
+    for gap_first, gap_last, _ in gaps:
+        condition |= Q(id__gte=gap_first, id__lte=gap_last)
+    rows = Transaction.objects.filter(condition).count()
+    if not rows and previous is not None:
+        if len(gaps) != len(manifest.get('gaps', [])):
+            manifest['gaps'] = [list(gap) for gap in gaps]
+            write_manifest(directory, manifest)
+        return {'segment': None, 'rows': 0, 'manifest': manifest}
+
+    # Unique, so a full export never collides with the segments it replaces
+    name = f"segment-{len(manifest['segments']) + 1:06d}-{uuid.uuid4().hex[:8]}"
+    written = write_segment(directory, name, condition, rows, batch_size)
+
+    # Ids still missing are looked for again, keeping the time they were first missed
+    ids = np.load(directory / name / 'id.npy', mmap_mode='r')
+    remaining = [
+        [first, last, found_at]
+        for gap_first, gap_last, found_at in gaps
+        for first, last in find_gaps(ids[(ids >= gap_first) & (ids <= gap_last)], gap_first - 1, gap_last)
+    ]
+    remaining += [[first, last, now.isoformat()] for first, last in find_gaps(ids[ids > first_id], first_id, last_id)]
+    recovered = int(np.count_nonzero(ids <= first_id))
+    del ids
+
+    manifest['segments'].append({
+        'name': name,
+        'rows': written,
+        'first_id': first_id + 1,
+        'last_id': last_id,
+        'recovered': recovered,
+        'exported_at': now.isoformat(),
+    })
+    manifest['rows'] += written
+    manifest['last_id'] = last_id
+    manifest['gaps'] = remaining
+    manifest['updated_at'] = now.isoformat()
+    write_manifest(directory, manifest)
+
+    if full:
+        # Segments of the replaced snapshot are no longer listed
+        listed = {segment['name'] for segment in manifest['segments']}
+        for path in directory.glob('segment-*'):
+            if path.name not in listed:
+                shutil.rmtree(path, ignore_errors=True)
+
+    logger.info(f"Exported {written} transactions ({recovered} committed late) to {directory / name}")
+    return {'segment': name, 'rows': written, 'manifest': manifest}
+
+
+class TransactionSnapshot:
+    """
+    Read-only, memory-mapped view of an exported snapshot.
+
+    segments is a list of {column: array} dicts. column_chunks() yields a
+    column segment by segment, each mapped without copying; column()
+    returns it as one array, which copies it into memory when there is
+    more than one segment. Rows are in id order within each segment only.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or snapshot_dir())
+        self.manifest = read_manifest(self.directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No transaction snapshot in {self.directory}")
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format_version']}")
+
+        self.segments = [
+            {
+                column: np.load(self.directory / segment['name'] / f"{column}.npy", mmap_mode='r')
+                for column in self.manifest['columns']
+            }
+            for segment in self.manifest['segments']
+        ]
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def column_chunks(self, name):
+        """Yield a column one mapped segment array at a time"""
+        for segment in self.segments:
+            yield segment[name]
+
+    def column(self, name):
+        """A column as one array: a mapping with one segment, an in-memory copy with several"""
+        parts = [segment[name] for segment in self.segments]
+        if not parts:
+            return np.empty(0, dtype=np.dtype(self.manifest['columns'][name]))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def codes(self, kind):
+        """Names for a code column: 'types', 'categories' or 'statuses'"""
+        return self.manifest[kind]
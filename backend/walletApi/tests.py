@@ -1,3 +1,1283 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+import time
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from authApi.models import CustomUser
+from .ai_service import agenerate_ai_response, astream_ai_response, generate_ai_response, interrupted_turns
+from .analytics import (
+    COUNTER_COLUMNS, PERIOD_DAY, PERIOD_MONTH, PERIOD_WEEK, PERIOD_YEAR, ROLLUP_PERIODS, period_end, period_start,
+    plan_range, rebuild_daily, rebuild_users, summarize_range
+)
+from .answer_cache import get_answer_cache
+from . import categorizer
+from .categorizer import Categorizer, categorize, features, label_range
+from .chat_context import MESSAGE_OVERHEAD_TOKENS, build_history, count_tokens
+from . import escalations
+from .escalations import claim_next, enqueue_escalation, resolve_ticket
+from .fake_llm import REPLY_TEXT, FakeLLMServer
+from .insights import (
+    CATEGORY_CODES, TransactionArrays, day_to_date, get_wallet_insights, is_current, load_wallet_transactions,
+    recurring_payments
+)
+from .intents import (
+    ESCALATION_WORDS, ISSUE_CATEGORIES, NEGATIVE_WORDS, POSITIVE_WORDS, RESOLVED_WORDS, classify, classify_many
+)
+from .llm import CircuitBreaker, LLMUnavailable, get_llm_manager, reset_llm_manager
+from . import metering, metrics
+from .models import (
+    ChatMessage, CustomerServiceChat, SpendingInsight, TokenUsageDaily, Transaction, TransactionAnalytics,
+    TransactionAnalyticsRollup, Wallet
+)
+from .platform_counters import dashboard
+from .prompts import PROMPT_CACHE_MIN_TOKENS, STATIC_SYSTEM_PROMPT, build_system_messages
+from .realtime import get_backend, sse_event_stream, wallet_channel
+from .risk import ALLOW, BLOCK, HOLD, add_amount, add_payee, get_state, new_state, score_transfer, state_key
+from .routing import TIER_FAST, TIER_LARGE, TIER_LOCAL, Route, choose_route
+from .snapshots import TransactionSnapshot, export_snapshot
+from .timeseries import build_series, lttb_indices
+from .utils import add_money_to_wallet, process_transfer
 
-# Create your tests here.
+
+def make_user(phone_number, full_name='Test User'):
+    user = CustomUser.objects.create_user(phone_number=phone_number, password='123456', full_name=full_name)
+    Wallet.objects.create(user=user)
+    return user
+
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    return client
+
+
+class WalletETagTests(TestCase):
+    def setUp(self):
+        self.user = make_user('+2348000000001')
+        self.client = client_for(self.user)
+
+    def test_unchanged_wallet_answers_304(self):
+        first = self.client.get('/api/wallet/wallet/balance/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ETag', first)
+        self.assertIn('private', first['Cache-Control'])
+
+        second = self.client.get('/api/wallet/wallet/balance/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_wallet_save_changes_the_etag(self):
+        etag = self.client.get('/api/wallet/wallet/balance/')['ETag']
+
+        wallet = self.user.wallet
+        wallet.balance = Decimal('250.00')
+        wallet.save()
+
+        response = self.client.get('/api/wallet/wallet/balance/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Decimal(str(response.data['data']['balance'])), Decimal('250.00'))
+
+    def test_ledger_write_changes_the_etag(self):
+        etag = self.client.get('/api/wallet/transactions/history/')['ETag']
+
+        add_money_to_wallet(Wallet.objects.get(user=self.user), Decimal('100.00'))
+
+        response = self.client.get('/api/wallet/transactions/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_with_the_query_string(self):
+        first = self.client.get('/api/wallet/transactions/history/')
+        second = self.client.get('/api/wallet/transactions/history/?page=1')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    @override_settings(TIME_ZONE='Africa/Lagos')
+    def test_etag_rolls_over_with_the_utc_day_of_the_payload(self):
+        def get_dashboard(utc_time, etag=None):
+            with mock.patch('django.utils.timezone.now', return_value=utc_time):
+                headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+                return self.client.get('/api/wallet/dashboard/', **headers)
+
+        evening = datetime(2026, 3, 1, 22, 30, tzinfo=dt_timezone.utc)
+        etag = get_dashboard(evening)['ETag']
+        # Past local midnight (UTC+1), but the dashboard's UTC day has not changed
+        self.assertEqual(get_dashboard(evening + timedelta(hours=1), etag).status_code, 304)
+        self.assertEqual(get_dashboard(evening + timedelta(hours=2), etag).status_code, 200)
+
+
+def collect_events(user_id, action, count, timeout=1):
+    """Subscribe to a wallet channel, run action and return the next count events (None when none came)"""
+    async def run():
+        backend = get_backend()
+        subscription = await backend.subscribe(wallet_channel(user_id))
+        try:
+            await sync_to_async(action)()
+            return [await subscription.get(timeout=timeout) for _ in range(count)]
+        finally:
+            backend.unsubscribe(subscription)
+
+    return async_to_sync(run)()
+
+
+class RealtimeEventTests(TestCase):
+    """Ledger events through the default in-process backend"""
+
+    def setUp(self):
+        self.sender = make_user('+2348000000001')
+        self.recipient = make_user('+2348000000002')
+        self.recipient_balance = self.recipient.wallet.balance
+
+    def test_transfer_pushes_balance_and_transaction_after_commit(self):
+        def transfer():
+            with self.captureOnCommitCallbacks(execute=True):
+                process_transfer(self.sender.wallet, self.recipient, Decimal('120.00'))
+
+        balance, txn = collect_events(self.recipient.pk, transfer, 2)
+        self.assertEqual(balance['type'], 'balance')
+        self.assertEqual(Decimal(balance['data']['balance']), self.recipient_balance + Decimal('120.00'))
+        self.assertEqual(txn['type'], 'transaction')
+        self.assertEqual(txn['data']['transaction_type'], 'credit')
+
+    def test_rolled_back_transfer_pushes_nothing(self):
+        def transfer_and_roll_back():
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    process_transfer(self.sender.wallet, self.recipient, Decimal('120.00'))
+                    transaction.set_rollback(True)
+
+        self.assertEqual(collect_events(self.recipient.pk, transfer_and_roll_back, 1, timeout=0.2), [None])
+
+    @override_settings(REALTIME_HEARTBEAT_SECONDS=0.05)
+    def test_sse_stream_sends_heartbeats_and_events(self):
+        async def read_stream():
+            stream = sse_event_stream(self.recipient.pk)
+            chunks = [await stream.__anext__(), await stream.__anext__()]
+            get_backend().publish(wallet_channel(self.recipient.pk), {'type': 'balance', 'data': {'balance': '1.00'}})
+            chunks.append(await stream.__anext__())
+            await stream.aclose()
+            return chunks
+
+        retry, heartbeat, event = async_to_sync(read_stream)()
+        self.assertTrue(retry.startswith(b'retry:'))
+        self.assertEqual(heartbeat, b': keep-alive\n\n')
+        self.assertEqual(event, b'event: balance\ndata: {"balance": "1.00"}\n\n')
+        self.assertEqual(get_backend().subscriber_count(), 0)
+
+
+class FakeLLMTestCase(TestCase):
+    """Runs the chat path against a local FakeLLMServer"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeLLMServer(latency_ms=0, jitter_ms=0, chunk_delay_ms=0, seed=1).start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def setUp(self):
+        overrides = override_settings(OPENAI_API_KEY='test', OPENAI_BASE_URL=self.server.base_url)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_llm_manager()
+        self.addCleanup(reset_llm_manager)
+        self.server.request_count = 0
+
+
+@override_settings(AI_ANSWER_CACHE_ENABLED=False)
+class ChatViewTests(FakeLLMTestCase):
+    URL = '/api/wallet/support/chat/'
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('+2348000000001')
+
+    def test_chat_answers_in_the_envelope(self):
+        response = client_for(self.user).post(self.URL, {'message': 'How do I send money?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'success')
+        self.assertTrue(CustomerServiceChat.objects.filter(session_id=body['data']['session_id'], user=self.user).exists())
+
+    def test_form_bodies_are_parsed(self):
+        response = client_for(self.user).post(self.URL, {'message': 'How do I send money?'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_errors_use_the_envelope(self):
+        response = APIClient().post(self.URL, {'message': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['status'], 'error')
+
+        response = client_for(self.user).get(self.URL)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json()['status'], 'error')
+
+        response = client_for(self.user).post(self.URL, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('message', response.json()['errors'])
+
+    def test_query_token_is_not_accepted(self):
+        token = RefreshToken.for_user(self.user).access_token
+        response = APIClient().post(f"{self.URL}?token={token}", {'message': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.server.request_count, 0)
+
+
+async def stream_events(user, message, disconnect_after=None):
+    """(event, data) pairs of a streamed reply; closes the stream after disconnect_after deltas"""
+    events = []
+    stream = astream_ai_response(user, message)
+    async for event, data in stream:
+        events.append((event, data))
+        if disconnect_after and sum(name == 'delta' for name, _ in events) == disconnect_after:
+            await stream.aclose()
+            await asyncio.gather(*interrupted_turns)
+            break
+    return events
+
+
+@override_settings(AI_ANSWER_CACHE_ENABLED=False, OPENAI_MAX_RETRIES=0)
+class StreamingTests(FakeLLMTestCase):
+    QUESTION = 'Can I use Swift Wallet when I travel abroad?'
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('+2348000000001')
+
+    def test_full_stream_is_saved_once(self):
+        events = async_to_sync(stream_events)(self.user, self.QUESTION)
+        self.assertEqual(events[0][0], 'session')
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(''.join(data['content'] for event, data in events if event == 'delta'), REPLY_TEXT)
+
+        done = events[-1][1]
+        reply = ChatMessage.objects.get(message_type='ai')
+        self.assertEqual((reply.content, reply.tokens_used), (REPLY_TEXT, done['tokens_used']))
+        self.assertEqual(reply.first_token_ms, done['first_token_ms'])
+        self.assertEqual(ChatMessage.objects.filter(message_type='user').count(), 1)
+
+    def test_disconnect_mid_stream_saves_the_partial_reply(self):
+        events = async_to_sync(stream_events)(self.user, self.QUESTION, disconnect_after=2)
+        partial = ''.join(data['content'] for event, data in events if event == 'delta')
+        self.assertNotEqual(partial, REPLY_TEXT)
+
+        reply = ChatMessage.objects.get(message_type='ai')
+        self.assertEqual(reply.content, partial)
+        self.assertGreater(reply.tokens_used, 0)
+        self.assertEqual(ChatMessage.objects.filter(message_type='user', content=self.QUESTION).count(), 1)
+        self.assertEqual(TokenUsageDaily.objects.get(user=self.user).tokens_used, reply.tokens_used)
+
+    def test_provider_error_mid_stream_ends_with_an_error(self):
+        self.server.fail_after_chunks = 3
+        self.addCleanup(setattr, self.server, 'fail_after_chunks', None)
+
+        events = async_to_sync(stream_events)(self.user, self.QUESTION)
+        self.assertEqual([event for event, _ in events], ['session', 'delta', 'delta', 'delta', 'error'])
+        self.assertIn('error', events[-1][1])
+        self.assertFalse(ChatMessage.objects.filter(message_type='ai').exists())
+        self.assertTrue(ChatMessage.objects.filter(message_type='system', content__startswith='Error:').exists())
+
+
+@override_settings(
+    OPENAI_MAX_RETRIES=0,
+    OPENAI_BREAKER_MIN_CALLS=2,
+    OPENAI_BREAKER_ERROR_RATE=0.5,
+    OPENAI_BREAKER_RESET_SECONDS=60,
+    AI_ANSWER_CACHE_ENABLED=False,
+)
+class LLMClientTests(FakeLLMTestCase):
+    QUESTION = 'Can I use Swift Wallet when I travel abroad?'
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('+2348000000001')
+
+    def test_client_is_shared(self):
+        manager = get_llm_manager()
+        self.assertIsNotNone(manager.get_client())
+        self.assertIs(manager.get_client(), manager.get_client())
+
+    def test_open_breaker_falls_back_without_calling_the_provider(self):
+        self.server.error_rate = 1.0
+        self.addCleanup(setattr, self.server, 'error_rate', 0.0)
+
+        for _ in range(2):
+            self.assertIn('error', generate_ai_response(self.user, self.QUESTION))
+        self.assertEqual(get_llm_manager().breaker.state, 'open')
+
+        result = generate_ai_response(self.user, self.QUESTION)
+        self.assertTrue(result['mock'])
+        self.assertEqual(self.server.request_count, 2)
+
+    @override_settings(OPENAI_MAX_CONCURRENCY=1, OPENAI_BULKHEAD_TIMEOUT=0.01)
+    def test_full_bulkhead_rejects_calls(self):
+        reset_llm_manager()
+        manager = get_llm_manager()
+        with manager.guard():
+            with self.assertRaises(LLMUnavailable):
+                with manager.guard():
+                    pass
+
+    def test_breaker_probes_after_reset(self):
+        breaker = CircuitBreaker(error_rate=0.5, min_calls=2, window_seconds=60, reset_seconds=0)
+        breaker.record(False)
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'open')
+
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'closed')
+
+
+async def stream_result(user, message, chat_session=None):
+    async for event, data in astream_ai_response(user, message, chat_session):
+        if event == 'done':
+            return data
+
+
+@override_settings(AI_ANSWER_CACHE_ENABLED=False)
+class PromptCacheTests(FakeLLMTestCase):
+    def test_static_prefix_is_long_enough_to_be_cached(self):
+        self.assertGreaterEqual(count_tokens(STATIC_SYSTEM_PROMPT), PROMPT_CACHE_MIN_TOKENS)
+        # Holds for real tokenizers too, at about three words per four tokens
+        self.assertGreaterEqual(len(STATIC_SYSTEM_PROMPT.split()), PROMPT_CACHE_MIN_TOKENS * 3 // 4)
+
+    def test_prefix_is_shared_by_users_and_reported_as_cached(self):
+        first = make_user('+2348000000001', 'Ada')
+        second = make_user('+2348000000002', 'Bola')
+        self.assertEqual(build_system_messages(first)[0], build_system_messages(second)[0])
+
+        generate_ai_response(first, 'Can I use Swift Wallet when I travel abroad?')
+        generate_ai_response(second, 'Can I use Swift Wallet when I travel abroad?')
+        cached = list(ChatMessage.objects.filter(message_type='ai').order_by('id').values_list('cached_tokens', flat=True))
+        self.assertEqual(cached[0], 0)
+        self.assertGreaterEqual(cached[1], PROMPT_CACHE_MIN_TOKENS)
+
+
+@override_settings(AI_ANSWER_CACHE_ENABLED=True)
+class AnswerCacheTests(FakeLLMTestCase):
+    QUESTION = 'Can I use Swift Wallet when I travel abroad?'
+
+    def setUp(self):
+        super().setUp()
+        get_answer_cache().clear()
+        self.user = make_user('+2348000000001')
+
+    def test_repeated_question_is_answered_from_cache(self):
+        first = generate_ai_response(self.user, self.QUESTION)
+        self.assertNotIn('cached', first)
+        self.assertEqual(self.server.request_count, 1)
+
+        second = generate_ai_response(self.user, 'can i use swift wallet when i travel abroad')
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['message'], first['message'])
+        self.assertNotEqual(second['session_id'], first['session_id'])
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_follow_ups_never_hit_the_cache(self):
+        first = generate_ai_response(self.user, self.QUESTION)
+        chat_session = CustomerServiceChat.objects.get(session_id=first['session_id'])
+
+        for respond in (
+            generate_ai_response,
+            async_to_sync(agenerate_ai_response),
+            async_to_sync(stream_result),
+        ):
+            result = respond(self.user, self.QUESTION, chat_session)
+            self.assertNotIn('cached', result)
+        self.assertEqual(self.server.request_count, 4)
+
+    def test_personal_questions_never_hit_the_cache(self):
+        for respond in (
+            generate_ai_response,
+            async_to_sync(agenerate_ai_response),
+            async_to_sync(stream_result),
+        ):
+            result = respond(self.user, "What's my balance?")
+            self.assertNotIn('cached', result)
+        self.assertEqual(self.server.request_count, 3)
+        self.assertEqual(get_answer_cache().stats()['entries'], 0)
+
+    @override_settings(AI_ANSWER_CACHE_ENABLED=False)
+    def test_disabled_cache_is_bypassed(self):
+        generate_ai_response(self.user, self.QUESTION)
+        result = generate_ai_response(self.user, self.QUESTION)
+        self.assertNotIn('cached', result)
+        self.assertEqual(self.server.request_count, 2)
+
+
+class ChatHistoryTests(TestCase):
+    NEW_MESSAGE = 'And what about deposits?'
+
+    def setUp(self):
+        self.chat = CustomerServiceChat.objects.create(user=make_user('+2348000000001'), session_id='CS-20260101-HISTORY1')
+        self.sent = []
+
+    def send(self, count):
+        for _ in range(count):
+            number = len(self.sent) + 1
+            message_type = 'user' if number % 2 else 'ai'
+            self.sent.append(ChatMessage.objects.create(
+                chat=self.chat, message_type=message_type, content=f"Message {number:02d} about my wallet transfer"
+            ))
+        self.chat.total_messages = len(self.sent)
+        self.chat.save(update_fields=['total_messages'])
+
+    def window_budget(self, messages):
+        """A history budget that fits the new message and exactly this many earlier ones"""
+        cost = count_tokens(self.sent[0].content) + MESSAGE_OVERHEAD_TOKENS
+        return count_tokens(self.NEW_MESSAGE) + MESSAGE_OVERHEAD_TOKENS + messages * cost
+
+    def test_window_stops_at_the_token_budget(self):
+        self.send(6)
+        with override_settings(AI_HISTORY_TOKEN_BUDGET=self.window_budget(3)):
+            history = build_history(self.chat, self.NEW_MESSAGE)
+
+        self.assertEqual([message['content'] for message in history[1:]], [
+            'Message 04 about my wallet transfer',
+            'Message 05 about my wallet transfer',
+            'Message 06 about my wallet transfer',
+            self.NEW_MESSAGE,
+        ])
+        self.assertEqual([message['role'] for message in history[1:]], ['assistant', 'user', 'assistant', 'user'])
+        self.assertEqual(history[0]['role'], 'system')
+        self.assertTrue(history[0]['content'].endswith('\n'.join([
+            'User: Message 01 about my wallet transfer',
+            'Assistant: Message 02 about my wallet transfer',
+            'User: Message 03 about my wallet transfer',
+        ])))
+
+    def test_messages_are_folded_into_the_summary_once(self):
+        self.send(6)
+        with override_settings(AI_HISTORY_TOKEN_BUDGET=self.window_budget(3)):
+            build_history(self.chat, self.NEW_MESSAGE)
+            self.chat.refresh_from_db()
+            self.assertEqual(self.chat.summarized_through, self.sent[2].id)
+
+            self.send(2)
+            history = build_history(self.chat, self.NEW_MESSAGE)
+        self.chat.refresh_from_db()
+
+        self.assertEqual(self.chat.summarized_through, self.sent[4].id)
+        self.assertEqual(self.chat.summary.splitlines(), [
+            f"{'User' if number % 2 else 'Assistant'}: Message {number:02d} about my wallet transfer"
+            for number in range(1, 6)
+        ])
+        self.assertEqual(len(history), 5)
+        self.assertEqual(history[1]['content'], 'Message 06 about my wallet transfer')
+
+    def test_summary_drops_its_oldest_lines_past_its_budget(self):
+        self.send(6)
+        kept = ['Assistant: Message 04 about my wallet transfer', 'User: Message 05 about my wallet transfer']
+        summary_budget = sum(count_tokens(line) for line in kept)
+        with override_settings(AI_HISTORY_TOKEN_BUDGET=self.window_budget(1), AI_SUMMARY_TOKEN_BUDGET=summary_budget):
+            build_history(self.chat, self.NEW_MESSAGE)
+        self.chat.refresh_from_db()
+
+        self.assertEqual(self.chat.summary.splitlines(), kept)
+        self.assertEqual(self.chat.summarized_through, self.sent[4].id)
+
+
+@override_settings(
+    AI_ROUTING_ENABLED=True, AI_ROUTER_LOCAL_MAX_WORDS=8, AI_ROUTER_FAST_MAX_WORDS=40,
+    AI_ROUTER_LARGE_AFTER_MESSAGES=6, OPENAI_MODEL='large-model', OPENAI_FAST_MODEL='fast-model'
+)
+class RoutingTests(TestCase):
+    def assert_route(self, message, tier, model, reason, total_messages=0):
+        self.assertEqual(choose_route(message, total_messages), Route(tier, model, reason), message)
+
+    def test_short_faq_questions_are_answered_locally(self):
+        self.assert_route('Hello there', TIER_LOCAL, '', 'greeting')
+        self.assert_route('How do I add money?', TIER_LOCAL, '', 'add_money')
+        self.assert_route('Is there a maximum per day?', TIER_LOCAL, '', 'limits')
+
+    def test_simple_questions_go_to_the_fast_model(self):
+        self.assert_route('Can I use the app when I travel abroad?', TIER_FAST, 'fast-model', 'simple_question')
+        # A built-in reply only covers short questions
+        self.assert_route(
+            'Hello, could you tell me which countries your wallet can be used in today?',
+            TIER_FAST, 'fast-model', 'simple_question'
+        )
+
+    def test_hard_turns_go_to_the_large_model(self):
+        self.assert_route('I want to speak to human', TIER_LARGE, 'large-model', 'escalation')
+        self.assert_route('This is terrible', TIER_LARGE, 'large-model', 'negative_sentiment')
+        self.assert_route('My transfer failed', TIER_LARGE, 'large-model', 'transaction_issue')
+        self.assert_route('I forgot pin', TIER_LARGE, 'large-model', 'pin_issue')
+        self.assert_route('Hello again', TIER_LARGE, 'large-model', 'long_conversation', total_messages=6)
+        self.assert_route(' '.join(['word'] * 41), TIER_LARGE, 'large-model', 'long_message')
+
+    def test_fallbacks_without_routing_or_a_fast_model(self):
+        with override_settings(AI_ROUTING_ENABLED=False):
+            self.assert_route('Hello there', TIER_LARGE, 'large-model', 'routing_disabled')
+        with override_settings(OPENAI_FAST_MODEL=''):
+            self.assert_route('Can I use the app abroad?', TIER_LARGE, 'large-model', 'no_fast_model')
+
+
+class TokenBudgetCheckTests(TestCase):
+    def test_budgets_in_a_per_process_cache_are_flagged(self):
+        warnings = metering.check_shared_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['walletApi.W001'])
+
+        with override_settings(AI_USER_DAILY_SOFT_TOKENS=0, AI_USER_DAILY_HARD_TOKENS=0, AI_GLOBAL_DAILY_HARD_TOKENS=0):
+            self.assertEqual(metering.check_shared_cache(None), [])
+
+    def test_shared_cache_passes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'default': {
+            'BACKEND': 'walletApi.cache_backends.InstrumentedCache',
+            'CACHE_BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }}
+        with override_settings(CACHES=shared, AI_USER_DAILY_HARD_TOKENS=50000):
+            self.assertEqual(metering.check_shared_cache(None), [])
+
+
+class ReplayChatsTests(TestCase):
+    def replay(self, **options):
+        out = StringIO()
+        call_command('replay_chats', latency_ms=0, jitter_ms=0, json=True, stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_synthetic_replay_reports_and_rolls_back(self):
+        for stream in (False, True):
+            report = self.replay(synthetic=2, stream=stream)
+            self.assertEqual(report['conversations'], 2)
+            self.assertEqual(report['errors'], 0)
+            self.assertGreater(report['turns'], 2)
+            self.assertGreater(report['llm_requests'], 0)
+            self.assertGreater(report['prompt_tokens']['total'], 0)
+            self.assertGreater(report['db_writes_per_turn']['mean'], 0)
+        self.assertFalse(CustomerServiceChat.objects.exists())
+
+    def test_stored_sessions_are_replayed(self):
+        user = make_user('+2348000000001')
+        chat = CustomerServiceChat.objects.create(user=user, session_id='CS-20260101-REPLAY01')
+        ChatMessage.objects.create(chat=chat, message_type='user', content='My transfer failed, please check it')
+        ChatMessage.objects.create(chat=chat, message_type='ai', content='Let me look into that.')
+
+        report = self.replay(sessions=1)
+        self.assertEqual(report['conversations'], 1)
+        self.assertEqual(report['turns'], 1)
+        self.assertEqual(report['llm_requests'], 1)
+        self.assertEqual(CustomerServiceChat.objects.count(), 1)
+
+    def test_provider_errors_are_counted(self):
+        report = self.replay(synthetic=1, error_rate=1.0)
+        self.assertEqual(report['errors'] + report['fallbacks'], report['turns'] - report['tiers'].get('local', 0))
+
+
+def legacy_mock_rule(message_lower):
+    """The if/elif chain generate_mock_response used before intents.py"""
+    if 'balance' in message_lower:
+        return 'balance'
+    elif 'send money' in message_lower or 'transfer' in message_lower:
+        return 'send_money'
+    elif 'add money' in message_lower or 'deposit' in message_lower:
+        return 'add_money'
+    elif 'transaction' in message_lower and ('history' in message_lower or 'view' in message_lower):
+        return 'transaction_history'
+    elif 'pin' in message_lower:
+        return 'pin'
+    elif 'limit' in message_lower or 'maximum' in message_lower:
+        return 'limits'
+    elif 'help' in message_lower or 'problem' in message_lower or 'issue' in message_lower:
+        return 'help'
+    elif any(word in message_lower for word in ['hello', 'hi', 'hey']):
+        return 'greeting'
+    elif any(word in message_lower for word in ['thank', 'thanks']):
+        return 'thanks'
+    return 'default'
+
+
+def legacy_classify(message):
+    """The separate keyword scans intents.classify() replaced"""
+    message_lower = message.lower()
+    category = next(
+        (name for name, keywords in ISSUE_CATEGORIES.items() if any(keyword in message_lower for keyword in keywords)),
+        'other'
+    )
+    positive_count = sum(1 for word in POSITIVE_WORDS if word in message_lower)
+    negative_count = sum(1 for word in NEGATIVE_WORDS if word in message_lower)
+    sentiment = positive_count / (positive_count + negative_count) if positive_count + negative_count else 0.5
+    return (
+        category,
+        sentiment,
+        any(word in message_lower for word in RESOLVED_WORDS),
+        any(word in message_lower for word in ESCALATION_WORDS),
+        legacy_mock_rule(message_lower),
+    )
+
+
+class IntentClassifierTests(TestCase):
+    CORPUS = [
+        "Hi, how do I send money to my friend?",
+        "What is my balance?",
+        "My transfer failed and I didn't receive a refund",
+        "I forgot pin, please help",
+        "How to add money to my wallet?",
+        "This app is useless, I want to speak to human",
+        "Thanks, that fixed it. Great support!",
+        "What are the transaction limits? Is there a maximum?",
+        "Can I view my transaction history from last month?",
+        "Deposit pending for two days, I'm frustrated",
+        # Keywords nested in other words and in each other
+        "THIS is shipping",
+        "thankss, resolved and solved",
+        "Please escalate to a manager or a human agent",
+        "spinning wheel on the transfer screen",
+        "pay someone, fund wallet, check balance",
+        "Reset PIN? pin locked. change pin!",
+        "a transaction error, not bad, just awful and terrible",
+        "they appreciate excellent, helpful, good service",
+        "explain the problem with my issue",
+        "",
+        "   ",
+        "héllo, they say hey",
+    ]
+
+    def assert_matches_legacy(self, message, intent):
+        compiled = (intent.category, intent.sentiment, intent.resolved, intent.escalation, intent.mock_rule)
+        self.assertEqual(compiled, legacy_classify(message), message)
+
+    def test_classify_matches_the_legacy_keyword_scans(self):
+        for message in self.CORPUS:
+            self.assert_matches_legacy(message, classify(message))
+
+    def test_classify_many_matches_the_legacy_keyword_scans(self):
+        for message, intent in zip(self.CORPUS, classify_many(self.CORPUS)):
+            self.assert_matches_legacy(message, intent)
+
+
+class EscalationQueueTests(TestCase):
+    def setUp(self):
+        self.agent = make_user('+2348000000100', 'Agent')
+        self.sessions = 0
+
+    def escalate(self, phone_number, sentiment, balance):
+        user = make_user(phone_number)
+        Wallet.objects.filter(user=user).update(balance=balance)
+        self.sessions += 1
+        chat = CustomerServiceChat.objects.create(
+            user=user, session_id=f"CS-20260101-ESC{self.sessions:05d}", sentiment_score=sentiment
+        )
+        return enqueue_escalation(chat)
+
+    def test_unhappy_high_value_users_are_claimed_first(self):
+        calm = self.escalate('+2348000000001', 0.9, Decimal('10.00'))
+        angry_rich = self.escalate('+2348000000002', 0.1, Decimal('5000000.00'))
+        angry = self.escalate('+2348000000003', 0.1, Decimal('10.00'))
+        self.assertGreater(angry_rich.priority, angry.priority)
+        self.assertGreater(angry.priority, calm.priority)
+
+        claimed = [claim_next(self.agent).pk for _ in range(3)]
+        self.assertEqual(claimed, [angry_rich.pk, angry.pk, calm.pk])
+
+    def test_a_ticket_is_claimed_once(self):
+        first = self.escalate('+2348000000001', 0.5, Decimal('10.00'))
+        second = self.escalate('+2348000000002', 0.5, Decimal('10.00'))
+
+        claims = [claim_next(self.agent), claim_next(make_user('+2348000000101', 'Agent 2'))]
+        self.assertEqual({ticket.pk for ticket in claims}, {first.pk, second.pk})
+        self.assertIsNone(claim_next(self.agent))
+
+    def test_requeue_keeps_place_until_resolved(self):
+        ticket = self.escalate('+2348000000001', 0.5, Decimal('10.00'))
+        again = enqueue_escalation(ticket.chat, sentiment=0.0)
+        self.assertEqual((again.pk, again.due_at), (ticket.pk, ticket.due_at))
+
+        resolve_ticket(claim_next(self.agent), 'Refunded')
+        self.assertIsNone(claim_next(self.agent))
+
+        reopened = enqueue_escalation(ticket.chat, sentiment=0.0)
+        self.assertEqual(reopened.status, 'queued')
+        self.assertGreater(reopened.priority, ticket.priority)
+        self.assertEqual(claim_next(self.agent).pk, ticket.pk)
+
+    @override_settings(METRICS_MULTIPROCESS_DIR='')
+    def test_queue_gauges_share_one_query_per_render(self):
+        self.escalate('+2348000000001', 0.5, Decimal('10.00'))
+        self.escalate('+2348000000002', 0.5, Decimal('10.00'))
+        with mock.patch('walletApi.escalations.queue_stats', wraps=escalations.queue_stats) as stats:
+            output = metrics.render_all()
+        self.assertEqual(stats.call_count, 1)
+        self.assertIn('escalation_queue_depth 2\n', output)
+        self.assertIn('escalation_oldest_wait_seconds 0\n', output)
+
+
+class AnalyticsUpsertTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('+2348000000001')
+        self.recipient = make_user('+2348000000002')
+        for amount in (Decimal('100.00'), Decimal('50.50')):
+            process_transfer(Wallet.objects.get(user=self.sender), self.recipient, amount)
+        add_money_to_wallet(Wallet.objects.get(user=self.sender), Decimal('20.00'))
+        self.today = timezone.now().date()
+
+    def test_transactions_accumulate_in_one_daily_row(self):
+        row = TransactionAnalytics.objects.get(user=self.sender)
+        self.assertEqual(row.date, self.today)
+        self.assertEqual(row.total_transactions, 3)
+        self.assertEqual(row.transfers_sent, 2)
+        self.assertEqual(row.total_debits, Decimal('150.50'))
+        self.assertEqual(row.total_credits, Decimal('20.00'))
+        self.assertEqual(row.closing_balance, Wallet.objects.get(user=self.sender).balance)
+
+        received = TransactionAnalytics.objects.get(user=self.recipient)
+        self.assertEqual((received.transfers_received, received.total_credits), (2, Decimal('150.50')))
+
+    def test_rollups_match_the_daily_row(self):
+        row = TransactionAnalytics.objects.get(user=self.sender)
+        for period in ROLLUP_PERIODS:
+            rollup = TransactionAnalyticsRollup.objects.get(
+                user=self.sender, period=period, period_start=period_start(period, self.today)
+            )
+            for column in COUNTER_COLUMNS:
+                self.assertEqual(getattr(rollup, column), getattr(row, column), (period, column))
+
+    def test_summarize_range_reads_the_totals(self):
+        totals = summarize_range(self.sender.pk, self.today - timedelta(days=40), self.today)
+        self.assertEqual(totals['total_transactions'], 3)
+        self.assertEqual(totals['total_debits'], Decimal('150.50'))
+        self.assertEqual(totals['total_credits'], Decimal('20.00'))
+
+    def test_rebuild_finds_nothing_to_change(self):
+        stats = rebuild_daily(self.sender.pk, self.recipient.pk)
+        self.assertEqual(stats['unchanged'], 2)
+        self.assertEqual((stats['created'], stats['updated'], stats['deleted']), (0, 0, 0))
+
+    def test_rebuild_holds_the_wallet_locks_of_its_users(self):
+        locked = []
+
+        def rebuild_daily_locked(*args, **kwargs):
+            # Ledger writes take these locks before upserting analytics
+            self.assertTrue(transaction.get_connection().in_atomic_block)
+            self.assertEqual(len(locked), 1)
+            return rebuild_daily(*args, **kwargs)
+
+        real_lock = Wallet.objects.select_for_update
+
+        def select_for_update(*args, **kwargs):
+            locked.append(True)
+            return real_lock(*args, **kwargs)
+
+        with mock.patch.object(Wallet.objects, 'select_for_update', side_effect=select_for_update), \
+                mock.patch('walletApi.analytics.rebuild_daily', side_effect=rebuild_daily_locked):
+            TransactionAnalytics.objects.filter(user=self.sender).update(total_transactions=99)
+            stats = rebuild_users(self.sender.pk, self.recipient.pk)
+        self.assertEqual((stats['updated'], stats['rollups']), (1, 6))
+        self.assertEqual(TransactionAnalytics.objects.get(user=self.sender).total_transactions, 3)
+
+        # Writes after the rebuild add to the rebuilt rows
+        add_money_to_wallet(Wallet.objects.get(user=self.sender), Decimal('5.00'))
+        self.assertEqual(rebuild_users(self.sender.pk, self.recipient.pk, dry_run=True)['updated'], 0)
+
+
+class PlanRangeTests(TestCase):
+    def assertCovers(self, plan, start, end):
+        day = start
+        for period, first_day in plan:
+            self.assertEqual(first_day, day)
+            self.assertEqual(period_start(period, first_day), first_day)
+            day = period_end(period, first_day) + timedelta(days=1)
+        self.assertEqual(day, end + timedelta(days=1))
+
+    def test_whole_periods_are_single_rows(self):
+        self.assertEqual(plan_range(date(2025, 1, 1), date(2025, 12, 31)), [(PERIOD_YEAR, date(2025, 1, 1))])
+        self.assertEqual(plan_range(date(2025, 3, 1), date(2025, 3, 31)), [(PERIOD_MONTH, date(2025, 3, 1))])
+        self.assertEqual(plan_range(date(2025, 3, 3), date(2025, 3, 9)), [(PERIOD_WEEK, date(2025, 3, 3))])
+
+    def test_mixed_range_uses_the_fewest_rows(self):
+        # Sat 2024-12-28 .. Tue 2026-02-10
+        plan = plan_range(date(2024, 12, 28), date(2026, 2, 10))
+        self.assertCovers(plan, date(2024, 12, 28), date(2026, 2, 10))
+        self.assertEqual(plan, [
+            (PERIOD_DAY, date(2024, 12, 28)), (PERIOD_DAY, date(2024, 12, 29)), (PERIOD_DAY, date(2024, 12, 30)),
+            (PERIOD_DAY, date(2024, 12, 31)), (PERIOD_YEAR, date(2025, 1, 1)), (PERIOD_MONTH, date(2026, 1, 1)),
+            (PERIOD_DAY, date(2026, 2, 1)), (PERIOD_WEEK, date(2026, 2, 2)), (PERIOD_DAY, date(2026, 2, 9)),
+            (PERIOD_DAY, date(2026, 2, 10)),
+        ])
+
+    def test_random_ranges_are_covered_exactly(self):
+        rng = random.Random(42)
+        for _ in range(200):
+            start = date(2023, 1, 1) + timedelta(days=rng.randrange(900))
+            end = start + timedelta(days=rng.randrange(500))
+            plan = plan_range(start, end)
+            self.assertCovers(plan, start, end)
+            self.assertLessEqual(len(plan), (end - start).days + 1)
+
+    def test_empty_range(self):
+        self.assertEqual(plan_range(date(2025, 3, 2), date(2025, 3, 1)), [])
+
+
+class AnalyticsViewTests(TestCase):
+    def setUp(self):
+        self.user = make_user('+2348000000001')
+        add_money_to_wallet(self.user.wallet, Decimal('75.00'))
+        self.client = client_for(self.user)
+
+    def get_data(self, days):
+        response = self.client.get(f'/api/wallet/analytics/?days={days}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    @override_settings(ANALYTICS_DAILY_DATA_MAX_DAYS=31)
+    def test_daily_data_is_always_listed(self):
+        for days, period in ((7, PERIOD_DAY), (31, PERIOD_DAY), (100, PERIOD_WEEK), (400, PERIOD_MONTH)):
+            data = self.get_data(days)
+            self.assertEqual(data['daily_data_period'], period)
+            self.assertEqual(len(data['daily_data']), 1, days)
+            row = data['daily_data'][-1]
+            self.assertEqual(Decimal(str(row['total_credits'])), Decimal('75.00'))
+            self.assertEqual(row['date'], period_start(period, timezone.now().date()).isoformat())
+            self.assertEqual(data['summary']['total_transactions'], 1)
+
+    def test_days_out_of_range(self):
+        response = self.client.get('/api/wallet/analytics/?days=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'error')
+
+
+def wallet_arrays(rows):
+    """TransactionArrays from (day, amount in minor units, is debit, category, counterparty) rows, at noon"""
+    days, amounts, debits, categories, counterparties = zip(*rows)
+    return TransactionArrays(
+        local_ts=np.array(days, dtype=np.int64) * 86400 + 12 * 3600,
+        amount_minor=np.array(amounts, dtype=np.int64),
+        is_debit=np.array(debits, dtype=bool),
+        category=np.array([CATEGORY_CODES[name] for name in categories], dtype=np.int8),
+        counterparty=np.array(counterparties, dtype=np.int64),
+    )
+
+
+class SpendingInsightsTests(TestCase):
+    TODAY = 20000
+
+    def test_recurring_payments_need_a_steady_cadence_and_amount(self):
+        today = self.TODAY
+        rows = [
+            # Monthly rent to one person, amounts within the tolerance
+            (today - 90, 500000, True, 'rent', 7), (today - 60, 505000, True, 'rent', 7),
+            (today - 30, 500000, True, 'rent', 7),
+            # Weekly bill with no counterparty, grouped by its amount
+            (today - 14, 2500, True, 'bill_payment', 0), (today - 7, 2500, True, 'bill_payment', 0), (today, 2500, True, 'bill_payment', 0),
+            # Weekly, but the next payment is long overdue
+            (today - 100, 3000, True, 'transfer', 8), (today - 93, 3000, True, 'transfer', 8),
+            (today - 86, 3000, True, 'transfer', 8),
+            # Irregular gaps
+            (today - 73, 4000, True, 'transfer', 9), (today - 70, 4000, True, 'transfer', 9),
+            (today - 50, 4000, True, 'transfer', 9),
+            # Monthly, but the amount varies too much
+            (today - 61, 1000, True, 'transfer', 10), (today - 31, 2000, True, 'transfer', 10),
+            (today - 1, 1000, True, 'transfer', 10),
+            # Monthly salary received, not paid
+            (today - 62, 900000, False, 'transfer', 11), (today - 32, 900000, False, 'transfer', 11),
+            (today - 2, 900000, False, 'transfer', 11),
+        ]
+        rows.sort()
+
+        recurring = recurring_payments(wallet_arrays(rows), today)
+        self.assertEqual([(item['cadence'], item['counterparty_id'], item['category']) for item in recurring], [
+            ('monthly', 7, 'rent'),
+            ('weekly', None, 'bill_payment'),
+        ])
+        self.assertEqual(recurring[0]['amount'], 5016.67)
+        self.assertEqual(recurring[0]['occurrences'], 3)
+        self.assertEqual(recurring[0]['next_expected'], day_to_date(today).isoformat())
+        self.assertEqual(recurring[1]['next_expected'], day_to_date(today + 7).isoformat())
+
+    def test_stored_insights_are_reused_until_the_wallet_version_changes(self):
+        user = make_user('+2348000000001')
+        add_money_to_wallet(Wallet.objects.get(user=user), Decimal('100.00'))
+
+        with mock.patch('walletApi.insights.load_wallet_transactions', wraps=load_wallet_transactions) as load:
+            first = get_wallet_insights(Wallet.objects.get(user=user))
+            second = get_wallet_insights(Wallet.objects.get(user=user))
+            self.assertEqual(load.call_count, 1)
+            self.assertEqual(second, first)
+
+            add_money_to_wallet(Wallet.objects.get(user=user), Decimal('50.00'))
+            third = get_wallet_insights(Wallet.objects.get(user=user))
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(third['totals']['received'], 150.0)
+        self.assertEqual(SpendingInsight.objects.get(user=user).wallet_version, Wallet.objects.get(user=user).version)
+
+
+class TimeSeriesTests(TestCase):
+    def test_lttb_keeps_the_endpoints_and_the_requested_point_count(self):
+        y = np.random.default_rng(1).normal(size=1000).cumsum()
+        y[500] += 100  # A spike a chart must not lose
+        kept = lttb_indices(y, 50)
+
+        self.assertEqual(len(kept), 50)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertTrue((np.diff(kept) > 0).all())
+        self.assertIn(500, kept)
+
+        self.assertEqual(lttb_indices(y[:40], 50).tolist(), list(range(40)))
+        self.assertEqual(lttb_indices(y, 2).tolist(), [0, 999])
+
+    def test_downsampled_points_carry_the_volume_of_dropped_buckets(self):
+        user = make_user('+2348000000001')
+        start = date(2026, 1, 1)
+        balance = Decimal('0.00')
+        for offset in range(60):
+            credits, debits = Decimal(offset + 1), Decimal(offset % 7)
+            balance += credits - debits
+            TransactionAnalytics.objects.create(
+                user=user, date=start + timedelta(days=offset), total_credits=credits, total_debits=debits,
+                total_transactions=2, closing_balance=balance
+            )
+
+        result = build_series(Wallet.objects.get(user=user), PERIOD_DAY, start, start + timedelta(days=59), 10)
+        series = result['series']
+        self.assertEqual((result['buckets'], result['points']), (60, 10))
+        self.assertEqual((series['t'][0], series['t'][-1]), ('2026-01-01', '2026-03-01'))
+
+        kept = [(date.fromisoformat(label) - start).days for label in series['t']]
+        previous = -1
+        for index, offset in enumerate(kept):
+            days = range(previous + 1, offset + 1)
+            self.assertEqual(series['credits'][index], sum(day + 1 for day in days))
+            self.assertEqual(series['debits'][index], sum(day % 7 for day in days))
+            self.assertEqual(series['transactions'][index], 2 * len(days))
+            previous = offset
+        self.assertEqual(sum(series['credits']), result['totals']['credits'])
+        self.assertEqual(result['totals']['transactions'], 120)
+
+
+class TransactionSnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        sender = make_user('+2348000000001')
+        recipient = make_user('+2348000000002')
+        for amount in ('10.00', '20.00', '30.00'):
+            process_transfer(Wallet.objects.get(user=sender), recipient, Decimal(amount), 'test')
+        self.ids = list(Transaction.objects.order_by('id').values_list('id', flat=True))
+
+    def test_late_commit_below_the_watermark_is_exported_next_time(self):
+        # Not committed yet when the first export runs
+        late = Transaction.objects.get(id=self.ids[2])
+        Transaction.objects.filter(id=late.id).delete()
+        first = export_snapshot(self.directory)
+        self.assertEqual(first['rows'], len(self.ids) - 1)
+        self.assertEqual([gap[:2] for gap in first['manifest']['gaps']], [[late.id, late.id]])
+
+        late.save(force_insert=True)
+        second = export_snapshot(self.directory)
+        self.assertEqual(second['rows'], 1)
+        self.assertEqual(second['manifest']['gaps'], [])
+        self.assertEqual(second['manifest']['segments'][-1]['recovered'], 1)
+
+        snapshot = TransactionSnapshot(self.directory)
+        self.assertEqual(len(snapshot), len(self.ids))
+        self.assertEqual(sorted(snapshot.column('id').tolist()), self.ids)
+
+    @override_settings(TRANSACTION_SNAPSHOT_GAP_SECONDS=0)
+    def test_old_gaps_are_dropped(self):
+        Transaction.objects.filter(id=self.ids[2]).delete()
+        self.assertEqual(len(export_snapshot(self.directory)['manifest']['gaps']), 1)
+        result = export_snapshot(self.directory)
+        self.assertIsNone(result['segment'])
+        self.assertEqual(result['manifest']['gaps'], [])
+
+    def test_column_chunks_stay_mapped(self):
+        Transaction.objects.filter(id=self.ids[-1]).delete()
+        export_snapshot(self.directory)
+        sender = CustomUser.objects.get(phone_number='+2348000000001')
+        process_transfer(Wallet.objects.get(user=sender), CustomUser.objects.get(phone_number='+2348000000002'),
+                         Decimal('5.00'), 'test')
+        export_snapshot(self.directory)
+
+        snapshot = TransactionSnapshot(self.directory)
+        chunks = list(snapshot.column_chunks('amount_minor'))
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(all(isinstance(chunk, np.memmap) for chunk in chunks))
+        self.assertEqual(np.concatenate(chunks).tolist(), snapshot.column('amount_minor').tolist())
+
+
+class PlatformCounterTests(TestCase):
+    def test_every_new_wallet_is_counted_once(self):
+        sender = make_user('+2348000000001')
+        recipient = make_user('+2348000000002')
+        # Later saves of the same wallet are not new wallets
+        wallet = Wallet.objects.get(user=sender)
+        wallet.save()
+        process_transfer(wallet, recipient, Decimal('45.00'))
+
+        stats = dashboard()
+        self.assertEqual(stats['all_time']['wallets'], 2)
+        self.assertEqual(stats['today']['wallets_opened'], 2)
+        self.assertEqual(stats['float'], sum(Wallet.objects.values_list('balance', flat=True)))
+
+
+@override_settings(RISK_SCORING_ENABLED=True, RISK_HOLD_SCORE=50, RISK_BLOCK_SCORE=80)
+class RiskScoringTests(TestCase):
+    def setUp(self):
+        self.user = make_user('+2348000000001')
+        self.payee = make_user('+2348000000002')
+        self.stranger = make_user('+2348000000003')
+        cache.delete(state_key(self.user.pk))
+
+    def set_history(self, **changes):
+        """Ten past debits of 100.00, all to the usual payee"""
+        state = new_state()
+        for _ in range(10):
+            add_amount(state, Decimal('100.00'))
+        add_payee(state, self.payee.pk)
+        state.update(changes)
+        cache.set(state_key(self.user.pk), state)
+
+    def test_usual_transfer_is_allowed(self):
+        self.set_history()
+        decision = score_transfer(self.user.pk, self.payee.pk, Decimal('100.00'))
+        self.assertEqual((decision.action, decision.score, decision.reasons), (ALLOW, 0, ()))
+
+    def test_large_transfer_to_a_new_beneficiary_is_held(self):
+        self.set_history()
+        decision = score_transfer(self.user.pk, self.stranger.pk, Decimal('100000.00'))
+        self.assertEqual(decision.action, HOLD)
+        self.assertEqual(decision.score, 50)
+        self.assertEqual(set(decision.reasons), {'unusual_amount', 'new_beneficiary'})
+
+    def test_new_beneficiary_right_after_a_device_change_is_blocked(self):
+        self.set_history(device_changed=time.time())
+        decision = score_transfer(self.user.pk, self.stranger.pk, Decimal('100000.00'))
+        self.assertEqual(decision.action, BLOCK)
+        self.assertIn('new_beneficiary_after_change', decision.reasons)
+
+    def test_only_committed_debits_are_observed(self):
+        self.assertEqual(get_state(self.user.pk)['n'], 0)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            process_transfer(Wallet.objects.get(user=self.user), self.payee, Decimal('10.00'))
+        self.assertEqual(get_state(self.user.pk)['n'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_transfer(Wallet.objects.get(user=self.user), self.payee, Decimal('10.00'))
+        state = get_state(self.user.pk)
+        self.assertEqual(state['n'], 1)
+        self.assertEqual(state['payees'][-1], self.payee.pk)
+
+
+class CategorizerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.model_path = os.path.join(directory.name, 'categorizer.npz')
+        overrides = override_settings(CATEGORIZER_MODEL_PATH=self.model_path, CATEGORIZER_RELOAD_CHECK_SECONDS=30)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.reset_model()
+        self.addCleanup(self.reset_model)
+
+    def reset_model(self):
+        categorizer._model = None
+        categorizer._model_mtime = None
+        categorizer._model_checked_at = 0.0
+
+    def test_seed_model_labels(self):
+        cases = {
+            'house rent for march': 'rent',
+            'lunch with the team': 'food',
+            'money for mummy': 'family',
+            'nepa bill': 'utilities',
+            'loan repayment': 'other',
+            'qwerty zxcvb': 'other',
+            '': 'other',
+        }
+        for narration, label in cases.items():
+            self.assertEqual(categorize(narration, None, Decimal('5000.00'), 5), label, narration)
+
+    def test_transfers_are_labeled_on_both_sides(self):
+        sender = make_user('+2348000000001')
+        recipient = make_user('+2348000000002')
+        result = process_transfer(Wallet.objects.get(user=sender), recipient, Decimal('300.00'), 'groceries')
+        self.assertEqual(result['debit_transaction'].sub_category, 'food')
+        self.assertEqual(result['credit_transaction'].sub_category, 'food')
+
+    def test_label_range_fills_missing_labels(self):
+        sender = make_user('+2348000000001')
+        recipient = make_user('+2348000000002')
+        process_transfer(Wallet.objects.get(user=sender), recipient, Decimal('300.00'), 'electricity bill')
+        Transaction.objects.update(sub_category='')
+
+        counts = label_range(0, Transaction.objects.order_by('-id').values_list('id', flat=True).first())
+        self.assertEqual(counts, {'utilities': 2})
+        self.assertFalse(Transaction.objects.filter(sub_category='').exists())
+
+    def test_label_range_invalidates_history_etag_and_insights(self):
+        sender = make_user('+2348000000001')
+        recipient = make_user('+2348000000002')
+        process_transfer(Wallet.objects.get(user=sender), recipient, Decimal('300.00'), 'electricity bill')
+        Transaction.objects.update(sub_category='')
+        wallet = Wallet.objects.get(user=sender)
+
+        client = client_for(sender)
+        etag = client.get('/api/wallet/transactions/history/')['ETag']
+        get_wallet_insights(wallet)
+        insight = SpendingInsight.objects.get(user=sender)
+        self.assertTrue(is_current(insight, wallet))
+
+        label_range(0, Transaction.objects.order_by('-id').values_list('id', flat=True).first())
+        response = client.get('/api/wallet/transactions/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        wallet.refresh_from_db()
+        self.assertFalse(is_current(insight, wallet))
+
+        # Labels that did not change leave the version alone
+        version = wallet.version
+        label_range(0, Transaction.objects.order_by('-id').values_list('id', flat=True).first(), relabel=True)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.version, version)
+
+    def test_model_file_is_checked_at_most_once_per_interval(self):
+        categorize('rent', None, None, None)
+        with mock.patch.object(categorizer.os, 'stat', wraps=os.stat) as stat:
+            for _ in range(100):
+                categorize('rent', None, None, None)
+        self.assertEqual(stat.call_count, 0)
+
+    def test_saved_model_is_picked_up_after_the_interval(self):
+        self.assertEqual(categorize('ajo contribution', None, None, None), 'other')
+
+        # A model that has only seen 'ajo' as family
+        Categorizer.fit([('family', features('ajo', None, None, None)[0])] * 5).save(self.model_path)
+        self.assertEqual(categorize('ajo contribution', None, None, None), 'other')
+
+        with override_settings(CATEGORIZER_RELOAD_CHECK_SECONDS=0):
+            self.assertEqual(categorize('ajo contribution', None, None, None), 'family')
+
+
+def exited_process_file_name(suffix):
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return f"{process.pid}-{suffix}.json"
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(METRICS_MULTIPROCESS_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def write_process_file(self, name, jobs, workers, latency):
+        registry = metrics.Registry()
+        registry.get_or_create(metrics.Counter, 'test_jobs_total', 'Jobs', ['queue']).inc(jobs, queue='default')
+        registry.get_or_create(metrics.Gauge, 'test_workers', 'Workers').set(workers)
+        registry.get_or_create(metrics.Histogram, 'test_latency_seconds', 'Latency', buckets=(1, 5)).observe(latency)
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            json.dump(registry.snapshot(), handle)
+        return path
+
+    def test_render_uses_text_exposition_format(self):
+        registry = metrics.Registry()
+        registry.get_or_create(metrics.Counter, 'test_jobs_total', 'Jobs', ['queue']).inc(2, queue='a"b')
+        registry.get_or_create(metrics.Histogram, 'test_latency_seconds', 'Latency', buckets=(1, 5)).observe(2.5)
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP test_jobs_total Jobs',
+            '# TYPE test_jobs_total counter',
+            'test_jobs_total{queue="a\\"b"} 2',
+            '# HELP test_latency_seconds Latency',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{le="1"} 0',
+            'test_latency_seconds_bucket{le="5"} 1',
+            'test_latency_seconds_bucket{le="+Inf"} 1',
+            'test_latency_seconds_sum 2.5',
+            'test_latency_seconds_count 1',
+        ]) + '\n')
+
+    def test_processes_are_merged_and_exited_ones_archived(self):
+        # The test runner's parent stands in for another running worker
+        self.write_process_file(metrics.process_file_name(os.getppid()), jobs=2, workers=1, latency=0.5)
+        dead = self.write_process_file(exited_process_file_name('1'), jobs=3, workers=1, latency=2)
+
+        for _ in range(2):
+            output = metrics.render_all()
+            self.assertIn('test_jobs_total{queue="default"} 5\n', output)
+            self.assertIn('test_latency_seconds_count 2\n', output)
+            self.assertIn('test_latency_seconds_bucket{le="1"} 1\n', output)
+            # The exited process's gauge is dropped
+            self.assertIn('test_workers 1\n', output)
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, metrics.ARCHIVE_NAME)))
+
+    def test_archive_keeps_totals_of_every_exited_process(self):
+        first = self.write_process_file(exited_process_file_name('1'), jobs=3, workers=1, latency=2)
+        metrics.render_all()
+        second = self.write_process_file(exited_process_file_name('2'), jobs=4, workers=1, latency=2)
+
+        output = metrics.render_all()
+        self.assertIn('test_jobs_total{queue="default"} 7\n', output)
+        self.assertIn('test_latency_seconds_count 2\n', output)
+        self.assertNotIn('test_workers', output)
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+    def test_file_left_after_archiving_is_not_counted_twice(self):
+        dead = self.write_process_file(exited_process_file_name('1'), jobs=3, workers=1, latency=2)
+        with mock.patch.object(metrics.Path, 'unlink'):
+            metrics.render_all()
+        self.assertTrue(os.path.exists(dead))
+
+        output = metrics.render_all()
+        self.assertIn('test_jobs_total{queue="default"} 3\n', output)
+        self.assertFalse(os.path.exists(dead))
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_worker_counts_are_archived_after_it_exits(self):
+        pid = os.fork()
+        if pid == 0:
+            # A forked worker starts from zero and writes its file on exit
+            try:
+                metrics.counter('test_worker_jobs_total', 'Jobs').inc(3)
+                metrics.PROCESS_FILE.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        worker_file = next(Path(self.directory).glob(f"{pid}-*.json"))
+
+        output = metrics.render_all()
+        self.assertIn('test_worker_jobs_total 3\n', output)
+        self.assertFalse(worker_file.exists())
+        self.assertIn('test_worker_jobs_total 3\n', metrics.render_all())
+
+    @skipUnless(metrics.process_start_time(os.getppid()), 'needs /proc')
+    def test_file_of_an_exited_process_whose_pid_is_reused(self):
+        pid = os.getppid()
+        # Written by an earlier process that had the same pid
+        reused = self.write_process_file(f"{pid}-{metrics.process_start_time(pid) - 1}.json", jobs=3, workers=2, latency=2)
+        self.write_process_file(metrics.process_file_name(pid), jobs=1, workers=1, latency=2)
+
+        output = metrics.render_all()
+        self.assertIn('test_jobs_total{queue="default"} 4\n', output)
+        self.assertIn('test_workers 1\n', output)
+        self.assertFalse(os.path.exists(reused))
@@ -0,0 +1,218 @@
+"""
+Balance and credit/debit volume series for charts.
+
+Day, week and month buckets are grouped by the database from the daily
+TransactionAnalytics rows. Each row is a balance checkpoint: it holds the
+day's totals and closing balance, so a bucket's volume is the sum of its
+rows and its balance is the closing balance of its last active day. Hour
+buckets have no pre-aggregated source and are grouped from the ledger, so
+their range is limited by TIMESERIES_MAX_HOUR_DAYS. Buckets are UTC, like
+the analytics days.
+
+Buckets without activity carry the previous balance forward. A series with
+more buckets than max_points is downsampled with Largest-Triangle-Three-
+Buckets on the balance line; each kept point also carries the volume of
+the buckets dropped before it, so the totals are unchanged.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+import numpy as np
+from django.db.models import Case, Count, DecimalField, F, Max, Sum, Value, When
+from django.db.models.functions import TruncHour
+from .analytics import (
+    PERIOD_DAY, PERIOD_MONTH, PERIOD_TRUNCS, PERIOD_WEEK, period_end, period_start, utc_midnight
+)
+from .models import Transaction, TransactionAnalytics
+
+RESOLUTION_HOUR = 'hour'
+RESOLUTIONS = (RESOLUTION_HOUR, PERIOD_DAY, PERIOD_WEEK, PERIOD_MONTH)
+
+# Range shown when the request gives no start date
+DEFAULT_SPAN_DAYS = {RESOLUTION_HOUR: 2, PERIOD_DAY: 30, PERIOD_WEEK: 182, PERIOD_MONTH: 365}
+
+
+def to_minor(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+def bucket_starts(resolution, start, end):
+    """Start of every bucket touching [start, end]: UTC datetimes for hours, dates otherwise"""
+    if resolution == RESOLUTION_HOUR:
+        first = utc_midnight(start)
+        return [first + timedelta(hours=hour) for hour in range(((end - start).days + 1) * 24)]
+
+    starts = []
+    day = period_start(resolution, start)
+    while day <= end:
+        starts.append(day)
+        day = period_end(resolution, day) + timedelta(days=1)
+    return starts
+
+
+def opening_balance(wallet, start):
+    """
+    Balance at the beginning of `start`: the last checkpoint before it, or,
+    for a wallet with none, the balance before its first active day
+    """
+    checkpoints = TransactionAnalytics.objects.filter(user_id=wallet.user_id)
+    previous = checkpoints.filter(date__lt=start).order_by('-date').values_list('closing_balance', flat=True).first()
+    if previous is not None:
+        return to_minor(previous)
+
+    first = checkpoints.order_by('date').values_list('closing_balance', 'total_credits', 'total_debits').first()
+    if first is None:
+        return to_minor(wallet.balance)
+    closing, credits, debits = first
+    return to_minor(closing) - to_minor(credits) + to_minor(debits)
+
+
+def daily_buckets(user_id, resolution, start, end):
+    """{bucket start: (credits, debits, transactions, closing balance)} from the daily rows, in minor units"""
+    rows = TransactionAnalytics.objects.filter(user_id=user_id, date__gte=start, date__lte=end).order_by()
+    if resolution == PERIOD_DAY:
+        return {
+            day: (to_minor(credits), to_minor(debits), transactions, to_minor(closing))
+            for day, credits, debits, transactions, closing in rows.values_list(
+                'date', 'total_credits', 'total_debits', 'total_transactions', 'closing_balance'
+            )
+        }
+
+    grouped = list(
+        rows.annotate(bucket=PERIOD_TRUNCS[resolution]('date'))
+        .values('bucket')
+        .annotate(
+            credits=Sum('total_credits'), debits=Sum('total_debits'),
+            transactions=Sum('total_transactions'), last_day=Max('date')
+        )
+        .values_list('bucket', 'credits', 'debits', 'transactions', 'last_day')
+    )
+    closings = dict(rows.filter(date__in=[row[4] for row in grouped]).values_list('date', 'closing_balance'))
+    return {
+        bucket: (to_minor(credits), to_minor(debits), transactions, to_minor(closings[last_day]))
+        for bucket, credits, debits, transactions, last_day in grouped
+    }
+
+
+def hourly_buckets(wallet_id, start, end):
+    """{hour: (credits, debits, transactions, closing balance)} grouped from completed transactions"""
+    amount = F('amount')
+    zero = Value(Decimal('0.00'))
+    grouped = list(
+        Transaction.objects
+        .filter(
+            wallet_id=wallet_id, status='completed',
+            created_at__gte=utc_midnight(start), created_at__lt=utc_midnight(end + timedelta(days=1))
+        )
+        .order_by()
+        .annotate(bucket=TruncHour('created_at', tzinfo=dt_timezone.utc))
+        .values('bucket')
+        .annotate(
+            credits=Sum(Case(When(transaction_type='credit', then=amount), default=zero, output_field=DecimalField())),
+            debits=Sum(Case(When(transaction_type='debit', then=amount), default=zero, output_field=DecimalField())),
+            transactions=Count('id'),
+            last_id=Max('id'),
+        )
+        .values_list('bucket', 'credits', 'debits', 'transactions', 'last_id')
+    )
+    closings = dict(
+        Transaction.objects.filter(id__in=[row[4] for row in grouped]).values_list('id', 'balance_after')
+    )
+    return {
+        bucket: (to_minor(credits), to_minor(debits), transactions, to_minor(closings[last_id]))
+        for bucket, credits, debits, transactions, last_id in grouped
+    }
+
+
+def lttb_indices(y, threshold):
+    """
+    Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps
+    from an evenly spaced series: the first, the last, and from each
+    bucket in between the point making the largest triangle with the
+    previously kept point and the average of the next bucket
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+
+    x = np.arange(n, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Inner points split into threshold - 2 buckets; bounds[-1] is the last point
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for index in range(threshold - 2):
+        first, last = bounds[index], bounds[index + 1]
+        following_end = bounds[index + 2] if index + 2 < len(bounds) else n
+        next_x = x[last:following_end].mean()
+        next_y = y[last:following_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[first:last] - y[previous])
+            - (x[previous] - x[first:last]) * (next_y - y[previous])
+        )
+        previous = first + int(np.argmax(areas))
+        kept[index + 1] = previous
+    return kept
+
+
+def build_series(wallet, resolution, start, end, max_points):
+    """Chart series for [start, end] (dates, inclusive) with at most max_points points"""
+    starts = bucket_starts(resolution, start, end)
+    if resolution == RESOLUTION_HOUR:
+        buckets = hourly_buckets(wallet.id, start, end)
+    else:
+        buckets = daily_buckets(wallet.user_id, resolution, start, end)
+
+    count = len(starts)
+    values = np.zeros((count, 4), dtype=np.int64)
+    active = np.zeros(count, dtype=bool)
+    for index, bucket in enumerate(starts):
+        row = buckets.get(bucket)
+        if row is not None:
+            values[index] = row
+            active[index] = True
+
+    # Quiet buckets keep the last closing balance, or the opening one before any activity
+    opening = opening_balance(wallet, start)
+    last_active = np.maximum.accumulate(np.where(active, np.arange(count), -1))
+    balance = np.where(last_active >= 0, values[np.maximum(last_active, 0), 3], opening)
+
+    kept = lttb_indices(balance, max_points)
+    columns = values[:, :3]
+    if len(kept) < count:
+        # Fold each dropped bucket's volume into the next kept point
+        columns = np.add.reduceat(columns, np.concatenate(([0], kept[:-1] + 1)), axis=0)
+
+    if resolution == RESOLUTION_HOUR:
+        labels = [starts[index].isoformat().replace('+00:00', 'Z') for index in kept]
+    else:
+        labels = [starts[index].isoformat() for index in kept]
+
+    totals = values[:, :3].sum(axis=0)
+    series = {
+        't': labels,
+        'balance': (balance[kept] / 100).tolist(),
+        'credits': (columns[:, 0] / 100).tolist(),
+        'debits': (columns[:, 1] / 100).tolist(),
+        'transactions': columns[:, 2].tolist(),
+    }
+    return {
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'timezone': 'UTC',
+        'buckets': count,
+        'points': len(kept),
+        'downsampled': len(kept) < count,
+        'opening_balance': opening / 100,
+        'totals': {
+            'credits': int(totals[0]) / 100,
+            'debits': int(totals[1]) / 100,
+            'transactions': int(totals[2]),
+        },
+        'series': series,
+    }
@@ -10,10 +10,16 @@ from .views import (
     BeneficiaryListView,
     AddBeneficiaryView,
     AnalyticsView,
-    CustomerServiceChatView,
+    SpendingInsightsView,
+    TimeSeriesView,
     ChatHistoryView,
-    DashboardSummaryView
+    DashboardSummaryView,
+    EscalationQueueView,
+    ClaimEscalationView,
+    ResolveEscalationView,
+    OpsDashboardView
 )
+from .async_views import wallet_event_stream, CustomerServiceChatView, CustomerServiceChatStreamView
 
 app_name = 'walletApi'
 
@@ -23,6 +29,8 @@ urlpatterns = [
 
     # Wallet
     path('wallet/balance/', WalletBalanceView.as_view(), name='wallet-balance'),
+    path('wallet/events/', wallet_event_stream, name='wallet-events'),
+    path('wallet/timeseries/', TimeSeriesView.as_view(), name='wallet-timeseries'),
 
     # Transactions
     path('transactions/send/', SendMoneyView.as_view(), name='send-money'),
@@ -40,8 +48,18 @@ urlpatterns = [
 
     # Analytics
     path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('analytics/insights/', SpendingInsightsView.as_view(), name='spending-insights'),
 
     # Customer Service AI
     path('support/chat/', CustomerServiceChatView.as_view(), name='customer-service-chat'),
+    path('support/chat/stream/', CustomerServiceChatStreamView.as_view(), name='customer-service-chat-stream'),
     path('support/history/', ChatHistoryView.as_view(), name='chat-history'),
+
+    # Human escalations (staff)
+    path('support/escalations/', EscalationQueueView.as_view(), name='escalation-queue'),
+    path('support/escalations/claim/', ClaimEscalationView.as_view(), name='escalation-claim'),
+    path('support/escalations/<int:ticket_id>/resolve/', ResolveEscalationView.as_view(), name='escalation-resolve'),
+
+    # Operations (staff)
+    path('ops/dashboard/', OpsDashboardView.as_view(), name='ops-dashboard'),
 ]
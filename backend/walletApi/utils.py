@@ -1,8 +1,16 @@
+import time
 import uuid
 from decimal import Decimal
 from django.utils import timezone
 from django.db import transaction
-from .models import Transaction, Wallet, TransactionAnalytics, BeneficiaryContact
+from . import metrics
+from .analytics import record_transaction
+from .categorizer import categorize_many
+from .platform_counters import count_transaction
+from .risk import observe_debit
+from .models import Transaction, Wallet, BeneficiaryContact
+from .realtime import publish_wallet_event
+from .serializers import TransactionSerializer
 from authApi.models import CustomUser
 import logging
 
@@ -16,6 +24,46 @@ def generate_transaction_reference():
     return f"TXN-{timestamp}-{unique_id}"
 
 
+ledger_entries = metrics.counter(
+    'ledger_transactions_total', 'Completed ledger entries by type and category', ['type', 'category']
+)
+ledger_lock_wait = metrics.histogram(
+    'ledger_lock_wait_seconds', 'Time spent acquiring wallet row locks',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+
+def lock_wallet(wallet):
+    """Re-read a wallet under a row lock, keeping the user already loaded on it"""
+    started = time.perf_counter()
+    locked = Wallet.objects.select_for_update().get(id=wallet.id)
+    ledger_lock_wait.observe(time.perf_counter() - started)
+    if Wallet.user.is_cached(wallet):
+        # Also points user.wallet at the locked row for later readers
+        locked.user = wallet.user
+    return locked
+
+
+def record_ledger_entry(txn):
+    """Add a completed transaction to its owner's analytics, risk features and the platform counters"""
+    first_of_day = record_transaction(txn)
+    ledger_entries.inc(type=txn.transaction_type, category=txn.transaction_category)
+    count_transaction(txn, first_of_day)
+    if txn.transaction_type == 'debit':
+        # A rolled-back debit must not count toward the user's risk features
+        transaction.on_commit(lambda: observe_debit(txn), robust=True)
+
+
+def publish_ledger_event(wallet, txn):
+    """Push the new balance and the transaction to the owner's live connections"""
+    publish_wallet_event(wallet.user_id, 'balance', {
+        'balance': str(wallet.balance),
+        'currency': wallet.currency,
+        'version': wallet.version,
+    })
+    publish_wallet_event(wallet.user_id, 'transaction', TransactionSerializer(txn).data)
+
+
 @transaction.atomic
 def process_transfer(sender_wallet, recipient, amount, narration=''):
     """Process money transfer between wallets"""
@@ -24,17 +72,29 @@ def process_transfer(sender_wallet, recipient, amount, narration=''):
     if not sender_wallet.can_transact(amount):
         raise ValueError("Insufficient balance or wallet is frozen")
 
+    today = timezone.localdate().day
+    debit_narration = narration or f"Transfer to {recipient.phone_number}"
+    credit_narration = narration or f"Transfer from {sender_wallet.user.phone_number}"
+    # Labeled before any wallet row is locked
+    debit_label, credit_label = categorize_many([
+        (debit_narration, recipient.id, amount, today),
+        (credit_narration, sender_wallet.user_id, amount, today),
+    ])
+
     # Get recipient wallet
+    started = time.perf_counter()
     try:
         recipient_wallet = Wallet.objects.select_for_update().get(user=recipient)
     except Wallet.DoesNotExist:
         raise ValueError("Recipient wallet not found")
+    ledger_lock_wait.observe(time.perf_counter() - started)
 
     if not recipient_wallet.is_active or recipient_wallet.is_frozen:
         raise ValueError("Recipient wallet is not active")
+    recipient_wallet.user = recipient
 
     # Lock sender wallet for update
-    sender_wallet = Wallet.objects.select_for_update().get(id=sender_wallet.id)
+    sender_wallet = lock_wallet(sender_wallet)
 
     # Create debit transaction for sender
     sender_balance_before = sender_wallet.balance
@@ -52,7 +112,8 @@ def process_transfer(sender_wallet, recipient, amount, narration=''):
         balance_before=sender_balance_before,
         balance_after=sender_wallet.balance,
         status='completed',
-        narration=narration or f"Transfer to {recipient.phone_number}",
+        narration=debit_narration,
+        sub_category=debit_label,
         completed_at=timezone.now()
     )
 
@@ -72,7 +133,8 @@ def process_transfer(sender_wallet, recipient, amount, narration=''):
         balance_before=recipient_balance_before,
         balance_after=recipient_wallet.balance,
         status='completed',
-        narration=narration or f"Transfer from {sender_wallet.user.phone_number}",
+        narration=credit_narration,
+        sub_category=credit_label,
         completed_at=timezone.now()
     )
 
@@ -87,8 +149,11 @@ def process_transfer(sender_wallet, recipient, amount, narration=''):
     beneficiary.save()
 
     # Update analytics
-    update_analytics(sender_wallet.user, debit_txn)
-    update_analytics(recipient, credit_txn)
+    record_ledger_entry(debit_txn)
+    record_ledger_entry(credit_txn)
+
+    publish_ledger_event(sender_wallet, debit_txn)
+    publish_ledger_event(recipient_wallet, credit_txn)
 
     logger.info(f"Transfer completed: {amount} from {sender_wallet.user.phone_number} to {recipient.phone_number}")
 
@@ -104,7 +169,7 @@ def process_transfer(sender_wallet, recipient, amount, narration=''):
 def add_money_to_wallet(wallet, amount, payment_method='bonus', description=''):
     """Add money to wallet (deposit simulation)"""
 
-    wallet = Wallet.objects.select_for_update().get(id=wallet.id)
+    wallet = lock_wallet(wallet)
 
     balance_before = wallet.balance
     wallet.balance += amount
@@ -126,7 +191,8 @@ def add_money_to_wallet(wallet, amount, payment_method='bonus', description=''):
         completed_at=timezone.now()
     )
 
-    update_analytics(wallet.user, txn)
+    record_ledger_entry(txn)
+    publish_ledger_event(wallet, txn)
 
     logger.info(f"Money added: {amount} to {wallet.user.phone_number} via {payment_method}")
 
@@ -143,7 +209,7 @@ def process_bill_payment(wallet, bill_type, amount, metadata=None):
     if not wallet.can_transact(amount):
         raise ValueError("Insufficient balance or wallet is frozen")
 
-    wallet = Wallet.objects.select_for_update().get(id=wallet.id)
+    wallet = lock_wallet(wallet)
 
     balance_before = wallet.balance
     wallet.balance -= amount
@@ -168,7 +234,8 @@ def process_bill_payment(wallet, bill_type, amount, metadata=None):
         completed_at=timezone.now()
     )
 
-    update_analytics(wallet.user, txn)
+    record_ledger_entry(txn)
+    publish_ledger_event(wallet, txn)
 
     logger.info(f"Bill payment: {bill_type} - {amount} for {wallet.user.phone_number}")
 
@@ -178,51 +245,21 @@ def process_bill_payment(wallet, bill_type, amount, metadata=None):
     }
 
 
-def update_analytics(user, transaction):
-    """Update daily transaction analytics"""
-    today = timezone.now().date()
-
-    analytics, created = TransactionAnalytics.objects.get_or_create(
-        user=user,
-        date=today,
-        defaults={'closing_balance': user.wallet.balance}
-    )
-
-    # Update totals
-    if transaction.transaction_type == 'credit':
-        analytics.total_credits += transaction.amount
-        if transaction.transaction_category == 'transfer':
-            analytics.transfers_received += 1
-    else:
-        analytics.total_debits += transaction.amount
-        if transaction.transaction_category == 'transfer':
-            analytics.transfers_sent += 1
-        elif transaction.transaction_category == 'bill_payment':
-            analytics.bill_payments += 1
-        elif transaction.transaction_category == 'airtime':
-            analytics.airtime_purchases += 1
-
-    analytics.total_transactions += 1
-    analytics.closing_balance = user.wallet.balance
-    analytics.save()
-
-
 def get_user_balance(user):
     """Get user wallet balance"""
     try:
-        wallet = Wallet.objects.get(user=user)
-        return wallet.balance
+        return user.wallet.balance
     except Wallet.DoesNotExist:
         return Decimal('0.00')
 
 
 def verify_transaction_pin(user, pin):
-    """Verify user's transaction PIN"""
+    """Verify user's transaction PIN (uses the PIN already loaded on the user, if any)"""
     from django.contrib.auth.hashers import check_password
     from .models import TransactionPin
 
     try:
-        transaction_pin = TransactionPin.objects.get(user=user)
+        transaction_pin = user.transaction_pin
 
         if not transaction_pin.is_active:
             return False, "Transaction PIN is disabled"
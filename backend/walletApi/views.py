@@ -2,28 +2,40 @@ from rest_framework import status, permissions, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
 from django.db.models import Q
+from django.http import HttpResponse
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
+from datetime import date, timedelta
 from decimal import Decimal
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
 from .models import (
     Wallet, Transaction, TransactionPin, BeneficiaryContact,
-    TransactionAnalytics, CustomerServiceChat
+    TransactionAnalytics, TransactionAnalyticsRollup, CustomerServiceChat, EscalationTicket
 )
 from .serializers import (
     WalletSerializer, TransactionSerializer, SendMoneySerializer,
     AddMoneySerializer, BillPaymentSerializer, TransactionPinSerializer,
-    BeneficiarySerializer, TransactionAnalyticsSerializer,
-    CustomerServiceChatSerializer, ChatRequestSerializer
+    BeneficiarySerializer, TransactionAnalyticsSerializer, TransactionAnalyticsRollupSerializer,
+    CustomerServiceChatSerializer, EscalationTicketSerializer
 )
 from .utils import (
     process_transfer, add_money_to_wallet, process_bill_payment,
     get_user_balance, verify_transaction_pin
 )
-from .ai_service import generate_ai_response, detect_issue_category, analyze_sentiment
+from .analytics import PERIOD_DAY, PERIOD_MONTH, PERIOD_WEEK, period_start, summarize_range
+from .insights import get_wallet_insights
+from .timeseries import DEFAULT_SPAN_DAYS, RESOLUTION_HOUR, RESOLUTIONS, build_series
+from .escalations import claim_next, resolve_ticket, queue_stats
+from .platform_counters import count_failure, dashboard
+from .risk import BLOCK, HOLD, score_transfer
+from .conditional import utc_today, wallet_conditional_get
+from .context import WalletContextMixin
+from .metrics import render_all
+from .authentication import CanReadMetrics, MetricsTokenAuthentication
 from authApi.utils import get_client_ip
 
 import logging
@@ -46,15 +58,14 @@ class TransactionPagination(PageNumberPagination):
         404: OpenApiTypes.OBJECT
     }
 )
-class WalletBalanceView(APIView):
+class WalletBalanceView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @wallet_conditional_get
     def get(self, request):
-        user = request.user
-
         try:
-            wallet = Wallet.objects.get(user=user)
-            serializer = WalletSerializer(wallet)
+            wallet = self.wallet_context.wallet
+            serializer = WalletSerializer(wallet, context=self.get_serializer_context())
 
             return Response({
                 'status': 'success',
@@ -110,16 +121,16 @@ class WalletBalanceView(APIView):
         )
     ]
 )
-class SendMoneyView(APIView):
+class SendMoneyView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        user = request.user
+        user = self.wallet_context.user
         serializer = SendMoneySerializer(data=request.data)
 
         if serializer.is_valid():
             try:
-                wallet = Wallet.objects.get(user=user)
+                wallet = self.wallet_context.wallet
                 recipient = serializer.validated_data['recipient']
                 amount = serializer.validated_data['amount']
                 narration = serializer.validated_data.get('narration', '')
@@ -132,6 +143,21 @@ class SendMoneyView(APIView):
                         'message': 'Cannot send money to yourself'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
+                # Score the transfer before any money moves
+                risk = score_transfer(user.id, recipient.id, amount)
+                if risk.action == BLOCK:
+                    count_failure(user.id)
+                    return Response({
+                        'status': 'error',
+                        'message': 'This transfer could not be completed. Please contact support.'
+                    }, status=status.HTTP_403_FORBIDDEN)
+                if risk.action == HOLD and not transaction_pin:
+                    return Response({
+                        'status': 'error',
+                        'message': 'Please confirm this transfer with your transaction PIN',
+                        'data': {'pin_required': True}
+                    }, status=status.HTTP_403_FORBIDDEN)
+
                 # Verify transaction PIN if provided
                 if transaction_pin:
                     pin_valid, pin_message = verify_transaction_pin(user, transaction_pin)
@@ -148,7 +174,9 @@ class SendMoneyView(APIView):
                     'status': 'success',
                     'message': 'Money sent successfully',
                     'data': {
-                        'transaction': TransactionSerializer(result['debit_transaction']).data,
+                        'transaction': TransactionSerializer(
+                            result['debit_transaction'], context=self.get_serializer_context()
+                        ).data,
                         'new_balance': str(result['sender_balance']),
                         'recipient': recipient.phone_number
                     }
@@ -161,6 +189,7 @@ class SendMoneyView(APIView):
                 }, status=status.HTTP_404_NOT_FOUND)
 
             except ValueError as e:
+                count_failure(request.user.pk)
                 return Response({
                     'status': 'error',
                     'message': str(e)
@@ -168,6 +197,7 @@ class SendMoneyView(APIView):
 
             except Exception as e:
                 logger.error(f"Transfer error: {str(e)}")
+                count_failure(request.user.pk)
                 return Response({
                     'status': 'error',
                     'message': 'Transaction failed. Please try again.'
@@ -180,16 +210,15 @@ class SendMoneyView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AddMoneyView(APIView):
+class AddMoneyView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        user = request.user
         serializer = AddMoneySerializer(data=request.data)
 
         if serializer.is_valid():
             try:
-                wallet = Wallet.objects.get(user=user)
+                wallet = self.wallet_context.wallet
                 amount = serializer.validated_data['amount']
                 payment_method = serializer.validated_data['payment_method']
                 description = serializer.validated_data.get('description', '')
@@ -201,7 +230,9 @@ class AddMoneyView(APIView):
                     'status': 'success',
                     'message': 'Money added successfully',
                     'data': {
-                        'transaction': TransactionSerializer(result['transaction']).data,
+                        'transaction': TransactionSerializer(
+                            result['transaction'], context=self.get_serializer_context()
+                        ).data,
                         'new_balance': str(result['new_balance'])
                     }
                 }, status=status.HTTP_200_OK)
@@ -214,6 +245,7 @@ class AddMoneyView(APIView):
 
             except Exception as e:
                 logger.error(f"Add money error: {str(e)}")
+                count_failure(request.user.pk)
                 return Response({
                     'status': 'error',
                     'message': 'Failed to add money. Please try again.'
@@ -226,16 +258,16 @@ class AddMoneyView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BillPaymentView(APIView):
+class BillPaymentView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        user = request.user
+        user = self.wallet_context.user
         serializer = BillPaymentSerializer(data=request.data)
 
         if serializer.is_valid():
             try:
-                wallet = Wallet.objects.get(user=user)
+                wallet = self.wallet_context.wallet
                 bill_type = serializer.validated_data['bill_type']
                 amount = serializer.validated_data['amount']
                 transaction_pin = serializer.validated_data.get('transaction_pin')
@@ -263,7 +295,9 @@ class BillPaymentView(APIView):
                     'status': 'success',
                     'message': f'{bill_type.replace("_", " ").title()} payment successful',
                     'data': {
-                        'transaction': TransactionSerializer(result['transaction']).data,
+                        'transaction': TransactionSerializer(
+                            result['transaction'], context=self.get_serializer_context()
+                        ).data,
                         'new_balance': str(result['new_balance'])
                     }
                 }, status=status.HTTP_200_OK)
@@ -275,6 +309,7 @@ class BillPaymentView(APIView):
                 }, status=status.HTTP_404_NOT_FOUND)
 
             except ValueError as e:
+                count_failure(request.user.pk)
                 return Response({
                     'status': 'error',
                     'message': str(e)
@@ -282,6 +317,7 @@ class BillPaymentView(APIView):
 
             except Exception as e:
                 logger.error(f"Bill payment error: {str(e)}")
+                count_failure(request.user.pk)
                 return Response({
                     'status': 'error',
                     'message': 'Bill payment failed. Please try again.'
@@ -294,17 +330,21 @@ class BillPaymentView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TransactionHistoryView(generics.ListAPIView):
+class TransactionHistoryView(WalletContextMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TransactionSerializer
     pagination_class = TransactionPagination
 
-    def get_queryset(self):
-        user = self.request.user
+    @wallet_conditional_get
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
+    def get_queryset(self):
         try:
-            wallet = Wallet.objects.get(user=user)
-            queryset = Transaction.objects.filter(wallet=wallet).order_by('-created_at')
+            wallet = self.wallet_context.wallet
+            queryset = Transaction.objects.filter(wallet=wallet).select_related(
+                'sender', 'recipient'
+            ).order_by('-created_at')
 
             # Filter by transaction type
             transaction_type = self.request.query_params.get('type')
@@ -331,23 +371,23 @@ class TransactionHistoryView(generics.ListAPIView):
             return Transaction.objects.none()
 
 
-class TransactionDetailView(APIView):
+class TransactionDetailView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, reference):
-        user = request.user
-
         try:
-            wallet = Wallet.objects.get(user=user)
-            transaction = Transaction.objects.get(reference=reference, wallet=wallet)
+            wallet = self.wallet_context.wallet
+            transaction = Transaction.objects.select_related('sender', 'recipient').get(
+                reference=reference, wallet=wallet
+            )
 
             return Response({
                 'status': 'success',
                 'message': 'Transaction details retrieved',
-                'data': TransactionSerializer(transaction).data
+                'data': TransactionSerializer(transaction, context=self.get_serializer_context()).data
             }, status=status.HTTP_200_OK)
 
-        except Transaction.DoesNotExist:
+        except (Wallet.DoesNotExist, Transaction.DoesNotExist):
             return Response({
                 'status': 'error',
                 'message': 'Transaction not found'
@@ -392,7 +432,9 @@ class BeneficiaryListView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = BeneficiaryContact.objects.filter(user=user).order_by('-last_transaction_at')
+        queryset = BeneficiaryContact.objects.filter(user=user).select_related(
+            'beneficiary'
+        ).order_by('-last_transaction_at')
 
         # Filter favorites only
         if self.request.query_params.get('favorites') == 'true':
@@ -451,129 +493,192 @@ class AddBeneficiaryView(APIView):
             name='days',
             type=OpenApiTypes.INT,
             location=OpenApiParameter.QUERY,
-            description='Number of days to analyze (default: 7)',
+            description='Number of days to analyze (default: 7, at most ANALYTICS_MAX_DAYS). '
+                        'daily_data lists daily rows up to ANALYTICS_DAILY_DATA_MAX_DAYS, then weekly rows '
+                        'up to 7 times that, then monthly rows; daily_data_period says which.',
             required=False
         )
     ],
     responses={200: OpenApiTypes.OBJECT}
 )
-class AnalyticsView(APIView):
+class AnalyticsView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
+        user = self.wallet_context.user
 
         # Get date range (default: last 7 days)
-        days = int(request.query_params.get('days', 7))
-        end_date = timezone.now().date()
+        try:
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= settings.ANALYTICS_MAX_DAYS:
+            return Response({
+                'status': 'error',
+                'message': f'days must be a whole number from 1 to {settings.ANALYTICS_MAX_DAYS}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        end_date = utc_today()
         start_date = end_date - timezone.timedelta(days=days)
 
-        analytics = TransactionAnalytics.objects.filter(
-            user=user,
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('date')
+        # Totals come from the fewest daily and rollup rows covering the range
+        totals = summarize_range(user.id, start_date, end_date)
+
+        data = {
+            'period': f'Last {days} days',
+            'summary': {
+                'total_credits': totals['total_credits'],
+                'total_debits': totals['total_debits'],
+                'total_transactions': totals['total_transactions'],
+                'current_balance': str(get_user_balance(user))
+            }
+        }
+
+        max_daily_days = settings.ANALYTICS_DAILY_DATA_MAX_DAYS
+        if days <= max_daily_days:
+            analytics = TransactionAnalytics.objects.filter(
+                user=user,
+                date__gte=start_date,
+                date__lte=end_date
+            ).order_by('date')
+            data['daily_data'] = TransactionAnalyticsSerializer(analytics, many=True).data
+            data['daily_data_period'] = PERIOD_DAY
+        else:
+            # Longer ranges list weekly, then monthly rollups, keeping the list short
+            period = PERIOD_WEEK if days <= max_daily_days * 7 else PERIOD_MONTH
+            rollups = TransactionAnalyticsRollup.objects.filter(
+                user=user,
+                period=period,
+                period_start__gte=period_start(period, start_date),
+                period_start__lte=end_date
+            ).order_by('period_start')
+            data['daily_data'] = TransactionAnalyticsRollupSerializer(rollups, many=True).data
+            data['daily_data_period'] = period
 
         return Response({
             'status': 'success',
             'message': 'Analytics retrieved',
-            'data': {
-                'period': f'Last {days} days',
-                'daily_data': TransactionAnalyticsSerializer(analytics, many=True).data,
-                'summary': {
-                    'total_credits': sum(a.total_credits for a in analytics),
-                    'total_debits': sum(a.total_debits for a in analytics),
-                    'total_transactions': sum(a.total_transactions for a in analytics),
-                    'current_balance': str(get_user_balance(user))
-                }
-            }
+            'data': data
         }, status=status.HTTP_200_OK)
 
 
 @extend_schema(
-    tags=['AI Support'],
-    summary='Chat with AI Customer Service',
-    description='''
-    Interact with the AI-powered customer service chatbot.
-
-    **Features:**
-    - Context-aware responses (knows your balance, transactions)
-    - GPT-4 powered (with fallback to mock responses)
-    - Session continuity
-    - Sentiment analysis
-    - Auto-escalation to human support
-
-    **Topics the AI can help with:**
-    - How to send money
-    - Check balance
-    - Transaction issues
-    - Account settings
-    - App features and usage
-    ''',
-    request=ChatRequestSerializer,
-    responses={200: OpenApiTypes.OBJECT},
-    examples=[
-        OpenApiExample(
-            'Start new conversation',
-            value={
-                "message": "How do I send money to someone?"
-            }
+    tags=['Analytics'],
+    summary='Get Balance and Volume Time Series',
+    description='Balance and credit/debit volume per UTC hour, day, week or month over a date range, '
+                'downsampled to at most max_points points.',
+    parameters=[
+        OpenApiParameter(
+            name='resolution',
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            enum=list(RESOLUTIONS),
+            description='Bucket size (default: day). Hour ranges are limited to TIMESERIES_MAX_HOUR_DAYS.',
+            required=False
         ),
-        OpenApiExample(
-            'Continue existing conversation',
-            value={
-                "message": "What are the transaction limits?",
-                "session_id": "CS-20241126-ABC12345"
-            }
+        OpenApiParameter(
+            name='start',
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            description='First day, inclusive (default depends on the resolution)',
+            required=False
+        ),
+        OpenApiParameter(
+            name='end',
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            description='Last day, inclusive (default: today, UTC)',
+            required=False
+        ),
+        OpenApiParameter(
+            name='max_points',
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description='Most points to return, 2 to TIMESERIES_MAX_POINTS (default: TIMESERIES_MAX_POINTS)',
+            required=False
         )
-    ]
+    ],
+    responses={200: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT}
 )
-class CustomerServiceChatView(APIView):
+class TimeSeriesView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request):
-        user = request.user
-        serializer = ChatRequestSerializer(data=request.data)
+    def error(self, message):
+        return Response({
+            'status': 'error',
+            'message': message
+        }, status=status.HTTP_400_BAD_REQUEST)
 
-        if serializer.is_valid():
-            message = serializer.validated_data['message']
-            session_id = serializer.validated_data.get('session_id')
-
-            # Get or create chat session
-            chat_session = None
-            if session_id:
-                try:
-                    chat_session = CustomerServiceChat.objects.get(
-                        session_id=session_id,
-                        user=user
-                    )
-                except CustomerServiceChat.DoesNotExist:
-                    pass
-
-            # Generate AI response
-            result = generate_ai_response(user, message, chat_session)
-
-            # Update issue category if new session
-            if not session_id and result.get('session_id'):
-                try:
-                    chat = CustomerServiceChat.objects.get(session_id=result['session_id'])
-                    chat.issue_category = detect_issue_category(message)
-                    chat.sentiment_score = analyze_sentiment(message)
-                    chat.save()
-                except:
-                    pass
+    @wallet_conditional_get
+    def get(self, request):
+        resolution = request.query_params.get('resolution', 'day')
+        if resolution not in RESOLUTIONS:
+            return self.error(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+        try:
+            end = request.query_params.get('end')
+            end = date.fromisoformat(end) if end else utc_today()
+            start = request.query_params.get('start')
+            start = date.fromisoformat(start) if start else end - timedelta(days=DEFAULT_SPAN_DAYS[resolution] - 1)
+        except ValueError:
+            return self.error('start and end must be dates (YYYY-MM-DD)')
+
+        days = (end - start).days + 1
+        if days < 1:
+            return self.error('start must not be after end')
+        longest = settings.TIMESERIES_MAX_HOUR_DAYS if resolution == RESOLUTION_HOUR else settings.ANALYTICS_MAX_DAYS
+        if days > longest:
+            return self.error(f'{resolution} series may cover at most {longest} days')
+
+        try:
+            max_points = int(request.query_params.get('max_points', settings.TIMESERIES_MAX_POINTS))
+        except ValueError:
+            max_points = 0
+        if not 2 <= max_points <= settings.TIMESERIES_MAX_POINTS:
+            return self.error(f'max_points must be a whole number from 2 to {settings.TIMESERIES_MAX_POINTS}')
 
+        try:
+            wallet = self.wallet_context.wallet
+        except Wallet.DoesNotExist:
             return Response({
-                'status': 'success',
-                'message': 'Response generated',
-                'data': result
-            }, status=status.HTTP_200_OK)
+                'status': 'error',
+                'message': 'Wallet not found'
+            }, status=status.HTTP_404_NOT_FOUND)
 
         return Response({
-            'status': 'error',
-            'message': 'Validation failed',
-            'errors': serializer.errors
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'status': 'success',
+            'message': 'Time series retrieved',
+            'data': build_series(wallet, resolution, start, end, max_points)
+        }, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=['Analytics'],
+    summary='Get Spending Insights',
+    description='Spending patterns over the last INSIGHTS_HISTORY_DAYS days: category breakdown, '
+                'weekday and hour histograms, daily spend with moving averages, month-over-month '
+                'changes and detected recurring payments.',
+    responses={200: OpenApiTypes.OBJECT, 404: OpenApiTypes.OBJECT}
+)
+class SpendingInsightsView(WalletContextMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    # Insights are computed in local days
+    @wallet_conditional_get(today=timezone.localdate)
+    def get(self, request):
+        try:
+            wallet = self.wallet_context.wallet
+        except Wallet.DoesNotExist:
+            return Response({
+                'status': 'error',
+                'message': 'Wallet not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'status': 'success',
+            'message': 'Spending insights retrieved',
+            'data': get_wallet_insights(wallet)
+        }, status=status.HTTP_200_OK)
 
 
 class ChatHistoryView(generics.ListAPIView):
@@ -582,7 +687,9 @@ class ChatHistoryView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return CustomerServiceChat.objects.filter(user=user).order_by('-started_at')
+        return CustomerServiceChat.objects.filter(user=user).select_related(
+            'user'
+        ).prefetch_related('messages').order_by('-started_at')
 
 
 @extend_schema(
@@ -602,22 +709,23 @@ class ChatHistoryView(generics.ListAPIView):
         404: OpenApiTypes.OBJECT
     }
 )
-class DashboardSummaryView(APIView):
+class DashboardSummaryView(WalletContextMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @wallet_conditional_get
     def get(self, request):
-        user = request.user
+        user = self.wallet_context.user
 
         try:
-            wallet = Wallet.objects.get(user=user)
+            wallet = self.wallet_context.wallet
 
             # Get recent transactions
             recent_transactions = Transaction.objects.filter(
                 wallet=wallet
-            ).order_by('-created_at')[:5]
+            ).select_related('sender', 'recipient').order_by('-created_at')[:5]
 
             # Get today's analytics
-            today = timezone.now().date()
+            today = utc_today()
             today_analytics = TransactionAnalytics.objects.filter(
                 user=user,
                 date=today
@@ -627,8 +735,10 @@ class DashboardSummaryView(APIView):
                 'status': 'success',
                 'message': 'Dashboard summary retrieved',
                 'data': {
-                    'wallet': WalletSerializer(wallet).data,
-                    'recent_transactions': TransactionSerializer(recent_transactions, many=True).data,
+                    'wallet': WalletSerializer(wallet, context=self.get_serializer_context()).data,
+                    'recent_transactions': TransactionSerializer(
+                        recent_transactions, many=True, context=self.get_serializer_context()
+                    ).data,
                 'today_summary': {
                         'total_sent': str(today_analytics.total_debits) if today_analytics else '0.00',
                         'total_received': str(today_analytics.total_credits) if today_analytics else '0.00',
@@ -648,3 +758,111 @@ class DashboardSummaryView(APIView):
                 'status': 'error',
                 'message': 'Wallet not found'
             }, status=status.HTTP_404_NOT_FOUND)
+
+
+@extend_schema(
+    tags=['Customer Service AI'],
+    summary='Escalation Queue',
+    description='Queue depth and wait time, and the tickets claimed by the requesting agent. Staff only.',
+    responses={200: OpenApiTypes.OBJECT}
+)
+class EscalationQueueView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        tickets = EscalationTicket.objects.filter(
+            claimed_by=request.user, status='claimed'
+        ).select_related('chat', 'user').order_by('claimed_at')
+
+        return Response({
+            'status': 'success',
+            'message': 'Escalation queue retrieved',
+            'data': {
+                'queue': queue_stats(),
+                'claimed': EscalationTicketSerializer(tickets, many=True).data
+            }
+        }, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=['Customer Service AI'],
+    summary='Claim Next Escalation',
+    description='Assign the most urgent queued escalation to the requesting agent. Staff only.',
+    request=None,
+    responses={200: EscalationTicketSerializer}
+)
+class ClaimEscalationView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        ticket = claim_next(request.user)
+        if ticket is None:
+            return Response({
+                'status': 'success',
+                'message': 'No escalations waiting',
+                'data': None
+            }, status=status.HTTP_200_OK)
+
+        return Response({
+            'status': 'success',
+            'message': 'Escalation claimed',
+            'data': EscalationTicketSerializer(ticket).data
+        }, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=['Customer Service AI'],
+    summary='Resolve Escalation',
+    description='Close an escalation claimed by the requesting agent and mark its chat resolved. Staff only.',
+    request=OpenApiTypes.OBJECT,
+    responses={200: EscalationTicketSerializer}
+)
+class ResolveEscalationView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, ticket_id):
+        ticket = EscalationTicket.objects.filter(
+            pk=ticket_id, claimed_by=request.user, status='claimed'
+        ).select_related('chat', 'user').first()
+
+        if ticket is None:
+            return Response({
+                'status': 'error',
+                'message': 'No claimed escalation with this id'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        resolve_ticket(ticket, str(request.data.get('note', '')))
+
+        return Response({
+            'status': 'success',
+            'message': 'Escalation resolved',
+            'data': EscalationTicketSerializer(ticket).data
+        }, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=['Operations'],
+    summary='Operations Dashboard',
+    description='Platform volume, failure rate, new and active wallets and total float for the last hour, '
+                'day and month and all time, read from precomputed counters. Staff only.',
+    responses={200: OpenApiTypes.OBJECT}
+)
+class OpsDashboardView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'status': 'success',
+            'message': 'Dashboard retrieved',
+            'data': dashboard()
+        }, status=status.HTTP_200_OK)
+
+
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    """Metrics of every worker in the Prometheus text format, for staff or with METRICS_TOKEN"""
+    authentication_classes = [MetricsTokenAuthentication, *APIView.authentication_classes]
+    permission_classes = [CanReadMetrics]
+
+    def get(self, request):
+        return HttpResponse(render_all(), content_type='text/plain; version=0.0.4; charset=utf-8')
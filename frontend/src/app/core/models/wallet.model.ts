@@ -52,6 +52,7 @@ export interface Beneficiary {
 export interface Analytics {
   period: string;
   daily_data: any[];
+  daily_data_period: 'day' | 'week' | 'month';
   summary: {
     total_credits: string;
     total_debits: string;